@@ -1,21 +1,26 @@
 import os
-import time
 import json
 import math
-import requests
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timezone
 
+from first_touch import first_touch
+from market_client import get_client
+from watch_store import get_store, signal_tuple, REQUIRED_FIELDS, STATUS_FINALIZADO
+from hist_log import get_hist_log
+
 # =========================
 # Config
 # =========================
-BINANCE_BASE = "https://api.binance.com"   # Spot
 INTERVAL = "1m"
 USER_AGENT = "LucraAuditor/2.0 (+https://lucra.local)"
 APP_DIR = os.path.dirname(__file__)
-WATCH_PATH = os.path.join(APP_DIR, "watchlist.json")
-HIST_PATH  = os.path.join(APP_DIR, "historico.json")
+HIST_VIEW_LIMIT = 500
+
+market = get_client(USER_AGENT)
+store = get_store()
+hist_log = get_hist_log()
 
 st.set_page_config(page_title="Lucra Auditor — Live", layout="wide")
 st.title("Lucra Auditor — Live Tracking (simples)")
@@ -34,35 +39,8 @@ def ms_to_iso(ms: int) -> str:
     return datetime.fromtimestamp(ms/1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
 def fetch_klines(symbol: str, start_ms: int, end_ms: int, interval: str = INTERVAL) -> pd.DataFrame:
-    rows, limit, cur = [], 1000, start_ms
-    headers = {"User-Agent": USER_AGENT}
-    while cur <= end_ms:
-        url = f"{BINANCE_BASE}/api/v3/klines"
-        params = {
-            "symbol": symbol.upper(),
-            "interval": interval,
-            "startTime": cur,
-            "endTime": min(end_ms, cur + (limit-1)*60_000),
-            "limit": limit,
-        }
-        r = requests.get(url, params=params, headers=headers, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        if not data: break
-        rows.extend(data)
-        cur = data[-1][6] + 1   # próximo após close_time
-        if len(data) < limit: break
-        time.sleep(0.03)        # respeitar rate limit
-    if not rows:
-        return pd.DataFrame(columns=["open_time","open","high","low","close","close_time"])
-    df = pd.DataFrame(rows, columns=[
-        "open_time","open","high","low","close","volume",
-        "close_time","qav","num_trades","taker_base","taker_quote","ignore"
-    ])
-    df = df[["open_time","open","high","low","close","close_time"]].copy()
-    for c in ["open","high","low","close"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-    return df
+    # candles fechados vêm do disco (data/klines); rede só para o que falta
+    return market.get_klines(symbol, start_ms, end_ms, interval)
 
 def eval_interval(symbol, side, entry, target, stop, start_ms, end_ms):
     """
@@ -73,23 +51,10 @@ def eval_interval(symbol, side, entry, target, stop, start_ms, end_ms):
     if df.empty:
         return dict(status="SEM DADOS", preco_ref=None, lucro_pct=None, bateu_alvo=None, bateu_stop=None)
 
-    # Caminho candle a candle: STOP tem prioridade se vem antes do ALVO (para BUY; inverso em SELL)
-    bateu_alvo = False
-    bateu_stop = False
-    preco_exec = None
-
-    for _, r in df.iterrows():
-        h, l = r["high"], r["low"]
-        if side == "BUY":
-            if l <= stop:
-                preco_exec = stop; bateu_stop = True; break
-            if h >= target:
-                preco_exec = target; bateu_alvo = True; break
-        else:  # SELL
-            if h >= stop:
-                preco_exec = stop; bateu_stop = True; break
-            if l <= target:
-                preco_exec = target; bateu_alvo = True; break
+    # Caminho candle a candle (vetorizado): STOP tem prioridade se vem antes do ALVO (para BUY; inverso em SELL)
+    t = first_touch(df["high"].to_numpy(float), df["low"].to_numpy(float), side, target=target, stop=stop)
+    bateu_alvo, bateu_stop = t.hit_target, t.hit_stop
+    preco_exec = stop if bateu_stop else (target if bateu_alvo else None)
 
     # Se atingiu alvo/stop no caminho:
     if preco_exec is not None:
@@ -119,19 +84,6 @@ def eval_interval(symbol, side, entry, target, stop, start_ms, end_ms):
         bateu_stop=False
     )
 
-# =========================
-# Storage
-# =========================
-def load_json(path, default):
-    if not os.path.isfile(path): return default
-    try:
-        with open(path, "r", encoding="utf-8") as f: return json.load(f)
-    except: return default
-
-def save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
 # =========================
 # Sidebar — Controles
 # =========================
@@ -148,8 +100,7 @@ with st.sidebar:
 # =========================
 # Watchlist
 # =========================
-watch = load_json(WATCH_PATH, [])  # lista de sinais
-hist  = load_json(HIST_PATH,  [])
+watch = store.active()  # lista de sinais (data/watchlist.db)
 
 # Adicionar novos sinais ao watchlist
 if add_btn:
@@ -161,18 +112,9 @@ if add_btn:
             if not isinstance(data, list):
                 st.sidebar.error("JSON deve ser uma lista de sinais.")
             else:
-                # validação mínima e merge
-                required = {"symbol","side","entry","target","stop_loss","entrada_datahora","saida_datahora"}
-                added = 0
-                for s in data:
-                    if not required.issubset(s.keys()):
-                        continue
-                    s["symbol"] = s["symbol"].upper()
-                    # dedupe simples: symbol + entrada + saída
-                    key = (s["symbol"], s["entrada_datahora"], s["saida_datahora"])
-                    if not any((w.get("symbol"), w.get("entrada_datahora"), w.get("saida_datahora")) == key for w in watch):
-                        watch.append(s); added += 1
-                save_json(WATCH_PATH, watch)
+                # validação mínima; dedupe (symbol + entrada + saída) pelo índice único do store
+                added = store.add_signals(s for s in data if isinstance(s, dict) and REQUIRED_FIELDS.issubset(s.keys()))
+                watch = store.active()
                 st.sidebar.success(f"{added} sinal(is) adicionados ao Watchlist.")
         except Exception as e:
             st.sidebar.error(f"Erro no JSON: {e}")
@@ -276,22 +218,20 @@ else:
 
     # Arquivar fechados por tempo (remove do watchlist)
     if closed_to_archive:
-        hist.extend(closed_to_archive)
-        save_json(HIST_PATH, hist)
+        hist_log.append(closed_to_archive)
         # remove do watchlist
-        keys_to_remove = {(x["symbol"], x["entrada_datahora"], x["saida_datahora"]) for x in closed_to_archive}
-        watch = [w for w in watch if (w["symbol"], w["entrada_datahora"], w["saida_datahora"]) not in keys_to_remove]
-        save_json(WATCH_PATH, watch)
+        store.close({signal_tuple(x) for x in closed_to_archive}, STATUS_FINALIZADO)
         st.success(f"{len(closed_to_archive)} trade(s) fechados por tempo e enviados ao histórico.")
 
 # =========================
 # Histórico (somente leitura)
 # =========================
 st.subheader("Histórico")
-if not hist:
+hist_total = hist_log.count()
+if not hist_total:
     st.caption("Vazio por enquanto.")
 else:
-    dfh = pd.DataFrame(hist)
+    dfh = pd.DataFrame(hist_log.recent(HIST_VIEW_LIMIT))
     # colunas padrão se existirem
     cols = [c for c in [
         "symbol","side","status_final","preco_saida","lucro_pct",
@@ -299,9 +239,13 @@ else:
     ] if c in dfh.columns]
     st.dataframe(dfh[cols].sort_values("fechado_em", ascending=False), use_container_width=True)
 
-    st.download_button(
-        "Baixar Histórico (CSV)",
-        data=dfh.to_csv(index=False).encode("utf-8"),
-        file_name="historico.csv",
-        mime="text/csv"
-    )
+    if hist_total > len(dfh):
+        st.caption(f"Mostrando os {len(dfh)} mais recentes de {hist_total}.")
+
+    if st.button("Preparar histórico completo (CSV)"):
+        st.download_button(
+            "Baixar Histórico (CSV)",
+            data=pd.DataFrame(hist_log.load_all()).to_csv(index=False).encode("utf-8"),
+            file_name="historico.csv",
+            mime="text/csv"
+        )
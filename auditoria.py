@@ -1,19 +1,44 @@
-import requests
+import numpy as np
 import pandas as pd
 import json
 from datetime import datetime
 import sys
 
-def get_historical_price(symbol, date_str):
+from market_client import get_client
+
+market = get_client("LucraAuditoria/1.0 (+https://lucra.local)")
+HOUR_MS = 3600 * 1000
+
+def _ts_ms(date_str):
     dt = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-    timestamp = int(dt.timestamp()) * 1000
-    url = f"https://api.binance.com/api/v3/klines?symbol={symbol.upper()}&interval=1h&startTime={timestamp}&endTime={timestamp + 3600*1000}"
-    resp = requests.get(url)
-    data = resp.json()
-    if data and isinstance(data, list):
-        close_price = float(data[0][4])  # Preço de fechamento da vela
-        return close_price
-    return None
+    return int(dt.timestamp()) * 1000
+
+def get_historical_prices(signals):
+    """
+    Fechamento da vela de 1h que começa em saida_datahora, para todos os sinais.
+    Uma busca de klines (1h) por símbolo cobrindo todas as saídas dele, em vez de
+    um request por sinal. Retorna {(symbol, saida_datahora): preço}.
+    """
+    by_symbol = {}
+    for sig in signals:
+        if sig.get('saida_datahora'):
+            by_symbol.setdefault(sig['symbol'].upper(), set()).add(sig['saida_datahora'])
+
+    prices = {}
+    for symbol, dates in by_symbol.items():
+        ts = {d: _ts_ms(d) for d in dates}
+        try:
+            df = market.get_klines(symbol, min(ts.values()), max(ts.values()) + HOUR_MS, "1h")
+        except Exception as e:
+            print(f"Erro ao buscar klines de {symbol}: {e}")
+            continue
+        open_t = df["open_time"].to_numpy(np.int64)
+        close = df["close"].to_numpy(float)
+        for d, t in ts.items():
+            i = int(np.searchsorted(open_t, t, side="left"))
+            if i < len(open_t) and open_t[i] <= t + HOUR_MS:
+                prices[(symbol, d)] = float(close[i])  # Preço de fechamento da vela
+    return prices
 
 if len(sys.argv) < 2:
     print("Uso: python auditoria.py sinais-2025-08-08.json")
@@ -24,6 +49,8 @@ sinais_arquivo = sys.argv[1]
 with open(sinais_arquivo, 'r') as f:
     signals = json.load(f)
 
+historical_prices = get_historical_prices(signals)
+
 results = []
 
 for signal in signals:
@@ -38,7 +65,7 @@ for signal in signals:
         print(f"Sinal {symbol} está sem 'saida_datahora', pulei.")
         continue
 
-    final_price = get_historical_price(symbol, saida_datahora)
+    final_price = historical_prices.get((symbol.upper(), saida_datahora))
 
     if final_price:
         if side.upper() == "BUY":
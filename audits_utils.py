@@ -1,13 +1,36 @@
 # audits_utils.py
-import os, json
+import os, re, glob, json, gzip, time, shutil, atexit, hashlib, threading
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from hist_log import FileLock
 
 APP_VERSION = "live-1.3"   # atualize quando mexer em lógica relevante
 AUDIT_DIRNAME = "audits"
 AUDITS_FILENAME = "audits.jsonl"
 FAILURES_FILENAME = "failures.jsonl"
 
+# Escrita em lote: o loop só enfileira; uma thread grava a cada AUDIT_FLUSH_S (ou antes,
+# com AUDIT_FLUSH_MAX pendentes) e no exit do processo.
+AUDIT_FLUSH_S = 2.0
+AUDIT_FLUSH_MAX = 500
+# Partição por dia (UTC do ts do registro): audits/YYYY-MM-DD/{audits,failures}.jsonl.
+# Dentro do dia, o arquivo ativo vira segmento .NNN.jsonl.gz ao passar do tamanho; quando
+# o dia vira, o que sobrou ativo é comprimido também.
+AUDIT_ROTATE_BYTES = 16 * 1024 * 1024
+# Orçamento total das partições; acima disso os dias mais antigos são apagados inteiros.
+AUDIT_KEEP_BYTES = 256 * 1024 * 1024
+
+# Emissão por mudança: um LIVE só sai quando o estado muda, o PnL anda AUDIT_PNL_STEP
+# pontos percentuais desde o último emitido, ou a cada AUDIT_HEARTBEAT_S sem mudança.
+AUDIT_PNL_STEP = 0.5
+AUDIT_HEARTBEAT_S = 900
+# Falhas repetidas viram um registro por fingerprint (first_seen/last_seen/count),
+# regravado com a contagem nova no máximo a cada FAIL_REEMIT_S.
+FAIL_REEMIT_S = 600
+# Estado de emissão sem atualização há mais que isso é descartado da memória.
+AUDIT_STATE_TTL_S = 24 * 3600
+
 # Códigos padronizados
 E_NUM       = "E_NUM"        # campo numérico inválido
 E_SIDE      = "E_SIDE"       # side inválido/fora de BUY|SELL
@@ -31,16 +54,434 @@ def _ensure_paths(app_dir: str) -> Dict[str, str]:
 def _utc_now() -> str:
     return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
 
-def audit_log(app_dir: str, record: Dict[str, Any], failure_only: bool=False) -> None:
+# =========================
+# Partições por dia
+# =========================
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_FILENAMES = {"audits": AUDITS_FILENAME, "fails": FAILURES_FILENAME}
+_migrate_guard = threading.Lock()
+
+def _record_day(record: Dict[str, Any], default: Optional[str] = None) -> str:
+    ts = record.get("ts")
+    if isinstance(ts, str) and _DAY_RE.match(ts[:10]):
+        return ts[:10]
+    return default or datetime.utcnow().strftime("%Y-%m-%d")
+
+def _partition_days(audit_dir: str) -> List[str]:
+    try:
+        names = os.listdir(audit_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(n for n in names if _DAY_RE.match(n) and os.path.isdir(os.path.join(audit_dir, n)))
+
+def _active_path(audit_dir: str, day: str, kind: str) -> str:
+    return os.path.join(audit_dir, day, _FILENAMES[kind])
+
+def _partition_files(audit_dir: str, day: str, kind: str) -> List[str]:
+    """Segmentos comprimidos do dia, em ordem, seguidos do arquivo ativo."""
+    active = _active_path(audit_dir, day, kind)
+    base = active[:-len(".jsonl")]
+    return sorted(glob.glob(base + ".*.jsonl.gz")) + ([active] if os.path.isfile(active) else [])
+
+def _compress_active(path: str) -> None:
+    base = path[:-len(".jsonl")]
+    seq = 1
+    while os.path.exists(f"{base}.{seq:03d}.jsonl.gz"):
+        seq += 1
+    closed = f"{base}.{seq:03d}.jsonl"
+    os.replace(path, closed)
+    with open(closed, "rb") as src, gzip.open(closed + ".gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(closed)
+
+def _iter_lines(path: str, gz: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if (path.endswith(".gz") if gz is None else gz) else open
+    try:
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except Exception:
+                    continue   # linha truncada
+    except (FileNotFoundError, EOFError, OSError):
+        return
+
+def migrate_flat_audits(audit_dir: str) -> int:
+    """Move o layout antigo (audits.jsonl/failures.jsonl na raiz de audits/, mais os .gz
+    rotacionados) para as partições por dia. Roda uma vez; retorna quantas linhas moveu."""
+    moved = 0
+    with _migrate_guard:
+        try:
+            names = sorted(os.listdir(audit_dir))
+        except FileNotFoundError:
+            return 0
+        for kind, fname in _FILENAMES.items():
+            base = fname[:-len(".jsonl")]
+            flat = [n for n in names if n.startswith(base + ".") and n.endswith(".jsonl.gz")]
+            if fname in names:
+                flat.append(fname)   # o ativo é o mais novo
+            for n in flat:
+                src = os.path.join(audit_dir, n)
+                work = f"{src}.{os.getpid()}.migrating"
+                try:
+                    os.replace(src, work)   # outro processo pode estar migrando o mesmo arquivo
+                except OSError:
+                    continue
+                fallback = datetime.utcfromtimestamp(os.path.getmtime(work)).strftime("%Y-%m-%d")
+                out: Dict[str, List[str]] = {}
+                for rec in _iter_lines(work, gz=n.endswith(".gz")):
+                    day = _record_day(rec, fallback)
+                    out.setdefault(day, []).append(json.dumps(rec, ensure_ascii=False) + "\n")
+                for day, lines in out.items():
+                    dst = _active_path(audit_dir, day, kind)
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    with open(dst, "a", encoding="utf-8") as f:
+                        f.write("".join(lines))
+                    moved += len(lines)
+                os.remove(work)
+    return moved
+
+# =========================
+# Métricas incrementais (audits/YYYY-MM-DD/metrics.json, um balde por hora)
+# =========================
+METRICS_FILENAME = "metrics.json"
+LOCK_FILENAME = ".lock"
+_metrics_guard = threading.Lock()
+
+def _dir_lock(audit_dir: str) -> FileLock:
+    # a página, o avaliador externo e o ingest por CLI escrevem no mesmo audits/: o
+    # read-modify-write do metrics.json (e a rotação dos arquivos) passa por este lock
+    return FileLock(os.path.join(audit_dir, LOCK_FILENAME))
+
+def _new_bucket() -> Dict[str, Any]:
+    return {"total": 0, "invalid": 0, "price": 0, "final": 0, "acc": 0, "errors": {}}
+
+def _bucket_add(hours: Dict[str, Dict[str, Any]], record: Dict[str, Any]) -> None:
+    """Soma um registro de audits ao balde da hora dele. Falha regravada (com count_delta)
+    não é amostra nova: só soma as ocorrências novas aos códigos de erro."""
+    ts = record.get("ts")
+    hour = ts[11:13] if isinstance(ts, str) and len(ts) >= 13 else "00"
+    b = hours.setdefault(hour, _new_bucket())
+    errors = record.get("validation", {}).get("errors", []) or []
+    delta = record.get("count_delta")
+    if delta is None:
+        b["total"] += 1
+        if errors:
+            b["invalid"] += 1
+        if record.get("market", {}).get("live_price") is not None:
+            b["price"] += 1
+        if record.get("verdict", {}).get("state") == "FINAL":
+            b["final"] += 1
+            if record.get("verdict", {}).get("result") == "ACERTOU":
+                b["acc"] += 1
+    w = 1 if delta is None else int(delta)
+    for e in errors:
+        b["errors"][e] = b["errors"].get(e, 0) + w
+
+def _bucket_merge(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+    for k in ("total", "invalid", "price", "final", "acc"):
+        dst[k] += src.get(k, 0)
+    for e, n in src.get("errors", {}).items():
+        dst["errors"][e] = dst["errors"].get(e, 0) + n
+
+def _metrics_path(audit_dir: str, day: str) -> str:
+    return os.path.join(audit_dir, day, METRICS_FILENAME)
+
+def _save_metrics(audit_dir: str, day: str, hours: Dict[str, Dict[str, Any]]) -> None:
+    path = _metrics_path(audit_dir, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "hours": hours}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _load_metrics(audit_dir: str, day: str) -> Dict[str, Dict[str, Any]]:
+    """Baldes do dia; sem metrics.json (dados antigos/migrados) reconstrói lendo a partição uma vez."""
+    try:
+        with open(_metrics_path(audit_dir, day), "r", encoding="utf-8") as f:
+            return json.load(f)["hours"]
+    except Exception:
+        pass
+    hours: Dict[str, Dict[str, Any]] = {}
+    for path in _partition_files(audit_dir, day, "audits"):
+        for rec in _iter_lines(path):
+            _bucket_add(hours, rec)
+    _save_metrics(audit_dir, day, hours)
+    return hours
+
+def _merge_metrics(audit_dir: str, day: str, delta: Dict[str, Dict[str, Any]]) -> None:
+    with _metrics_guard, _dir_lock(audit_dir):
+        hours = _load_metrics(audit_dir, day)
+        for hour, b in delta.items():
+            _bucket_merge(hours.setdefault(hour, _new_bucket()), b)
+        _save_metrics(audit_dir, day, hours)
+
+def audit_metrics(app_dir: str, since_ts: Optional[str] = None) -> Dict[str, Any]:
+    """Soma dos baldes por hora a partir de since_ts ('YYYY-MM-DDTHH...'; granularidade de
+    hora): total, invalid, price, final, acc e errors por código. Custo O(baldes)."""
     paths = _ensure_paths(app_dir)
-    path  = paths["fails"] if failure_only else paths["audits"]
+    migrate_flat_audits(paths["dir"])
+    flush_audits()
+    since_day, since_hour = (since_ts[:10], since_ts[11:13]) if since_ts else (None, None)
+    out = _new_bucket()
+    with _metrics_guard, _dir_lock(paths["dir"]):
+        for day in _partition_days(paths["dir"]):
+            if since_day and day < since_day:
+                continue
+            for hour, b in _load_metrics(paths["dir"], day).items():
+                if day == since_day and hour < since_hour:
+                    continue
+                _bucket_merge(out, b)
+    return out
+
+def iter_audits(app_dir: str, kind: str = "audits", since_day: Optional[str] = None,
+                until_day: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Registros de auditoria ("audits" ou "fails") dos dias [since_day, until_day]
+    ('YYYY-MM-DD'); partições fora da faixa nem são abertas."""
+    paths = _ensure_paths(app_dir)
+    migrate_flat_audits(paths["dir"])
+    for day in _partition_days(paths["dir"]):
+        if since_day and day < since_day:
+            continue
+        if until_day and day > until_day:
+            break
+        for path in _partition_files(paths["dir"], day, kind):
+            yield from _iter_lines(path)
+
+def audit_fingerprint(record: Dict[str, Any]) -> str:
+    """Identidade de uma falha: campos do sinal + códigos de erro (ordem não importa)."""
+    sig = record.get("signal", {}) or {}
+    errs = sorted(record.get("validation", {}).get("errors", []) or [])
+    raw = json.dumps([sig.get(k) for k in ("symbol", "side", "entry", "target", "stop_loss",
+                                           "entrada_datahora", "saida_datahora")] + errs,
+                     ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def _live_state(record: Dict[str, Any]) -> Tuple:
+    v = record.get("verdict", {}) or {}
+    return (v.get("state"), v.get("result"), tuple(record.get("validation", {}).get("errors", []) or []),
+            record.get("market", {}).get("live_price") is None)
+
+class AuditWriter:
+    """Buffer em memória + flush em lote, rotação por tamanho/dia e compressão dos segmentos."""
+
+    def __init__(self, app_dir: str):
+        self.paths = _ensure_paths(app_dir)
+        self._buf: Dict[Tuple[str, str], List[str]] = {}   # (tipo, dia) -> linhas
+        self._pending = 0
+        self._mbuf: Dict[str, Dict[str, Dict[str, Any]]] = {}   # dia -> hora -> contadores pendentes
+        self._sealed_day: Optional[str] = None
+        self._live: Dict[str, Dict[str, Any]] = {}   # key -> estado/PnL do último LIVE emitido
+        self._fails: Dict[str, Dict[str, Any]] = {}  # fingerprint -> registro colapsado
+        self._lock = threading.Lock()         # protege o buffer e o estado de emissão
+        self._io_lock = threading.Lock()      # um flush por vez
+        self._wake = threading.Event()
+        migrate_flat_audits(self.paths["dir"])
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, kind: str, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        day = _record_day(record)
+        with self._lock:
+            self._buf.setdefault((kind, day), []).append(line)
+            self._pending += 1
+            if kind == "audits":
+                _bucket_add(self._mbuf.setdefault(day, {}), record)
+            full = self._pending >= AUDIT_FLUSH_MAX
+        if full:
+            self._wake.set()
+
+    def live(self, key: str, record: Dict[str, Any]) -> bool:
+        """Grava o LIVE só se o estado mudou, o PnL andou o bastante ou venceu o heartbeat."""
+        now = time.time()
+        state = _live_state(record)
+        pnl = record.get("market", {}).get("pnl_pct_live")
+        with self._lock:
+            last = self._live.get(key)
+            if last is not None:
+                last["seen"] = now
+                moved = (pnl is not None and last["pnl"] is not None
+                         and abs(pnl - last["pnl"]) >= AUDIT_PNL_STEP)
+                if last["state"] == state and not moved and now - last["at"] < AUDIT_HEARTBEAT_S:
+                    return False
+            self._live[key] = {"state": state, "pnl": pnl, "at": now, "seen": now}
+        self.write("audits", record)
+        return True
+
+    def failure(self, record: Dict[str, Any]) -> bool:
+        """Falha colapsada por fingerprint: a primeira ocorrência sai na hora; as repetições
+        só somam count/last_seen e são regravadas no máximo a cada FAIL_REEMIT_S."""
+        now = time.time()
+        fp = audit_fingerprint(record)
+        with self._lock:
+            agg = self._fails.get(fp)
+            if agg is None:
+                agg = {**record, "fingerprint": fp, "first_seen": record["ts"],
+                       "last_seen": record["ts"], "count": 1,
+                       "_meta": {"emitted_at": now, "seen": now, "dirty": False, "emitted_count": 1}}
+                self._fails[fp] = agg
+                out = dict(agg)
+            else:
+                agg["last_seen"] = record["ts"]
+                agg["count"] += 1
+                agg["_meta"]["seen"] = now
+                agg["_meta"]["dirty"] = True
+                out = None
+        if out is None:
+            return False
+        self._emit_failure(out)
+        return True
+
+    def _emit_failure(self, agg: Dict[str, Any]) -> None:
+        rec = {k: v for k, v in agg.items() if k != "_meta"}
+        rec["ts"] = rec["last_seen"]
+        self.write("audits", rec)
+        self.write("fails", rec)
+
+    def _collect_failures(self, final: bool) -> None:
+        now = time.time()
+        due = []
+        with self._lock:
+            for fp, agg in list(self._fails.items()):
+                meta = agg["_meta"]
+                if meta["dirty"] and (final or now - meta["emitted_at"] >= FAIL_REEMIT_S):
+                    meta["dirty"] = False
+                    meta["emitted_at"] = now
+                    # regravação: count_delta = ocorrências novas desde a última (para as métricas)
+                    due.append({**agg, "count_delta": agg["count"] - meta["emitted_count"]})
+                    meta["emitted_count"] = agg["count"]
+                if not meta["dirty"] and now - meta["seen"] > AUDIT_STATE_TTL_S:
+                    del self._fails[fp]
+            for key in [k for k, v in self._live.items() if now - v["seen"] > AUDIT_STATE_TTL_S]:
+                del self._live[key]
+        for agg in due:
+            self._emit_failure(agg)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(AUDIT_FLUSH_S)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self, final: bool = False) -> None:
+        self._collect_failures(final)
+        with self._lock:
+            pending, self._buf, self._pending = self._buf, {}, 0
+            mpending, self._mbuf = self._mbuf, {}
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        with self._io_lock:
+            # métricas antes das linhas: um rebuild do dia não pode contar o lote duas vezes
+            for day, hours in mpending.items():
+                try:
+                    _merge_metrics(self.paths["dir"], day, hours)
+                except Exception:
+                    pass
+            if not pending and today == self._sealed_day:
+                return
+            # rotação/selagem de outro processo não pode renomear o ativo no meio do append
+            # nem escolher o mesmo .NNN: linhas, rotação, selagem e orçamento sob o lock do diretório
+            with _dir_lock(self.paths["dir"]):
+                rotated = False
+                for (kind, day), lines in sorted(pending.items(), key=lambda kv: kv[0][1]):
+                    path = _active_path(self.paths["dir"], day, kind)
+                    try:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        if os.path.isfile(path) and os.path.getsize(path) >= AUDIT_ROTATE_BYTES:
+                            _compress_active(path)
+                            rotated = True
+                    except Exception:
+                        pass   # rotação falhou: o lote vai para o ativo assim mesmo
+                    try:
+                        # registro atrasado num dia já fechado fica no ativo até a próxima virada
+                        with open(path, "a", encoding="utf-8") as f:
+                            f.write("".join(lines))
+                    except Exception:
+                        # manter silencioso para não quebrar UI
+                        pass
+                if rotated or today != self._sealed_day:
+                    try:
+                        self._seal_old_days(today)
+                        self._enforce_budget(today)
+                    except Exception:
+                        pass
+                    self._sealed_day = today
+
+    def _seal_old_days(self, today: str) -> None:
+        # dia que já virou: arquivo ativo da partição vira segmento comprimido
+        for day in _partition_days(self.paths["dir"]):
+            if day >= today:
+                break
+            for kind in ("audits", "fails"):
+                path = _active_path(self.paths["dir"], day, kind)
+                if os.path.isfile(path):
+                    _compress_active(path)
+
+    def _enforce_budget(self, today: str) -> None:
+        d = self.paths["dir"]
+        days = _partition_days(d)
+        sizes = {}
+        for day in days:
+            pdir = os.path.join(d, day)
+            sizes[day] = sum(os.path.getsize(os.path.join(pdir, n)) for n in os.listdir(pdir))
+        total = sum(sizes.values())
+        for day in days:   # apaga dias inteiros, do mais antigo; o dia corrente fica
+            if total <= AUDIT_KEEP_BYTES or day >= today:
+                break
+            shutil.rmtree(os.path.join(d, day), ignore_errors=True)
+            total -= sizes[day]
+
+
+_writers: Dict[str, AuditWriter] = {}
+_writers_guard = threading.Lock()
+
+
+def _writer_for(app_dir: str) -> AuditWriter:
+    key = os.path.abspath(app_dir)
+    with _writers_guard:
+        w = _writers.get(key)
+        if w is None:
+            w = _writers[key] = AuditWriter(app_dir)
+        return w
+
+
+def flush_audits(final: bool = False) -> None:
+    """Grava já tudo que está no buffer; com final=True inclui as contagens de falha
+    pendentes (é o que roda no exit do processo)."""
+    with _writers_guard:
+        writers = list(_writers.values())
+    for w in writers:
+        w.flush(final=final)
+
+
+atexit.register(flush_audits, final=True)
+
+
+def audit_log(app_dir: str, record: Dict[str, Any], failure_only: bool=False) -> None:
+    # só enfileira: o arquivo é escrito em lote pela thread do AuditWriter
     try:
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        _writer_for(app_dir).write("fails" if failure_only else "audits", record)
     except Exception:
         # manter silencioso para não quebrar UI
         pass
 
+def audit_live(app_dir: str, key: str, record: Dict[str, Any]) -> bool:
+    """LIVE por mudança (estado/PnL/heartbeat). Retorna se o registro foi emitido."""
+    try:
+        return _writer_for(app_dir).live(key, record)
+    except Exception:
+        return False
+
+def audit_failure(app_dir: str, record: Dict[str, Any]) -> bool:
+    """Falha deduplicada por fingerprint (vai para audits e failures). Retorna se emitiu agora."""
+    try:
+        return _writer_for(app_dir).failure(record)
+    except Exception:
+        return False
+
 def build_audit_record(
     app_dir: str,
     signal: Dict[str, Any],
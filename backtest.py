@@ -0,0 +1,321 @@
+# backtest.py
+# Backtest histórico dos arquivos de sinais (ex.: sinais/*.json), dependente do caminho.
+#
+# Mesma semântica do avaliador ao vivo (evaluator.py / first_touch.py):
+#   - entry: primeiro candle de 1m na janela [entrada_datahora, saida_datahora] que toca a entry
+#   - saída: primeiro candle SEGUINTE ao da entry que toca alvo ou stop (os dois no mesmo
+#     candle -> stop, a menos que o desempate em 1s/aggTrades do drill_down.py mostre o alvo
+#     antes); sem toque até saida_datahora -> TIMEOUT no último close da janela
+#   - datas dos arquivos em America/Sao_Paulo (evaluator.to_ms)
+#
+# Os sinais são agrupados por símbolo: cada tarefa do pool de processos lê as klines da
+# união das janelas do símbolo uma vez (store local primeiro, rede só para o que falta) e
+# avalia todos os sinais dele numa passada vetorizada (first_touch_batch). Sinais repetidos
+# em vários arquivos são avaliados uma vez só. Janelas longas (> 3 dias, ex.: sinais de 1 ano)
+# saem do grupo e descem pela pirâmide 1d -> 1h -> 1m (kline_pyramid.py) sinal a sinal.
+#
+# Exemplos:
+#   python backtest.py "sinais/*.json"
+#   python backtest.py sinais.json "sinais/lucra_veredito_*.json" --workers 8 --csv backtest.csv
+#   python backtest.py "sinais/*.json" --offline      # só o que já está em data/klines
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kline_store import read_stored
+from first_touch import first_touch_batch
+from drill_down import refine_exits, resolve_ambiguous
+from kline_pyramid import is_long, find_entry, find_exit, last_candle
+from symbol_universe import get_universe
+from rate_limit import LIMITER
+from evaluator import (
+    market, to_ms, validate_signal_numeric_side, clean_pct,
+    ST_ACERTOU, ST_ERROU, ST_TIMEOUT, ST_TIMEOUT_SEM, ST_INVALIDA,
+)
+
+INTERVAL = "1m"
+ST_SEM_DADOS = "SEM DADOS"
+ST_EM_ANDAMENTO = "EM ANDAMENTO"
+CLUSTER_GAP_MS = 6 * 3600 * 1000   # janelas mais próximas que isso dividem a mesma leitura
+SIGNAL_FIELDS = ["symbol", "side", "entry", "target", "stop_loss", "entrada_datahora", "saida_datahora"]
+
+
+# =========================
+# Leitura dos arquivos de sinais
+# =========================
+def read_signal_file(path: str) -> List[dict]:
+    """Lista de sinais do arquivo; aceita também objetos/listas soltos, concatenados ou
+    separados por vírgula (exports antigos cortados, sem os colchetes de abertura)."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    dec = json.JSONDecoder()
+    out: List[dict] = []
+    i = 0
+    while i < len(raw):
+        while i < len(raw) and (raw[i].isspace() or raw[i] in ",]}"):
+            i += 1
+        if i >= len(raw):
+            break
+        doc, i = dec.raw_decode(raw, i)
+        if isinstance(doc, dict):
+            doc = doc.get("sinais") or doc.get("signals") or [doc]
+        out += [s for s in doc if isinstance(s, dict)]
+    return out
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    files: List[str] = []
+    for p in patterns:
+        hits = sorted(glob.glob(p)) if glob.has_magic(p) else [p]
+        files += [h for h in hits if os.path.isfile(h) and h not in files]
+    return files
+
+
+def signal_id(s: dict) -> Tuple:
+    return tuple(str(s.get(k)) if k != "symbol" else (s.get(k) or "").upper() for k in SIGNAL_FIELDS)
+
+
+# =========================
+# Avaliação (roda nos processos do pool)
+# =========================
+def _init_worker(n_workers: int) -> None:
+    # cada processo tem o seu limitador: divide o orçamento de peso da Binance entre eles
+    share = 1.0 / max(1, n_workers)
+    LIMITER.capacity *= share
+    LIMITER.refill_per_s *= share
+    LIMITER.tokens = min(LIMITER.tokens, LIMITER.capacity)
+
+
+def _result(s: dict, status: str, **extra) -> dict:
+    return {**{k: s.get(k) for k in SIGNAL_FIELDS}, "status": status, "preco_saida": None,
+            "lucro_pct": None, "entrada_em_ms": None, "saida_em_ms": None, "detalhe": "", **extra}
+
+
+def evaluate_symbol(symbol: str, signals: List[dict], now_ms: int, offline: bool = False) -> List[dict]:
+    """Avalia todos os sinais de um símbolo sobre uma única leitura de klines."""
+    out: List[dict] = []
+    items = []
+    for s in signals:
+        ok, msg = validate_signal_numeric_side(s)
+        if not ok:
+            out.append(_result(s, ST_INVALIDA, detalhe=msg))
+            continue
+        start_ms, end_ms = to_ms(s["entrada_datahora"]), to_ms(s["saida_datahora"])
+        if end_ms > now_ms:
+            out.append(_result(s, ST_EM_ANDAMENTO, detalhe="janela ainda aberta"))
+            continue
+        if not offline and is_long(start_ms, end_ms):
+            out.append(_evaluate_long(symbol, s, start_ms, end_ms))
+            continue
+        items.append((s, start_ms, end_ms))
+    for cluster in window_clusters(items):
+        out += _evaluate_window(symbol, cluster, offline)
+    return out
+
+
+def _evaluate_long(symbol: str, s: dict, start_ms: int, end_ms: int) -> dict:
+    """Sinal de janela longa pela pirâmide 1d -> 1h -> 1m (kline_pyramid): mesmo veredito
+    de _evaluate_window, lendo em 1m só os buckets onde entry/alvo/stop podem ter tocado."""
+    side = (s["side"] or "").upper()
+    entry, target, stop = float(s["entry"]), float(s["target"]), float(s["stop_loss"])
+    fetch = market.get_klines
+    try:
+        last = last_candle(fetch, symbol, start_ms, end_ms)
+        if last is None:
+            return _result(s, ST_SEM_DADOS, detalhe="sem candles na janela")
+        hit = find_entry(fetch, symbol, entry, start_ms, end_ms)
+        if hit is None:
+            return _result(s, ST_TIMEOUT_SEM)
+        entrada_ms = int(hit[0]["close_time"].iat[hit[1]])
+        ex = find_exit(fetch, symbol, side, target, stop, entrada_ms, end_ms)
+    except Exception as e:
+        return _result(s, ST_SEM_DADOS, detalhe=str(e))
+    if ex is None:
+        status, preco, saida_ms = ST_TIMEOUT, float(last["close"]), int(last["close_time"])
+    else:
+        df, i, hit_stop = ex
+        if hit_stop:
+            hi, lo = float(df["high"].iat[i]), float(df["low"].iat[i])
+            if (hi >= target if side == "BUY" else lo <= target) and resolve_ambiguous(
+                    market, symbol, side == "BUY", target, stop, int(df["open_time"].iat[i])):
+                hit_stop = False
+        status, preco = (ST_ERROU, stop) if hit_stop else (ST_ACERTOU, target)
+        saida_ms = int(df["close_time"].iat[i])
+    lucro = (preco - entry) / entry * 100 if side == "BUY" else (entry - preco) / entry * 100
+    return _result(s, status, preco_saida=preco, lucro_pct=clean_pct(lucro),
+                   entrada_em_ms=entrada_ms, saida_em_ms=saida_ms)
+
+
+def window_clusters(items: List[Tuple[dict, int, int]], gap_ms: int = CLUSTER_GAP_MS) -> List[list]:
+    """Agrupa janelas que se sobrepõem ou ficam a menos de gap_ms: cada grupo é uma leitura
+    de klines (arquivos de meses diferentes não puxam o intervalo inteiro entre eles)."""
+    clusters: List[list] = []
+    hi = None
+    for it in sorted(items, key=lambda x: x[1]):
+        if hi is None or it[1] > hi + gap_ms:
+            clusters.append([])
+            hi = it[2]
+        clusters[-1].append(it)
+        hi = max(hi, it[2])
+    return clusters
+
+
+def _evaluate_window(symbol: str, items: List[Tuple[dict, int, int]], offline: bool) -> List[dict]:
+    out: List[dict] = []
+    lo_ms = min(a for _, a, _ in items)
+    hi_ms = max(b for _, _, b in items)
+    try:
+        df = read_stored(symbol, lo_ms, hi_ms, INTERVAL) if offline else market.get_klines(symbol, lo_ms, hi_ms, INTERVAL)
+    except Exception as e:
+        return [_result(s, ST_SEM_DADOS, detalhe=str(e)) for s, _, _ in items]
+
+    ot = df["open_time"].to_numpy(np.int64)
+    close = df["close"].to_numpy(float)
+    close_time = df["close_time"].to_numpy(np.int64)
+    lo = np.searchsorted(ot, [a for _, a, _ in items], side="left")
+    hi = np.searchsorted(ot, [b for _, _, b in items], side="right")
+    entries = [float(s["entry"]) for s, _, _ in items]
+    targets = [float(s["target"]) for s, _, _ in items]
+    stops = [float(s["stop_loss"]) for s, _, _ in items]
+    is_buy = [(s["side"] or "").upper() == "BUY" for s, _, _ in items]
+    high, low = df["high"].to_numpy(float), df["low"].to_numpy(float)
+    entry_idx, exit_idx, hit_target, hit_stop = first_touch_batch(
+        high, low, is_buy, entries, targets, stops, lo, hi, np.ones(len(items), dtype=bool))
+    # alvo e stop no mesmo candle de 1m: desempate em 1s/aggTrades (offline: só o store)
+    refine_exits(None if offline else market, symbol, ot, high, low, is_buy, targets, stops,
+                 exit_idx, hit_target, hit_stop)
+
+    for k, (s, _, _) in enumerate(items):
+        if hi[k] <= lo[k]:
+            out.append(_result(s, ST_SEM_DADOS, detalhe="sem candles na janela"))
+            continue
+        if entry_idx[k] < 0:
+            out.append(_result(s, ST_TIMEOUT_SEM))
+            continue
+        if hit_target[k] or hit_stop[k]:
+            status = ST_ERROU if hit_stop[k] else ST_ACERTOU
+            preco = stops[k] if hit_stop[k] else targets[k]
+            saida_ms = int(close_time[exit_idx[k]])
+        else:
+            status, preco, saida_ms = ST_TIMEOUT, float(close[hi[k] - 1]), int(close_time[hi[k] - 1])
+        lucro = (preco - entries[k]) / entries[k] * 100 if is_buy[k] else (entries[k] - preco) / entries[k] * 100
+        out.append(_result(s, status, preco_saida=preco, lucro_pct=clean_pct(lucro),
+                           entrada_em_ms=int(close_time[entry_idx[k]]), saida_em_ms=saida_ms))
+    return out
+
+
+def _evaluate_task(task: Tuple[str, List[dict], int, bool]) -> List[dict]:
+    return evaluate_symbol(*task)
+
+
+# =========================
+# Orquestração e métricas
+# =========================
+def run_backtest(files: List[str], workers: int = 0, offline: bool = False,
+                 now_ms: Optional[int] = None) -> pd.DataFrame:
+    """Uma linha por (arquivo, sinal) com o veredito dependente do caminho."""
+    now_ms = now_ms or int(time.time() * 1000)
+    per_file: List[Tuple[str, dict]] = []
+    unique: Dict[Tuple, dict] = {}
+    # símbolos estropiados (CARDANOADAUSDT, "Litecoin (LTC)USDT") resolvidos antes de agrupar;
+    # offline usa só o universo que já está em data/symbol_universe.json e, sem preço para
+    # conferir, não aceita palpites por sufixo/alias
+    universe = get_universe(None if offline else market.get_exchange_universe,
+                            price=None if offline else market.get_price)
+    if not offline:
+        try:
+            universe.ensure_fresh()
+        except Exception as e:
+            print(f"[backtest] exchangeInfo indisponível, símbolos sem normalização ({e})")
+    for path in files:
+        try:
+            sigs = universe.normalize_signals(read_signal_file(path))
+        except Exception as e:
+            print(f"[backtest] {path}: arquivo ignorado ({e})")
+            continue
+        for s in sigs:
+            per_file.append((path, s))
+            unique.setdefault(signal_id(s), s)
+
+    by_symbol: Dict[str, List[dict]] = {}
+    for s in unique.values():
+        by_symbol.setdefault((s.get("symbol") or "").upper(), []).append(s)
+    tasks = [(sym, sigs, now_ms, offline) for sym, sigs in sorted(by_symbol.items())]
+
+    workers = workers or min(len(tasks), os.cpu_count() or 1) or 1
+    results: Dict[Tuple, dict] = {}
+    if workers <= 1 or len(tasks) <= 1:
+        chunks = map(_evaluate_task, tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,))
+        chunks = pool.map(_evaluate_task, tasks)
+    try:
+        for chunk in chunks:
+            for r in chunk:
+                results[signal_id(r)] = r
+    finally:
+        if workers > 1 and len(tasks) > 1:
+            pool.shutdown()
+
+    rows = [{"arquivo": path, **results[signal_id(s)]} for path, s in per_file]
+    return pd.DataFrame(rows, columns=["arquivo"] + SIGNAL_FIELDS + [
+        "status", "preco_saida", "lucro_pct", "entrada_em_ms", "saida_em_ms", "detalhe"])
+
+
+def summarize(df: pd.DataFrame) -> Dict[str, Any]:
+    """Win rate, expectancy (lucro médio por trade, %) e taxa de timeout sobre os que entraram."""
+    trades = df[df["status"].isin([ST_ACERTOU, ST_ERROU, ST_TIMEOUT])]
+    n = len(trades)
+    lucros = pd.to_numeric(trades["lucro_pct"], errors="coerce").dropna()
+    return {
+        "sinais": len(df),
+        "invalidos": int((df["status"] == ST_INVALIDA).sum()),
+        "sem_dados": int((df["status"] == ST_SEM_DADOS).sum()),
+        "em_andamento": int((df["status"] == ST_EM_ANDAMENTO).sum()),
+        "sem_entrada": int((df["status"] == ST_TIMEOUT_SEM).sum()),
+        "trades": n,
+        "win_rate": round((trades["status"] == ST_ACERTOU).sum() / n, 4) if n else None,
+        "timeout_rate": round((trades["status"] == ST_TIMEOUT).sum() / n, 4) if n else None,
+        "expectancy_pct": round(float(lucros.mean()), 3) if len(lucros) else None,
+    }
+
+
+def summary_table(df: pd.DataFrame) -> pd.DataFrame:
+    rows = [{"arquivo": os.path.basename(f), **summarize(g)} for f, g in df.groupby("arquivo", sort=True)]
+    uniq = df.drop_duplicates(subset=SIGNAL_FIELDS)
+    rows.append({"arquivo": "TOTAL (sinais únicos)", **summarize(uniq)})
+    return pd.DataFrame(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Backtest dependente do caminho dos arquivos de sinais.")
+    ap.add_argument("inputs", nargs="+", help="arquivos ou globs (ex.: \"sinais/*.json\")")
+    ap.add_argument("--workers", type=int, default=0, help="processos (padrão: nº de CPUs)")
+    ap.add_argument("--offline", action="store_true", help="usa só o store local (data/klines), sem rede")
+    ap.add_argument("--csv", default="backtest_resultados.csv", help="CSV com uma linha por sinal")
+    args = ap.parse_args(argv)
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("Nenhum arquivo de sinais encontrado.")
+        return 1
+    t0 = time.perf_counter()
+    df = run_backtest(files, args.workers, args.offline)
+    elapsed = time.perf_counter() - t0
+    df.to_csv(args.csv, index=False)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(summary_table(df).to_string(index=False))
+    print(f"\n{len(df)} sinal(is) de {len(files)} arquivo(s) em {elapsed:.1f}s → {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# drill_down.py
+# Desempate intra-candle: quando o MESMO candle de 1m toca alvo e stop, o first_touch
+# assume stop primeiro (conservador) — o que transforma acertos reais em erros.
+#
+# Só para esses candles ambíguos (poucos), desce de resolução sob demanda:
+#   1) klines de 1s do minuto (via kline_store: ficam em data/klines/1s/, 1 request pequeno)
+#   2) se um segundo ainda toca os dois, aggTrades daquele segundo, em ordem
+# O resultado decidido de cada candle fica num cache LRU do processo. Sem cliente
+# (modo offline) usa só o que já está no disco; sem dado fino, continua valendo o stop.
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Sequence
+
+import numpy as np
+
+from kline_store import read_stored
+from first_touch import first_touch
+
+MINUTE_MS = 60_000
+DRILL_CACHE_MAX = 4096
+
+_cache: "OrderedDict[Hashable, bool]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _first_in_trades(trades, is_buy: bool, target: float, stop: float) -> Optional[bool]:
+    for _, px in trades:
+        hit_t = px >= target if is_buy else px <= target
+        hit_s = px <= stop if is_buy else px >= stop
+        if hit_s:
+            return False
+        if hit_t:
+            return True
+    return None
+
+
+def _resolve(client, symbol: str, is_buy: bool, target: float, stop: float, open_ms: int) -> Optional[bool]:
+    end_ms = open_ms + MINUTE_MS - 1
+    if client is None:
+        df = read_stored(symbol, open_ms, end_ms, "1s")
+    else:
+        df = client.get_klines(symbol, open_ms, end_ms, "1s")
+    if df.empty:
+        return None
+    side = "BUY" if is_buy else "SELL"
+    t = first_touch(df["high"].to_numpy(float), df["low"].to_numpy(float), side, target=target, stop=stop)
+    if t.exit_idx is None:
+        return None
+    i = t.exit_idx
+    hi, lo = float(df["high"].iat[i]), float(df["low"].iat[i])
+    both = (hi >= target and lo <= stop) if is_buy else (lo <= target and hi >= stop)
+    if not both:
+        return t.hit_target
+    if client is None:
+        return None
+    sec = int(df["open_time"].iat[i])
+    return _first_in_trades(client.get_agg_trades(symbol, sec, sec + 999), is_buy, target, stop)
+
+
+def resolve_ambiguous(client, symbol: str, is_buy: bool, target: float, stop: float,
+                      open_ms: int) -> Optional[bool]:
+    """
+    Candle de 1m (open_time = open_ms) que tocou alvo e stop: True = alvo veio primeiro,
+    False = stop primeiro, None = sem dado fino suficiente (quem chama mantém o stop).
+    client: MarketClient (rede + store) ou None (só o store local).
+    """
+    key = (symbol.upper(), int(open_ms), bool(is_buy), float(target), float(stop))
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    try:
+        res = _resolve(client, key[0], key[2], key[3], key[4], key[1])
+    except Exception:
+        return None   # falha de rede não vai para o cache: tenta de novo no próximo ciclo
+    if res is None:
+        return None   # dado fino ainda incompleto (ex.: minuto em formação): não memoriza
+    with _cache_lock:
+        _cache[key] = res
+        if len(_cache) > DRILL_CACHE_MAX:
+            _cache.popitem(last=False)
+    return res
+
+
+def refine_exits(client, symbol: str, open_time: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 is_buy: Sequence[bool], targets: Sequence[float], stops: Sequence[float],
+                 exit_idx: np.ndarray, hit_target: np.ndarray, hit_stop: np.ndarray) -> int:
+    """
+    Revê, in place, as saídas do first_touch_batch cujo candle tocou alvo E stop.
+    Retorna quantas viraram alvo.
+    """
+    changed = 0
+    for k in np.flatnonzero(hit_stop):
+        i = int(exit_idx[k])
+        tgt = high[i] >= targets[k] if is_buy[k] else low[i] <= targets[k]
+        if not tgt:
+            continue
+        if resolve_ambiguous(client, symbol, bool(is_buy[k]), float(targets[k]), float(stops[k]),
+                             int(open_time[i])):
+            hit_target[k], hit_stop[k] = True, False
+            changed += 1
+    return changed
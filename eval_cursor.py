@@ -0,0 +1,84 @@
+# eval_cursor.py
+# Estado de avaliação persistido por sinal do watchlist.
+#
+# Um candle já fechado e já avaliado não muda o veredito, então cada sinal guarda até
+# onde foi avaliado (last_ct = close_time do último candle FECHADO visto) e o que já
+# aconteceu (entry/alvo/stop). A cada refresh só os candles depois de last_ct são lidos.
+import os
+import json
+import threading
+from typing import Dict, Any, Iterable, Optional
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(APP_DIR, "data", "eval_state.json")
+
+_lock = threading.Lock()
+
+
+def signal_fingerprint(side: str, entry: float, target: float, stop: float, start_ms: int) -> list:
+    return [side, entry, target, stop, start_ms]
+
+
+def new_cursor(fingerprint: list, start_ms: int) -> Dict[str, Any]:
+    return {
+        "sig": fingerprint,
+        "last_ct": start_ms - 1,     # close_time do último candle fechado avaliado
+        "entry_hit_ms": None,        # close_time do candle que tocou a entry
+        "bateu_alvo": False,
+        "bateu_stop": False,
+        "preco_exec": None,
+        "last_close": None,
+    }
+
+
+def cursor_for(state: Dict[str, Dict[str, Any]], key: str, fingerprint: list, start_ms: int) -> Dict[str, Any]:
+    """Cursor do sinal; recomeça do zero se o sinal foi editado (mesma chave, outros números)."""
+    cur = state.get(key)
+    if not cur or cur.get("sig") != fingerprint:
+        cur = new_cursor(fingerprint, start_ms)
+        state[key] = cur
+    return cur
+
+
+def scan_from(cur: Dict[str, Any]) -> int:
+    return int(cur["last_ct"]) + 1
+
+
+def closed_upto(end_eval: int, now_ms: int, interval_ms: int = 60_000) -> int:
+    """close_time do último candle já fechado dentro de [.., end_eval]."""
+    last_open = min(end_eval - (end_eval % interval_ms), now_ms - (now_ms % interval_ms) - interval_ms)
+    return last_open + interval_ms - 1
+
+
+def exit_done(cur: Dict[str, Any]) -> bool:
+    return bool(cur.get("bateu_alvo") or cur.get("bateu_stop"))
+
+
+def load_cursors(path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    path = path or STATE_PATH
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def save_cursors(state: Dict[str, Dict[str, Any]], path: Optional[str] = None) -> None:
+    path = path or STATE_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _lock:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def drop_cursors(state: Dict[str, Dict[str, Any]], keys: Iterable[str]) -> bool:
+    changed = False
+    for k in keys:
+        if state.pop(k, None) is not None:
+            changed = True
+    return changed
@@ -0,0 +1,1015 @@
+# evaluator.py
+# Avaliador headless do watchlist (sem Streamlit).
+#
+# Roda o ciclo inteiro — preços, klines, cursores, auditoria, finalização e prune — na
+# sua própria cadência e publica um snapshot atômico (data/snapshot.json) com as linhas,
+# KPIs e finalizados do ciclo. O app_live.py só lê e desenha o snapshot.
+#
+# Dois modos:
+#   - thread dentro do Streamlit (padrão): get_evaluator().start()
+#   - processo separado:  python evaluator.py [--once]   (e LUCRA_EVALUATOR=external no app)
+# As opções (intervalo, lote, conexões, streaming, sparklines) ficam em
+# data/evaluator_settings.json, escritas pela sidebar e relidas a cada ciclo.
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from market_client import get_client
+from market_stream import MarketStream, DEFAULT_STREAM_URL
+from kline_store import rows_to_df, empty_klines, read_stored
+from rate_limit import LIMITER
+from sparkline import cached_sparkline
+from watch_store import get_store, signal_tuple, STATUS_FINALIZADO, STATUS_REMOVIDO
+from hist_log import get_hist_log
+from first_touch import first_touch, first_touch_batch
+from drill_down import resolve_ambiguous, refine_exits
+from kline_pyramid import is_long, find_entry, find_exit, last_candle
+from symbol_universe import SymbolUniverse, get_universe, UNIVERSE_TTL_S
+from eval_cursor import (
+    load_cursors, save_cursors, drop_cursors, cursor_for, signal_fingerprint,
+    scan_from, closed_upto, exit_done
+)
+from audits_utils import (
+    audit_log, audit_live, audit_failure, build_audit_record,
+    E_NUM, E_SIDE, E_DATE, E_SYMBOL, E_PRICE_MISS, E_RULE_BUY, E_RULE_SELL, E_UNKNOWN
+)
+
+# =========================
+# Config
+# =========================
+INTERVAL = "1m"
+USER_AGENT = "LucraLive/1.3 (+https://lucra.local)"
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR    = os.path.join(APP_DIR, "logs")
+LOG_PATH   = os.path.join(LOG_DIR, "lucra.log")
+DATA_DIR   = os.path.join(APP_DIR, "data")
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "snapshot.json")
+SETTINGS_PATH = os.path.join(DATA_DIR, "evaluator_settings.json")
+
+# Versões (para auditoria)
+APP_VERSION    = "live-1.3"
+MODEL_VERSION  = "n/a"
+PROMPT_ID      = "extract_v1"
+
+# Sparkline completa a janela pela rede só com essa folga de peso (é cosmético)
+SPARK_MIN_HEADROOM = 0.3
+
+# Gravação opcional das mensagens do stream (JSONL) para replay offline
+STREAM_RECORD_PATH = os.environ.get("LUCRA_STREAM_RECORD") or None
+
+# FUSO local das strings de data do JSON
+LOCAL_TZ = ZoneInfo("America/Sao_Paulo")
+
+DEFAULT_SETTINGS = {
+    "auto": True,
+    "interval": 15,
+    "batch_eval": True,
+    "max_workers": 8,
+    "use_stream": False,
+    "enable_spark": True,
+    "spark_minutes": 60,
+}
+
+# Status exibidos (mesmos textos de antes)
+ST_AGENDADO, ST_ARMADO, ST_AO_VIVO = "⏳ AGENDADO", "🟠 ARMADO", "🟡 AO VIVO"
+ST_ACERTOU, ST_ERROU = "✅ ACERTOU", "❌ ERROU"
+ST_TIMEOUT, ST_TIMEOUT_SEM = "⏹ TIMEOUT", "⏹ TIMEOUT (SEM ENTRADA)"
+ST_INVALIDA = "CONFIG INVÁLIDA"
+
+market = get_client(USER_AGENT)
+
+# =========================
+# Utils comuns
+# =========================
+def log_event(tipo: str, payload: dict):
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        rec = {"ts": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), "tipo": tipo, **payload}
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    except Exception:
+        pass
+
+market.on_event = log_event
+
+def to_ms(dt_str: str) -> int:
+    """
+    As strings do JSON estão em America/Sao_Paulo.
+    Converte BR -> UTC em ms.
+    """
+    dt_local = datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=LOCAL_TZ)
+    dt_utc = dt_local.astimezone(timezone.utc)
+    return int(dt_utc.timestamp() * 1000)
+
+def ms_to_iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms/1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+def load_json(path, default):
+    if not os.path.isfile(path): return default
+    try:
+        with open(path, "r", encoding="utf-8") as f: return json.load(f)
+    except: return default
+
+def _json_default(o):
+    return o.item() if hasattr(o, "item") else str(o)
+
+def save_json_atomic(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=_json_default)
+    os.replace(tmp, path)
+
+def map_validation_errors(struct_ok: bool, struct_msg: str, symbol_ok: bool, price_available: bool) -> list[str]:
+    errs = []
+    msg_low = (struct_msg or "").lower()
+    if not struct_ok:
+        if "num" in msg_low: errs.append(E_NUM)
+        if "side" in msg_low: errs.append(E_SIDE)
+        if "data" in msg_low: errs.append(E_DATE)
+        if "buy inválido" in msg_low or "buy invalido" in msg_low: errs.append(E_RULE_BUY)
+        if "sell inválido" in msg_low or "sell invalido" in msg_low: errs.append(E_RULE_SELL)
+        if not errs: errs.append(E_UNKNOWN)
+    if not symbol_ok: errs.append(E_SYMBOL)
+    if not price_available: errs.append(E_PRICE_MISS)
+    seen = set(); out = []
+    for e in errs:
+        if e not in seen: out.append(e); seen.add(e)
+    return out
+
+# =========================
+# Configurações (sidebar <-> avaliador)
+# =========================
+def load_settings(path: str = SETTINGS_PATH) -> Dict[str, Any]:
+    data = load_json(path, {})
+    return {**DEFAULT_SETTINGS, **(data if isinstance(data, dict) else {})}
+
+def save_settings(settings: Dict[str, Any], path: str = SETTINGS_PATH) -> None:
+    save_json_atomic(path, {k: settings.get(k, v) for k, v in DEFAULT_SETTINGS.items()})
+
+# =========================
+# Snapshot
+# =========================
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[Dict[str, Any]]:
+    snap = load_json(path, None)
+    return snap if isinstance(snap, dict) else None
+
+def snapshot_mtime(path: str = SNAPSHOT_PATH) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+def wait_for_snapshot(after_mtime: int, timeout: float, path: str = SNAPSHOT_PATH, poll_s: float = 0.2) -> bool:
+    """Espera um snapshot mais novo que after_mtime (True) ou o timeout (False)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if snapshot_mtime(path) != after_mtime:
+            return True
+        time.sleep(poll_s)
+    return snapshot_mtime(path) != after_mtime
+
+# =========================
+# Klines e sparklines
+# =========================
+def fetch_klines(symbol: str, start_ms: int, end_ms: int, interval: str = INTERVAL) -> pd.DataFrame:
+    # disco primeiro (data/klines); rede só para a cauda que falta
+    return market.get_klines(symbol, start_ms, end_ms, interval)
+
+def recent_closes(symbol: str, minutes: int, last_ct: int) -> Tuple[List[float], bool]:
+    """
+    (closes dos candles fechados da janela até last_ct, janela completa?). Só o que o store
+    já tem (a pré-busca do ciclo grava lá); o que faltar (saída já decidida, sinal que começou
+    há menos de `minutes`) só vem da rede se sobrar folga de peso — senão sai a janela parcial.
+    """
+    a = last_ct - minutes*60_000 + 1
+    df = read_stored(symbol, a, last_ct, INTERVAL)
+    if len(df) < minutes and LIMITER.headroom() >= SPARK_MIN_HEADROOM:
+        try:
+            df = fetch_klines(symbol, a, last_ct, INTERVAL)
+        except Exception:
+            pass
+    closes = [] if df.empty else df["close"].astype(float).tolist()
+    return closes, len(closes) >= minutes
+
+def spark_html(symbol: str, minutes: int, now_ms: int) -> str:
+    last_ct = closed_upto(now_ms, now_ms)
+    svg = cached_sparkline((symbol, minutes, last_ct), lambda: recent_closes(symbol, minutes, last_ct))
+    return f'<div class="spark">{svg}</div>' if svg else ""
+
+# =========================
+# Validações, eventos, PnL
+# =========================
+def validate_signal_numeric_side(s: dict) -> Tuple[bool, str]:
+    try:
+        side   = (s["side"] or "").upper()
+        entry  = float(s["entry"])
+        target = float(s["target"])
+        stop   = float(s["stop_loss"])
+    except Exception:
+        return False, "Campos numéricos inválidos"
+
+    if side == "BUY":
+        if not (target > entry and stop < entry):
+            return False, "BUY inválido (target > entry e stop < entry)"
+    elif side == "SELL":
+        if not (target < entry and stop > entry):
+            return False, "SELL inválido (target < entry e stop > entry)"
+    else:
+        return False, "Side inválido"
+    try:
+        to_ms(s["entrada_datahora"])
+        to_ms(s["saida_datahora"])
+    except Exception:
+        return False, "Datas inválidas (YYYY-MM-DD HH:MM:SS)"
+    return True, ""
+
+# ===== Sinais compilados (uma vez por linha do watchlist, não a cada ciclo) =====
+class SignalRecord:
+    """
+    Sinal do watchlist já validado e convertido: floats, início/fim em ms, flag de side e
+    chave interned. O dict do sinal não fica guardado: as_dict() o remonta (só auditoria e
+    histórico precisam dele); em `extra` ficam apenas os campos que a conversão não
+    reproduz (chaves a mais, valores originais não-float) e, nos inválidos, o sinal inteiro.
+    """
+    __slots__ = ("symbol", "side", "is_buy", "entry", "target", "stop", "entrada", "saida",
+                 "start_ms", "end_ms", "key", "ok", "msg", "extra")
+
+    def fingerprint(self) -> list:
+        return signal_fingerprint(self.side, self.entry, self.target, self.stop, self.start_ms)
+
+    def _core(self) -> dict:
+        return {"symbol": self.symbol, "side": self.side, "entry": self.entry, "target": self.target,
+                "stop_loss": self.stop, "entrada_datahora": self.entrada, "saida_datahora": self.saida}
+
+    def as_dict(self) -> dict:
+        if not self.ok:
+            return dict(self.extra)
+        return {**self._core(), **self.extra} if self.extra else self._core()
+
+def compile_signal(s: dict) -> SignalRecord:
+    r = SignalRecord()
+    r.symbol = sys.intern((s.get("symbol") or "").upper())
+    r.side = sys.intern((s.get("side") or "").upper())
+    r.is_buy = r.side == "BUY"
+    r.entrada, r.saida = s.get("entrada_datahora"), s.get("saida_datahora")
+    r.key = sys.intern(f"{r.symbol}|{r.entrada}|{r.saida}")
+    r.ok, r.msg = validate_signal_numeric_side(s)
+    if not r.ok:
+        r.entry = r.target = r.stop = r.start_ms = r.end_ms = None
+        r.extra = dict(s)
+        return r
+    r.entry, r.target, r.stop = float(s["entry"]), float(s["target"]), float(s["stop_loss"])
+    r.start_ms, r.end_ms = to_ms(r.entrada), to_ms(r.saida)
+    core = r._core()
+    r.extra = {k: v for k, v in s.items()
+               if not (k in core and type(v) is type(core[k]) and v == core[k])} or None
+    return r
+
+def symbol_universe() -> SymbolUniverse:
+    return get_universe(market.get_exchange_universe, price=market.get_price)
+
+def ready_universe() -> Optional[SymbolUniverse]:
+    """Universo para o ingest (resolve CARDANOADAUSDT -> ADAUSDT); None se nunca foi baixado."""
+    universe = symbol_universe()
+    try:
+        universe.ensure_fresh()
+    except Exception as e:
+        log_event("erro_exchange_info", {"erro": str(e)})
+    return universe if universe.symbols else None
+
+def hit_events(symbol, side, entry, target, stop, start_ms, end_ms):
+    if is_long(start_ms, end_ms):
+        # janela longa: 1d -> 1h -> 1m só onde alvo/stop podem ter sido tocados
+        last = last_candle(fetch_klines, symbol, start_ms, end_ms)
+        if last is None:
+            return False, False, None, None
+        hit = find_exit(fetch_klines, symbol, side, target, stop, start_ms, end_ms)
+        df, i = (hit[0], hit[1]) if hit is not None else (None, None)
+        last_close = float(last["close"])
+    else:
+        df = fetch_klines(symbol, start_ms, end_ms)
+        if df.empty:
+            return False, False, None, None
+        i = first_touch(df["high"].to_numpy(float), df["low"].to_numpy(float), side,
+                        target=target, stop=stop).exit_idx
+        last_close = float(df.iloc[-1]["close"])
+    if i is None:
+        return False, False, None, last_close
+    hi, lo = float(df["high"].iat[i]), float(df["low"].iat[i])
+    tgt, stp = (hi >= target, lo <= stop) if side == "BUY" else (lo <= target, hi >= stop)
+    bateu_alvo, bateu_stop = tgt and not stp, stp
+    if tgt and stp:
+        # alvo e stop no mesmo candle: desempata em 1s/aggTrades
+        if resolve_ambiguous(market, symbol, side == "BUY", target, stop, int(df["open_time"].iat[i])):
+            bateu_alvo, bateu_stop = True, False
+    preco_exec = stop if bateu_stop else target
+    return bateu_alvo, bateu_stop, preco_exec, last_close
+
+def compute_live_pnl(side: str, entry: float, last_price: Optional[float]) -> Optional[float]:
+    if entry is None or last_price is None:
+        return None
+    if side == "BUY":
+        return ((last_price - entry) / entry) * 100
+    else:
+        return ((entry - last_price) / entry) * 100
+
+def clean_pct(v: Optional[float]) -> Optional[float]:
+    return None if v is None or (isinstance(v, float) and math.isnan(v)) else round(float(v), 2)
+
+# ===== Detectar "bateu a entry" (candle toca a entry) =====
+def hit_entry(symbol: str, side: str, entry: float, start_ms: int, end_ms: int) -> tuple[bool, Optional[int], Optional[float], Optional[float]]:
+    if is_long(start_ms, end_ms):
+        # janela longa: só os buckets grossos cujo range contém a entry descem para 1m
+        last = last_candle(fetch_klines, symbol, start_ms, end_ms)
+        if last is None:
+            return False, None, None, None
+        hit = find_entry(fetch_klines, symbol, entry, start_ms, end_ms)
+        hit_ms = int(hit[0]["close_time"].iat[hit[1]]) if hit is not None else None  # aproximação
+        return hit is not None, hit_ms, entry, float(last["close"])
+    df = fetch_klines(symbol, start_ms, end_ms)
+    if df.empty:
+        return False, None, None, None
+    t = first_touch(df["high"].to_numpy(float), df["low"].to_numpy(float), side, entry=entry)
+    entry_hit = t.entry_idx is not None
+    hit_ms = int(df["close_time"].iat[t.entry_idx]) if entry_hit else None  # aproximação
+    last_close = float(df.iloc[-1]["close"])
+    return entry_hit, hit_ms, entry, last_close
+
+# ===== Avaliação incremental (cursor persistido por sinal) =====
+def advance_cursor(cur: dict, symbol: str, side: str, entry: float, target: float, stop: float,
+                   end_eval: int, now_ms: int) -> dict:
+    a = scan_from(cur)
+    if a > end_eval:
+        return cur
+    if cur["entry_hit_ms"] is None:
+        entry_ok, hit_ms, _, last_close = hit_entry(symbol, side, entry, a, end_eval)
+        if last_close is not None:
+            cur["last_close"] = last_close
+        if entry_ok:
+            cur["entry_hit_ms"] = hit_ms
+    if cur["entry_hit_ms"] is not None and not exit_done(cur):
+        # alvo/stop só a partir do candle seguinte ao da entry
+        bateu_alvo, bateu_stop, preco_exec, last_close = hit_events(
+            symbol, side, entry, target, stop, max(a, cur["entry_hit_ms"]), end_eval
+        )
+        if last_close is not None:
+            cur["last_close"] = last_close
+        if bateu_alvo or bateu_stop:
+            cur.update(bateu_alvo=bateu_alvo, bateu_stop=bateu_stop, preco_exec=preco_exec)
+    # candle em formação nunca avança o cursor: é reavaliado no próximo ciclo
+    cur["last_ct"] = max(int(cur["last_ct"]), closed_upto(end_eval, now_ms))
+    return cur
+
+def timed_advance_cursor(*args, **kwargs):
+    t0 = perf_counter()
+    res = advance_cursor(*args, **kwargs)
+    lat = int((perf_counter() - t0) * 1000)
+    return res, lat
+
+# ===== Avaliação em lote: todos os sinais de um símbolo numa passada =====
+def pending_items(items: List[dict]) -> List[dict]:
+    return [it for it in items
+            if scan_from(it["cur"]) <= it["end_eval"]
+            and not (it["cur"]["entry_hit_ms"] is not None and exit_done(it["cur"]))]
+
+def batch_window(items: List[dict]) -> Optional[Tuple[int, int]]:
+    """União das janelas ainda pendentes de um símbolo (None = nada a buscar)."""
+    pend = pending_items(items)
+    if not pend:
+        return None
+    return min(scan_from(it["cur"]) for it in pend), max(it["end_eval"] for it in pend)
+
+def advance_cursors_batch(symbol: str, items: List[dict], df: pd.DataFrame, now_ms: int) -> None:
+    """
+    items: [{"cur", "side", "entry", "target", "stop", "end_eval"}] do mesmo símbolo;
+    df: klines da união das janelas (batch_window), já baixadas.
+    Avança todos os cursores numa passada sobre os mesmos arrays.
+    """
+    pend = pending_items(items)
+    if pend:
+        ot = df["open_time"].to_numpy(np.int64)
+        close = df["close"].to_numpy(float)
+        close_time = df["close_time"].to_numpy(np.int64)
+
+        need_entry = np.array([it["cur"]["entry_hit_ms"] is None for it in pend])
+        from_ms = np.array([
+            scan_from(it["cur"]) if ne else max(scan_from(it["cur"]), it["cur"]["entry_hit_ms"])
+            for it, ne in zip(pend, need_entry)
+        ], dtype=np.int64)
+        win_lo = np.searchsorted(ot, [scan_from(it["cur"]) for it in pend], side="left")
+        lo = np.searchsorted(ot, from_ms, side="left")
+        hi = np.searchsorted(ot, [it["end_eval"] for it in pend], side="right")
+
+        high, low = df["high"].to_numpy(float), df["low"].to_numpy(float)
+        is_buy = [it["side"] == "BUY" for it in pend]
+        targets, stops = [it["target"] for it in pend], [it["stop"] for it in pend]
+        entry_idx, exit_idx, hit_target, hit_stop = first_touch_batch(
+            high, low, is_buy, [it["entry"] for it in pend], targets, stops, lo, hi, need_entry,
+        )
+        refine_exits(market, symbol, ot, high, low, is_buy, targets, stops, exit_idx, hit_target, hit_stop)
+        for k, it in enumerate(pend):
+            cur = it["cur"]
+            if hi[k] > win_lo[k]:
+                cur["last_close"] = float(close[hi[k] - 1])
+            if entry_idx[k] >= 0:
+                cur["entry_hit_ms"] = int(close_time[entry_idx[k]])  # aproximação
+            if exit_idx[k] >= 0:
+                cur.update(bateu_alvo=bool(hit_target[k]), bateu_stop=bool(hit_stop[k]),
+                           preco_exec=(it["stop"] if hit_stop[k] else it["target"]))
+            cur["last_ct"] = max(int(cur["last_ct"]), closed_upto(it["end_eval"], now_ms))
+
+# ===== Streaming (opcional) =====
+def with_live_candle(df: pd.DataFrame, row: Optional[list], end_ms: int) -> pd.DataFrame:
+    """Acrescenta o candle em formação (vindo do stream) depois do último candle fechado."""
+    if not row or int(row[0]) > end_ms:
+        return df
+    if not df.empty and int(row[0]) <= int(df["open_time"].iloc[-1]):
+        return df
+    live = rows_to_df([row])
+    return live if df.empty else pd.concat([df, live], ignore_index=True)
+
+# ===== Pré-busca concorrente (klines + preço fallback) =====
+def prefetch_market_data(windows: Dict[str, Tuple[int, int]], price_syms: List[str], max_workers: int,
+                         stream: Optional[MarketStream] = None, now_ms: Optional[int] = None):
+    """
+    Baixa em paralelo (pool limitado a max_workers) as klines de cada símbolo e, num único
+    request em lote, os preços que faltaram no ticker geral. O tempo do ciclo passa a ser
+    o do símbolo mais lento.
+    Com stream ativo, só os candles fechados vêm do store/REST (o stream já os grava no
+    disco) e o candle em formação vem da memória do stream.
+    Retorna (klines, lat_ms, prices, errors), todos por símbolo.
+    """
+    klines: Dict[str, pd.DataFrame] = {}
+    lat_ms: Dict[str, int] = {}
+    prices: Dict[str, float] = {}
+    errors: Dict[str, str] = {}
+
+    def _klines(sym: str, a: int, b: int):
+        t0 = perf_counter()
+        if stream is None:
+            df = market.get_klines(sym, a, b, INTERVAL)
+        else:
+            b_closed = closed_upto(b, now_ms) - 59_999   # open_time do último candle fechado
+            df = market.get_klines(sym, a, b_closed, INTERVAL) if a <= b_closed else empty_klines()
+            df = with_live_candle(df, stream.current_candle(sym), b)
+        return df, int((perf_counter() - t0) * 1000)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        fut_k = {pool.submit(_klines, sym, a, b): sym for sym, (a, b) in windows.items()}
+        fut_p = pool.submit(market.get_prices, price_syms) if price_syms else None
+        for fut in as_completed(list(fut_k)):
+            sym = fut_k[fut]
+            try:
+                klines[sym], lat_ms[sym] = fut.result()
+            except Exception as e:
+                errors[sym] = str(e)
+        if fut_p is not None:
+            try:
+                prices.update(fut_p.result())
+            except Exception as e:
+                errors["__prices__"] = str(e)
+    return klines, lat_ms, prices, errors
+
+# =========================
+# Ordenação / KPIs (o que a página mostra)
+# =========================
+FINAL_STATUSES = (ST_ACERTOU, ST_ERROU, ST_TIMEOUT, ST_TIMEOUT_SEM)
+
+def order_rows(rows: List[dict]) -> List[dict]:
+    """AO VIVO (maior PnL primeiro), finalizados, agendados/armados, inválidos."""
+    live = [r for r in rows if r["status"] == ST_AO_VIVO]
+    live.sort(key=lambda r: (r.get("live_pnl_pct") is None, -(r.get("live_pnl_pct") or 0.0)))
+    fin  = [r for r in rows if r["status"] in FINAL_STATUSES]
+    pend = [r for r in rows if r["status"] in (ST_AGENDADO, ST_ARMADO)]
+    inv  = [r for r in rows if r["status"] == ST_INVALIDA]
+    return live + fin + pend + inv
+
+def compute_kpis(rows: List[dict]) -> Dict[str, int]:
+    count = lambda *sts: sum(1 for r in rows if r["status"] in sts)
+    return {
+        "ao_vivo": count(ST_AO_VIVO),
+        "agendados_armados": count(ST_AGENDADO, ST_ARMADO),
+        "acertos": count(ST_ACERTOU),
+        "erros": count(ST_ERROU),
+        "timeouts": count(ST_TIMEOUT, ST_TIMEOUT_SEM),
+        "invalidos": count(ST_INVALIDA),
+    }
+
+# =========================
+# Avaliador
+# =========================
+class Evaluator:
+    def __init__(self, snapshot_path: str = SNAPSHOT_PATH, settings_path: str = SETTINGS_PATH):
+        self.snapshot_path = snapshot_path
+        self.settings_path = settings_path
+        self.invalid_hits: Dict[str, int] = {}
+        self._stream: Optional[MarketStream] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.cycles = 0
+        self.last_error: Optional[str] = None
+
+    # ----- controle -----
+    def start(self) -> "Evaluator":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="lucra-evaluator", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """Pede um ciclo já (watchlist mudou, refresh manual...)."""
+        self._wake.set()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            settings = load_settings(self.settings_path)
+            self._wake.clear()
+            try:
+                self.run_cycle(settings)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                log_event("erro_ciclo", {"erro": str(e)})
+            self._idle(settings)
+
+    def _idle(self, settings: Dict[str, Any]) -> None:
+        # sem auto-refresh: só roda de novo quando alguém pedir (wake)
+        timeout = float(settings["interval"]) if settings["auto"] else None
+        stream = self._stream if settings["use_stream"] else None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set() and not self._wake.is_set():
+            # com stream, acorda assim que o preço cruzar algum entry/alvo/stop
+            if stream is not None and stream.touched.is_set():
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            self._wake.wait(0.2)
+
+    # ----- recursos -----
+    def exchange_symbols(self, ttl_s: float = UNIVERSE_TTL_S) -> Set[str]:
+        # universo persistido (data/symbol_universe.json): subir o processo não refaz o exchangeInfo
+        return symbol_universe().ensure_fresh(ttl_s)
+
+    def stream(self, enabled: bool) -> Optional[MarketStream]:
+        if not enabled:
+            if self._stream is not None:
+                self._stream.stop()
+                self._stream = None
+            return None
+        if self._stream is None:
+            self._stream = MarketStream(DEFAULT_STREAM_URL, INTERVAL, record_path=STREAM_RECORD_PATH,
+                                        on_event=log_event).start()
+        return self._stream
+
+    # ----- prune -----
+    def prune_watchlist(self, watch_list: List[SignalRecord], now_ms: int, threshold: int = 2) -> List[SignalRecord]:
+        """Remoção permanente de inválidos reincidentes."""
+        to_remove_keys = [k for k, c in self.invalid_hits.items() if c >= threshold]
+        if not to_remove_keys:
+            return watch_list
+        hist_new, new_watch, removed = [], [], []
+        for r in watch_list:
+            key = r.key
+            if key in to_remove_keys:
+                motivo = "Sem preço ao vivo/erro de validação após múltiplas tentativas"
+                s = r.as_dict()
+                hist_new.append({**s, "status_final": "INVALIDO_REMOVIDO", "motivo": motivo, "fechado_em": ms_to_iso(now_ms)})
+                removed.append(signal_tuple(s))
+                log_event("remocao_invalido", {"key": key, "motivo": motivo})
+            else:
+                new_watch.append(r)
+        get_hist_log().append(hist_new)
+        get_store().close(removed, STATUS_REMOVIDO)
+        for k in to_remove_keys:
+            self.invalid_hits.pop(k, None)
+        return new_watch
+
+    # ----- ciclo -----
+    def run_cycle(self, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        t_cycle = perf_counter()
+        now_ms = int(datetime.now(timezone.utc).timestamp()*1000)
+        store = get_store()
+        # sinais compilados uma vez por linha (floats, ms, chave): o ciclo não revalida nem reconverte
+        watch = store.active_records(compile_signal)
+        cursors = load_cursors()
+        invalid_hits = self.invalid_hits
+        rows: List[dict] = []
+        finalized_records: List[dict] = []
+        messages: List[dict] = []
+        enable_spark, spark_minutes = settings["enable_spark"], int(settings["spark_minutes"])
+        stream = self.stream(bool(settings["use_stream"]))
+        stream_live = stream is not None and stream.is_live()
+
+        if watch:
+            # 1) cache de símbolos válidos & preços batelados
+            try:
+                exchange_syms = self.exchange_symbols()
+            except Exception as e:
+                exchange_syms = set()
+                messages.append({"level": "warning", "text": "Falha ao buscar exchangeInfo. Validação de símbolo desativada neste ciclo."})
+                log_event("erro_exchange_info", {"erro": str(e)})
+
+            # símbolos estropiados que entraram antes da normalização no ingest: corrige uma vez
+            # no store em vez de gerar E_SYMBOL a cada ciclo até o prune
+            if exchange_syms:
+                unknown = {r.symbol for r in watch} - exchange_syms
+                if unknown:
+                    universe = symbol_universe()
+                    # palpite (sufixo/alias) só é gravado se o entry bate com o preço do candidato
+                    entries: Dict[str, float] = {}
+                    for r in watch:
+                        if r.ok and r.symbol in unknown:
+                            entries.setdefault(r.symbol, r.entry)
+                    fixed = {u: hit for u in unknown
+                             if (hit := universe.resolve(u, allow_refresh=True, entry=entries.get(u)))}
+                    exchange_syms = universe.symbols
+                    if fixed and store.rename_symbols(fixed):
+                        log_event("simbolos_corrigidos", {"mapa": fixed})
+                        watch = store.active_records(compile_signal)
+
+            # streaming: assina só os símbolos do watchlist e registra os níveis que disparam o refresh
+            if stream is not None:
+                stream.set_symbols({r.symbol for r in watch})
+                levels: Dict[str, List[float]] = {}
+                for r in watch:
+                    if r.ok:
+                        levels.setdefault(r.symbol, []).extend([r.entry, r.target, r.stop])
+                stream.set_levels(levels)
+                stream.touched.clear()
+
+            prices_map = {}
+            prices_src = "batch"
+            lat_batch_ms = None
+            if stream_live:
+                # preços do stream; quem ainda não tem tick vai para o lote de fallback abaixo
+                prices_map = stream.prices()
+                prices_src = "stream"
+            else:
+                if stream is not None:
+                    messages.append({"level": "info", "text": "Stream ainda não conectado — usando REST neste ciclo."})
+                try:
+                    t0 = perf_counter()
+                    prices_map = market.get_all_prices()
+                    lat_batch_ms = int((perf_counter() - t0) * 1000)
+                except Exception as e:
+                    prices_map = {}
+                    messages.append({"level": "warning", "text": "Falha ao buscar preços em batch. Tentando fallback por-símbolo se necessário."})
+                    log_event("erro_batch_prices", {"erro": str(e)})
+
+            # 2) agrupa por símbolo e pré-busca tudo em paralelo (klines da união das janelas + preço fallback)
+            groups: Dict[str, List[dict]] = {}
+            price_syms: Set[str] = set()
+            for r in watch:
+                if not r.ok:
+                    continue
+                symbol, side = r.symbol, r.side
+                if exchange_syms and symbol not in exchange_syms:
+                    continue
+                if symbol not in prices_map:
+                    price_syms.add(symbol)
+                entry, target, stop = r.entry, r.target, r.stop
+                start_ms, end_ms = r.start_ms, r.end_ms
+                if now_ms < start_ms:
+                    continue
+                cur = cursor_for(cursors, r.key, r.fingerprint(), start_ms)
+                end_eval = min(now_ms, end_ms)
+                if is_long(scan_from(cur), end_eval) and not (cur["entry_hit_ms"] is not None and exit_done(cur)):
+                    # atraso longo (sinal de meses / cursor novo): avança pela pirâmide 1d/1h/1m antes,
+                    # para a pré-busca em lote não paginar a janela inteira em 1m
+                    try:
+                        advance_cursor(cur, symbol, side, entry, target, stop, end_eval, now_ms)
+                    except Exception as e:
+                        log_event("erro_piramide", {"symbol": symbol, "erro": str(e)})
+                groups.setdefault(symbol, []).append({
+                    "cur": cur, "side": side, "entry": entry, "target": target, "stop": stop,
+                    "end_eval": end_eval,
+                })
+
+            windows = {sym: w for sym, items in groups.items() if (w := batch_window(items)) is not None}
+            klines_pref, lat_sym_ms, prices_fallback, prefetch_errors = prefetch_market_data(
+                windows, sorted(price_syms), int(settings["max_workers"]),
+                stream=stream if stream_live else None, now_ms=now_ms)
+            for sym, err in prefetch_errors.items():
+                log_event("erro_prefetch", {"symbol": sym, "erro": err})
+
+            # 3) avaliação em lote: todos os sinais de um símbolo numa passada sobre os dados já baixados
+            batch_done: Set[str] = set()
+            if settings["batch_eval"]:
+                for symbol, items in groups.items():
+                    if symbol in windows and symbol not in klines_pref:
+                        continue  # falhou a pré-busca: cai para a avaliação por sinal no loop abaixo
+                    if symbol in klines_pref:
+                        advance_cursors_batch(symbol, items, klines_pref[symbol], now_ms)
+                    batch_done.add(symbol)
+
+            def spark_for(symbol: str) -> str:
+                if not enable_spark:
+                    return ""
+                try:
+                    return spark_html(symbol, spark_minutes, now_ms)
+                except Exception as e:
+                    log_event("erro_spark", {"symbol": symbol, "erro": str(e)})
+                    return ""
+
+            for r in watch:
+                symbol, side, key = r.symbol, r.side, r.key
+
+                # Validação estrutural (feita ao compilar o sinal)
+                if not r.ok:
+                    s, msg = r.as_dict(), r.msg
+                    rows.append({
+                        "symbol": symbol, "side": side, "status": ST_INVALIDA,
+                        "live_pnl_pct": None, "live_price": None,
+                        "entry": s.get("entry"), "target": s.get("target"), "stop_loss": s.get("stop_loss"),
+                        "entrada_datahora": s.get("entrada_datahora"), "saida_datahora": s.get("saida_datahora"),
+                        "detalhe": msg, "spark": ""
+                    })
+                    invalid_hits[key] = invalid_hits.get(key, 0) + 1
+
+                    symbol_ok = (symbol in exchange_syms) if exchange_syms else True
+                    val_errors = map_validation_errors(False, msg or "invalid", symbol_ok, price_available=False)
+                    audit_rec = build_audit_record(
+                        APP_DIR, s,
+                        model_version=MODEL_VERSION, prompt_id=PROMPT_ID,
+                        source={"type":"json","origin_id":"watchlist"},
+                        validation_errors=val_errors,
+                        symbol_exists=symbol_ok,
+                        numeric_ok=(E_NUM not in val_errors),
+                        date_ok=(E_DATE not in val_errors),
+                        rule_ok=(E_RULE_BUY not in val_errors and E_RULE_SELL not in val_errors),
+                        price_source=None, live_price=None, pnl_pct_live=None,
+                        verdict_state="LIVE", verdict_result=None,
+                        price_exit=None, pnl_pct_final=None,
+                        latency_ms={"batch_prices": lat_batch_ms}
+                    )
+                    audit_failure(APP_DIR, audit_rec)
+                    continue
+
+                entry, target, stop = r.entry, r.target, r.stop
+                start_ms, end_ms = r.start_ms, r.end_ms
+
+                # Validação de símbolo
+                if exchange_syms and symbol not in exchange_syms:
+                    rows.append({
+                        "symbol": symbol, "side": side, "status": ST_INVALIDA,
+                        "live_pnl_pct": None, "live_price": None,
+                        "entry": entry, "target": target, "stop_loss": stop,
+                        "entrada_datahora": r.entrada, "saida_datahora": r.saida,
+                        "detalhe": "Símbolo inexistente na Binance", "spark": ""
+                    })
+                    invalid_hits[key] = invalid_hits.get(key, 0) + 1
+
+                    val_errors = [E_SYMBOL]
+                    audit_rec = build_audit_record(
+                        APP_DIR, r.as_dict(),
+                        model_version=MODEL_VERSION, prompt_id=PROMPT_ID,
+                        source={"type":"json","origin_id":"watchlist"},
+                        validation_errors=val_errors,
+                        symbol_exists=False, numeric_ok=True, date_ok=True, rule_ok=True,
+                        price_source=None, live_price=None, pnl_pct_live=None,
+                        verdict_state="LIVE", verdict_result=None,
+                        price_exit=None, pnl_pct_final=None,
+                        latency_ms={"batch_prices": lat_batch_ms}
+                    )
+                    audit_failure(APP_DIR, audit_rec)
+                    continue
+
+                # Preço ao vivo (fallback já tentado em lote na pré-busca)
+                live_price = prices_map.get(symbol, prices_fallback.get(symbol))
+
+                # ===== Estado + gatilho entry =====
+                end_eval = min(now_ms, end_ms)
+
+                # Antes da janela -> AGENDADO
+                if now_ms < start_ms:
+                    rows.append({
+                        "symbol": symbol, "side": side, "status": ST_AGENDADO,
+                        "live_pnl_pct": None, "live_price": live_price,
+                        "entry": entry, "target": target, "stop_loss": stop,
+                        "entrada_datahora": r.entrada, "saida_datahora": r.saida,
+                        "alvo_bateu_ate_agora": False, "stop_bateu_ate_agora": False,
+                        "spark": ""
+                    })
+                    continue
+
+                # Avança o cursor só sobre os candles fechados desde o último ciclo
+                cur = cursor_for(cursors, key, r.fingerprint(), start_ms)
+                if symbol in batch_done:
+                    lat_k_ms = lat_sym_ms.get(symbol, 0)
+                else:
+                    cur, lat_k_ms = timed_advance_cursor(cur, symbol, side, entry, target, stop, end_eval, now_ms)
+                entry_ok = cur["entry_hit_ms"] is not None
+                last_close_calc = cur["last_close"]
+
+                # Não bateu a entry e ainda não terminou -> ARMADO
+                if (not entry_ok) and (now_ms < end_ms):
+                    if key in invalid_hits: invalid_hits[key] = 0
+                    rows.append({
+                        "symbol": symbol, "side": side, "status": ST_ARMADO,
+                        "live_pnl_pct": None,
+                        "live_price": live_price if live_price is not None else last_close_calc,
+                        "entry": entry, "target": target, "stop_loss": stop,
+                        "entrada_datahora": r.entrada, "saida_datahora": r.saida,
+                        "alvo_bateu_ate_agora": False, "stop_bateu_ate_agora": False,
+                        "spark": spark_for(symbol)
+                    })
+                    continue
+
+                # Entrou e janela ainda ativa -> AO_VIVO (targets/stops a partir da entrada)
+                if entry_ok and now_ms < end_ms:
+                    bateu_alvo, bateu_stop = cur["bateu_alvo"], cur["bateu_stop"]
+                    last_ref_price = live_price if live_price is not None else last_close_calc
+                    pnl = compute_live_pnl(side, entry, last_ref_price)
+                    rows.append({
+                        "symbol": symbol, "side": side, "status": ST_AO_VIVO,
+                        "live_pnl_pct": clean_pct(pnl),
+                        "live_price": last_ref_price,
+                        "entry": entry, "target": target, "stop_loss": stop,
+                        "entrada_datahora": r.entrada, "saida_datahora": r.saida,
+                        "alvo_bateu_ate_agora": bateu_alvo, "stop_bateu_ate_agora": bateu_stop,
+                        "spark": spark_for(symbol)
+                    })
+
+                    price_source = prices_src if (symbol in prices_map) else ("fallback" if live_price is not None else ("kline_proxy" if last_close_calc is not None else None))
+                    pnl_val = None if pnl is None or (isinstance(pnl, float) and math.isnan(pnl)) else float(pnl)
+                    audit_rec = build_audit_record(
+                        APP_DIR, r.as_dict(),
+                        model_version=MODEL_VERSION, prompt_id=PROMPT_ID,
+                        source={"type":"json","origin_id":"watchlist"},
+                        validation_errors=[],
+                        symbol_exists=(symbol in exchange_syms) if exchange_syms else None,
+                        numeric_ok=True, date_ok=True, rule_ok=True,
+                        price_source=price_source, live_price=last_ref_price, pnl_pct_live=pnl_val,
+                        verdict_state="LIVE", verdict_result=None,
+                        price_exit=None, pnl_pct_final=None,
+                        latency_ms={"batch_prices": lat_batch_ms, "klines": lat_k_ms}
+                    )
+                    audit_live(APP_DIR, key, audit_rec)
+                    continue
+
+                # Janela encerrou -> FINALIZADO
+                if not entry_ok and now_ms >= end_ms:
+                    rows.append({
+                        "symbol": symbol, "side": side, "status": ST_TIMEOUT_SEM,
+                        "live_pnl_pct": None, "live_price": None,
+                        "entry": entry, "target": target, "stop_loss": stop,
+                        "entrada_datahora": r.entrada, "saida_datahora": r.saida,
+                        "alvo_bateu_ate_agora": False, "stop_bateu_ate_agora": False,
+                        "spark": ""
+                    })
+                    finalized_records.append({
+                        **r.as_dict(),
+                        "status_final": "TIMEOUT_SEM_ENTRADA",
+                        "preco_saida": None,
+                        "lucro_pct": None,
+                        "bateu_alvo": False,
+                        "bateu_stop": False,
+                        "fechado_em": ms_to_iso(end_ms)
+                    })
+                    continue
+
+                bateu_alvo, bateu_stop = cur["bateu_alvo"], cur["bateu_stop"]
+                preco_exec, last_close_end = cur["preco_exec"], cur["last_close"]
+
+                if bateu_alvo or bateu_stop:
+                    status_final = ST_ACERTOU if bateu_alvo else ST_ERROU
+                    preco_saida = preco_exec
+                else:
+                    status_final = ST_TIMEOUT
+                    preco_saida = last_close_end
+                if preco_saida is None:
+                    lucro = None
+                elif side == "BUY":
+                    lucro = ((preco_saida - entry) / entry) * 100
+                else:
+                    lucro = ((entry - preco_saida) / entry) * 100
+
+                lucro = clean_pct(lucro)
+
+                rows.append({
+                    "symbol": symbol, "side": side, "status": status_final,
+                    "live_pnl_pct": None, "live_price": None,
+                    "entry": entry, "target": target, "stop_loss": stop,
+                    "entrada_datahora": r.entrada, "saida_datahora": r.saida,
+                    "alvo_bateu_ate_agora": bateu_alvo, "stop_bateu_ate_agora": bateu_stop,
+                    "preco_saida": preco_saida, "lucro_pct": lucro,
+                    "spark": ""
+                })
+
+                audit_rec = build_audit_record(
+                    APP_DIR, r.as_dict(),
+                    model_version=MODEL_VERSION, prompt_id=PROMPT_ID,
+                    source={"type":"json","origin_id":"watchlist"},
+                    validation_errors=[],
+                    symbol_exists=(symbol in exchange_syms) if exchange_syms else None,
+                    numeric_ok=True, date_ok=True, rule_ok=True,
+                    price_source="klines", live_price=None, pnl_pct_live=None,
+                    verdict_state="FINAL",
+                    verdict_result=("ACERTOU" if status_final == ST_ACERTOU else ("ERROU" if status_final == ST_ERROU else "TIMEOUT")),
+                    price_exit=preco_saida, pnl_pct_final=lucro,
+                    latency_ms={"batch_prices": lat_batch_ms, "klines": lat_k_ms}
+                )
+                audit_log(APP_DIR, audit_rec)
+
+                finalized_records.append({
+                    **r.as_dict(),
+                    "status_final": status_final,
+                    "preco_saida": preco_saida,
+                    "lucro_pct": lucro,
+                    "bateu_alvo": bateu_alvo,
+                    "bateu_stop": bateu_stop,
+                    "fechado_em": ms_to_iso(end_ms)
+                })
+
+            # Persistência do histórico + limpeza de finalizados
+            if finalized_records:
+                get_hist_log().append(finalized_records)
+                keys_to_remove = {signal_tuple(x) for x in finalized_records}
+                store.close(keys_to_remove, STATUS_FINALIZADO)
+                drop_cursors(cursors, (f"{k[0]}|{k[1]}|{k[2]}" for k in keys_to_remove))
+                messages.append({"level": "success", "text": f"{len(finalized_records)} trade(s) finalizado(s) → enviados ao histórico."})
+
+            # PRUNE inválidos reincidentes
+            self.prune_watchlist(watch, now_ms, threshold=2)
+            # relê: a sidebar pode ter adicionado sinais durante o ciclo
+            watch = store.active_records(compile_signal)
+
+        # cursores de sinais que saíram do watchlist (limpeza, remoção manual)
+        live_keys = {r.key for r in watch}
+        drop_cursors(cursors, [k for k in list(cursors) if k not in live_keys])
+        save_cursors(cursors)
+
+        self.cycles += 1
+        rows = order_rows(rows)
+        snapshot = {
+            "now_ms": now_ms,
+            "generated_at": ms_to_iso(now_ms),
+            "cycle": self.cycles,
+            "cycle_ms": int((perf_counter() - t_cycle) * 1000),
+            "watch_count": len(watch),
+            "rows": rows,
+            "kpis": compute_kpis(rows),
+            "finalized": finalized_records,
+            "messages": messages,
+            "stream_live": stream_live,
+            "settings": settings,
+        }
+        save_json_atomic(self.snapshot_path, snapshot)
+        return snapshot
+
+
+# um avaliador por processo (a thread do Streamlit sobrevive aos reruns)
+_evaluator: Optional[Evaluator] = None
+_evaluator_guard = threading.Lock()
+
+
+def get_evaluator() -> Evaluator:
+    global _evaluator
+    with _evaluator_guard:
+        if _evaluator is None:
+            _evaluator = Evaluator()
+        return _evaluator
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Avaliador headless do watchlist (publica data/snapshot.json).")
+    ap.add_argument("--once", action="store_true", help="roda um ciclo e sai")
+    args = ap.parse_args(argv)
+    ev = get_evaluator()
+    if args.once:
+        snap = ev.run_cycle(load_settings())
+        print(f"[evaluator] {len(snap['rows'])} linha(s) em {snap['cycle_ms']} ms → {SNAPSHOT_PATH}")
+        return 0
+    print(f"[evaluator] rodando (configurações em {SETTINGS_PATH}); Ctrl+C para sair")
+    try:
+        ev.run_forever()
+    except KeyboardInterrupt:
+        ev.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# first_touch.py
+# Motor vetorizado (NumPy) de "primeiro toque" em entry / alvo / stop.
+#
+# Substitui os loops df.iterrows() candle a candle. Mesma semântica de antes:
+#   - entry: primeiro candle com low <= entry <= high
+#   - saída: primeiro candle que toca alvo OU stop; se o mesmo candle toca os dois,
+#     o STOP tem prioridade (BUY: low <= stop antes de high >= target; SELL invertido);
+#     quem chama pode desempatar esses candles com dado mais fino (drill_down.py)
+#   - com entry informada, a saída só é procurada a partir do candle SEGUINTE ao da entry
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+
+class Touch(NamedTuple):
+    entry_idx: Optional[int]   # índice do candle que tocou a entry (None = não tocou)
+    exit_idx: Optional[int]    # índice do candle que tocou alvo/stop (None = não tocou)
+    hit_target: bool
+    hit_stop: bool
+
+
+def first_true(mask: np.ndarray) -> Optional[int]:
+    if mask.size == 0:
+        return None
+    i = int(np.argmax(mask))
+    return i if mask[i] else None
+
+
+def exit_masks(high: np.ndarray, low: np.ndarray, side: str, target: float, stop: float):
+    if side == "BUY":
+        return high >= target, low <= stop
+    return low <= target, high >= stop
+
+
+def first_touch(high, low, side: str, entry: Optional[float] = None,
+                target: Optional[float] = None, stop: Optional[float] = None) -> Touch:
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+
+    entry_idx = None
+    from_idx = 0
+    if entry is not None:
+        entry_idx = first_true((low <= entry) & (entry <= high))
+        if entry_idx is None or target is None or stop is None:
+            return Touch(entry_idx, None, False, False)
+        from_idx = entry_idx + 1
+    elif target is None or stop is None:
+        return Touch(None, None, False, False)
+
+    tgt, stp = exit_masks(high[from_idx:], low[from_idx:], side, target, stop)
+    i = first_true(tgt | stp)
+    if i is None:
+        return Touch(entry_idx, None, False, False)
+    # mesmo candle tocou os dois -> stop primeiro (conservador)
+    hit_stop = bool(stp[i])
+    return Touch(entry_idx, from_idx + i, not hit_stop, hit_stop)
+
+
+def first_true_rows(mask: np.ndarray) -> np.ndarray:
+    """Primeiro índice True de cada linha (-1 quando a linha não tem True)."""
+    if mask.shape[1] == 0:
+        return np.full(mask.shape[0], -1, dtype=np.int64)
+    i = mask.argmax(axis=1)
+    hit = mask[np.arange(mask.shape[0]), i]
+    return np.where(hit, i, -1).astype(np.int64)
+
+
+# limite de células (sinais x candles) por bloco, para não estourar memória
+BATCH_CELLS = 4_000_000
+
+
+def first_touch_batch(high, low, is_buy, entries, targets, stops, lo, hi, need_entry):
+    """
+    Versão em lote de first_touch: K sinais do MESMO símbolo sobre arrays compartilhados.
+
+    Cada sinal k olha só os candles [lo[k], hi[k]). Com need_entry[k] a entry é procurada
+    primeiro e a saída a partir do candle seguinte; sem need_entry (entry já aconteceu
+    em ciclo anterior) procura-se só a saída em [lo[k], hi[k]).
+    Retorna (entry_idx, exit_idx, hit_target, hit_stop), com -1 quando não tocou.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    is_buy = np.asarray(is_buy, dtype=bool)
+    entries, targets, stops = (np.asarray(x, dtype=np.float64) for x in (entries, targets, stops))
+    lo, hi = np.asarray(lo, dtype=np.int64), np.asarray(hi, dtype=np.int64)
+    need_entry = np.asarray(need_entry, dtype=bool)
+
+    K, M = len(entries), len(high)
+    entry_idx = np.full(K, -1, dtype=np.int64)
+    exit_idx = np.full(K, -1, dtype=np.int64)
+    hit_stop = np.zeros(K, dtype=bool)
+    if K == 0 or M == 0:
+        return entry_idx, exit_idx, np.zeros(K, dtype=bool), hit_stop
+
+    idx = np.arange(M)
+    step = max(1, BATCH_CELLS // M)
+    for k0 in range(0, K, step):
+        sl = slice(k0, k0 + step)
+        l, h = lo[sl, None], hi[sl, None]
+        e = entries[sl, None]
+        in_win = (idx >= l) & (idx < h)
+        e_i = first_true_rows(in_win & (low <= e) & (e <= high))
+        e_i = np.where(need_entry[sl], e_i, -1)
+
+        ex_from = np.where(need_entry[sl], np.where(e_i >= 0, e_i + 1, hi[sl]), lo[sl])
+        buy = is_buy[sl, None]
+        t, s = targets[sl, None], stops[sl, None]
+        tgt = np.where(buy, high >= t, low <= t)
+        stp = np.where(buy, low <= s, high >= s)
+        ex_win = (idx >= ex_from[:, None]) & (idx < h)
+        x_i = first_true_rows(ex_win & (tgt | stp))
+
+        rows = np.arange(x_i.shape[0])
+        entry_idx[sl] = e_i
+        exit_idx[sl] = x_i
+        # mesmo candle tocou os dois -> stop primeiro (conservador)
+        hit_stop[sl] = (x_i >= 0) & stp[rows, np.maximum(x_i, 0)]
+    hit_target = (exit_idx >= 0) & ~hit_stop
+    return entry_idx, exit_idx, hit_target, hit_stop
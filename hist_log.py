@@ -0,0 +1,261 @@
+# hist_log.py
+# Histórico de trades finalizados como log append-only segmentado (data/historico/).
+#
+# - segmentos JSONL (seg-000001.jsonl, ...): finalizar só acrescenta as linhas novas
+# - manifest.json: por segmento, nº de registros e faixa de fechado_em; total geral
+# - leitores abrem só os segmentos que precisam (os mais recentes, ou uma faixa de datas)
+# - compactação periódica dos segmentos fechados: remove duplicados (symbol, entrada,
+#   saída — o último vence), ordena por fechado_em e reempacota em segmentos cheios
+# - na primeira abertura importa o historico.json antigo (o arquivo fica intocado)
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+HIST_DIR = os.path.join(APP_DIR, "data", "historico")
+LEGACY_JSON_PATH = os.path.join(APP_DIR, "historico.json")
+
+SEGMENT_MAX_RECORDS = 5000     # segmento ativo é fechado ao chegar nisso
+COMPACT_EVERY = 20000          # registros acrescentados entre compactações
+LOCK_STALE_S = 30.0
+
+
+def _key(r: dict):
+    return (r.get("symbol"), r.get("entrada_datahora"), r.get("saida_datahora"))
+
+
+def _fechado(r: dict) -> str:
+    v = r.get("fechado_em")
+    return v if isinstance(v, str) else ""
+
+
+class FileLock:
+    """Lock entre processos por arquivo criado com O_EXCL (funciona no Windows também)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > LOCK_STALE_S:
+                        os.remove(self.path)   # dono morreu no meio: lock velho
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.02)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class HistLog:
+    def __init__(self, directory: str = HIST_DIR, legacy_json: Optional[str] = LEGACY_JSON_PATH):
+        self.dir = directory
+        self.legacy_json = legacy_json
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._guard = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            m = self._read_manifest()
+            if not m.get("legacy_imported"):
+                self._import_legacy(m)
+
+    # ----- manifest -----
+    @contextmanager
+    def _locked(self):
+        # threads do processo + outros processos (avaliador externo, app de auditoria)
+        with self._guard, FileLock(os.path.join(self.dir, ".lock")):
+            yield
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                m = json.load(f)
+            if isinstance(m, dict):
+                return m
+        except Exception:
+            pass
+        return {"version": 1, "next_seq": 1, "segments": [], "total": 0, "since_compact": 0}
+
+    def _write_manifest(self, m: Dict) -> None:
+        tmp = f"{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(m, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def _new_segment(self, m: Dict) -> Dict:
+        seg = {"name": f"seg-{m['next_seq']:06d}.jsonl", "count": 0, "min_fechado": None,
+               "max_fechado": None, "sealed": False}
+        m["next_seq"] += 1
+        m["segments"].append(seg)
+        try:
+            os.remove(self._seg_path(seg))   # sobra de uma compactação interrompida
+        except OSError:
+            pass
+        return seg
+
+    def _seg_path(self, seg: Dict) -> str:
+        return os.path.join(self.dir, seg["name"])
+
+    # ----- escrita -----
+    def _append_locked(self, m: Dict, records: List[dict]) -> None:
+        i = 0
+        while i < len(records):
+            seg = m["segments"][-1] if m["segments"] and not m["segments"][-1]["sealed"] else self._new_segment(m)
+            room = SEGMENT_MAX_RECORDS - seg["count"]
+            chunk = records[i:i + room]
+            with open(self._seg_path(seg), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk))
+            fech = [x for x in (_fechado(r) for r in chunk) if x]
+            if fech:
+                seg["min_fechado"] = min([x for x in (seg["min_fechado"], min(fech)) if x])
+                seg["max_fechado"] = max([x for x in (seg["max_fechado"], max(fech)) if x])
+            seg["count"] += len(chunk)
+            if seg["count"] >= SEGMENT_MAX_RECORDS:
+                seg["sealed"] = True
+            i += len(chunk)
+        m["total"] = sum(s["count"] for s in m["segments"])
+        m["since_compact"] = m.get("since_compact", 0) + len(records)
+
+    def append(self, records: Iterable[dict]) -> int:
+        """Acrescenta registros finalizados; custo proporcional só ao que entra."""
+        records = [r for r in records if isinstance(r, dict)]
+        if not records:
+            return 0
+        with self._locked():
+            m = self._read_manifest()
+            self._append_locked(m, records)
+            if m["since_compact"] >= COMPACT_EVERY:
+                self._compact_locked(m)
+            self._write_manifest(m)
+        return len(records)
+
+    def _import_legacy(self, m: Dict) -> None:
+        recs: List[dict] = []
+        if self.legacy_json and os.path.isfile(self.legacy_json):
+            try:
+                with open(self.legacy_json, "r", encoding="utf-8") as f:
+                    raw = re.sub(r'\bNaN\b', 'null', f.read())   # mesmo tratamento do utils/repair_hist.py
+                data = json.loads(raw)
+                recs = [r for r in data if isinstance(r, dict)] if isinstance(data, list) else []
+            except Exception:
+                recs = []
+        if recs:
+            self._append_locked(m, recs)
+        m["legacy_imported"] = True
+        self._write_manifest(m)
+
+    # ----- compactação -----
+    def _compact_locked(self, m: Dict) -> None:
+        sealed = [s for s in m["segments"] if s["sealed"]]
+        if not sealed:
+            m["since_compact"] = 0
+            return
+        latest: Dict = {}
+        for seg in sealed:
+            for r in self._read_segment(seg):
+                latest.pop(_key(r), None)   # reinsere no fim: o último registro vence
+                latest[_key(r)] = r
+        recs = sorted(latest.values(), key=_fechado)
+        active = [s for s in m["segments"] if not s["sealed"]]
+        m["segments"] = []
+        full = len(recs) - len(recs) % SEGMENT_MAX_RECORDS
+        # só segmentos cheios viram sealed; a sobra vai para o início do ativo
+        self._append_locked(m, recs[:full])
+        rest = recs[full:]
+        for s in active:
+            rest.extend(self._read_segment(s))
+        old = sealed + active
+        if rest:
+            self._append_locked(m, rest)
+        m["since_compact"] = 0
+        self._write_manifest(m)
+        keep = {s["name"] for s in m["segments"]}
+        for s in old:
+            if s["name"] not in keep:
+                try:
+                    os.remove(self._seg_path(s))
+                except OSError:
+                    pass
+
+    def compact(self) -> None:
+        with self._locked():
+            m = self._read_manifest()
+            self._compact_locked(m)
+            self._write_manifest(m)
+
+    # ----- leitura -----
+    def _read_segment(self, seg: Dict) -> List[dict]:
+        out = []
+        try:
+            with open(self._seg_path(seg), "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        out.append(json.loads(line))
+                    except Exception:
+                        continue   # linha truncada (queda no meio de um append)
+        except FileNotFoundError:
+            pass
+        return out
+
+    def manifest(self) -> Dict:
+        return self._read_manifest()
+
+    def count(self) -> int:
+        return int(self._read_manifest().get("total", 0))
+
+    def recent(self, limit: int) -> List[dict]:
+        """Últimos `limit` registros acrescentados, lendo só os segmentos do fim."""
+        out: List[dict] = []
+        for seg in reversed(self._read_manifest()["segments"]):
+            out = self._read_segment(seg) + out
+            if len(out) >= limit:
+                break
+        return out[-limit:] if limit else []
+
+    def iter_records(self, since: Optional[str] = None, until: Optional[str] = None) -> Iterator[dict]:
+        """Registros com fechado_em em [since, until] (strings 'YYYY-MM-DD HH:MM:SS UTC');
+        segmentos fora da faixa nem são abertos."""
+        for seg in self._read_manifest()["segments"]:
+            if since and seg.get("max_fechado") and seg["max_fechado"] < since:
+                continue
+            if until and seg.get("min_fechado") and seg["min_fechado"] > until:
+                continue
+            for r in self._read_segment(seg):
+                f = _fechado(r)
+                if (since and f and f < since) or (until and f and f > until):
+                    continue
+                yield r
+
+    def load_all(self) -> List[dict]:
+        return list(self.iter_records())
+
+
+# um log por diretório, compartilhado pelo processo
+_logs: Dict[str, HistLog] = {}
+_logs_guard = threading.Lock()
+
+
+def get_hist_log(directory: str = HIST_DIR) -> HistLog:
+    with _logs_guard:
+        h = _logs.get(directory)
+        if h is None:
+            h = _logs[directory] = HistLog(directory)
+        return h
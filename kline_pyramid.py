@@ -0,0 +1,99 @@
+# kline_pyramid.py
+# Pirâmide de resolução para janelas longas (semanas, meses, 1 ano de sinal).
+#
+# Em vez de paginar a janela inteira em 1m (~525 mil candles por ano), desce por níveis:
+#   1d (1 request por ano) -> 1h só nos dias candidatos -> 1m só nas horas candidatas
+# Um bucket grosso é candidato quando o high/low dele PODE conter o toque procurado
+# (entry dentro do range, alvo/stop alcançados). Como high = máx e low = mín dos candles
+# finos do bucket, um bucket descartado não tem nenhum candle de 1m que toque — o veredito
+# é o mesmo da varredura em 1m; só o primeiro candidato que confirma em 1m é lido inteiro.
+#
+# fetch(symbol, start_ms, end_ms, interval) -> DataFrame de klines (market.get_klines): cada
+# nível passa pelo store local como qualquer outra leitura. Não serve para o modo offline
+# (read_stored): lá os níveis grossos só existem se alguém os baixou, e o 1m já é local.
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from kline_store import INTERVAL_MS
+from first_touch import first_true, exit_masks
+
+PYRAMID_LEVELS = ("1d", "1h")        # níveis grossos, do maior para o menor; o fino é 1m
+PYRAMID_MIN_MS = 3 * 86_400_000      # janelas mais curtas que isso vão direto em 1m
+FINE = "1m"
+
+Fetcher = Callable[[str, int, int, str], pd.DataFrame]
+Touches = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def is_long(start_ms: int, end_ms: int) -> bool:
+    return end_ms - start_ms > PYRAMID_MIN_MS
+
+
+def find_first(fetch: Fetcher, symbol: str, start_ms: int, end_ms: int, touches: Touches,
+               levels: Sequence[str] = PYRAMID_LEVELS) -> Optional[Tuple[pd.DataFrame, int]]:
+    """
+    Primeiro candle de 1m com open_time em [start_ms, end_ms] em que touches(high, low) é
+    True. Retorna (klines de 1m do bucket onde achou, índice) ou None.
+    touches precisa ser monotônico: se um candle fino toca, o grosso que o contém também.
+    """
+    if start_ms > end_ms:
+        return None
+    if not levels:
+        df = fetch(symbol, start_ms, end_ms, FINE)
+        if df.empty:
+            return None
+        i = first_true(touches(df["high"].to_numpy(float), df["low"].to_numpy(float)))
+        return None if i is None else (df, i)
+
+    iv = INTERVAL_MS[levels[0]]
+    df = fetch(symbol, start_ms - start_ms % iv, end_ms, levels[0])
+    if df.empty:
+        return None   # sem negociação na janela inteira
+    ot = df["open_time"].to_numpy(np.int64)
+    for j in np.flatnonzero(touches(df["high"].to_numpy(float), df["low"].to_numpy(float))):
+        hit = find_first(fetch, symbol, max(start_ms, int(ot[j])), min(end_ms, int(ot[j]) + iv - 1),
+                         touches, levels[1:])
+        if hit is not None:
+            return hit
+    return None
+
+
+def find_entry(fetch: Fetcher, symbol: str, entry: float, start_ms: int, end_ms: int,
+               levels: Sequence[str] = PYRAMID_LEVELS) -> Optional[Tuple[pd.DataFrame, int]]:
+    return find_first(fetch, symbol, start_ms, end_ms, lambda h, l: (l <= entry) & (entry <= h), levels)
+
+
+def find_exit(fetch: Fetcher, symbol: str, side: str, target: float, stop: float, start_ms: int,
+              end_ms: int, levels: Sequence[str] = PYRAMID_LEVELS) -> Optional[Tuple[pd.DataFrame, int, bool]]:
+    """Primeiro candle que toca alvo ou stop: (klines, índice, hit_stop). Os dois -> stop."""
+    def touches(h, l):
+        tgt, stp = exit_masks(h, l, side, target, stop)
+        return tgt | stp
+    hit = find_first(fetch, symbol, start_ms, end_ms, touches, levels)
+    if hit is None:
+        return None
+    df, i = hit
+    _, stp = exit_masks(df["high"].to_numpy(float)[i:i + 1], df["low"].to_numpy(float)[i:i + 1],
+                        side, target, stop)
+    return df, i, bool(stp[0])
+
+
+def last_candle(fetch: Fetcher, symbol: str, start_ms: int, end_ms: int,
+                levels: Sequence[str] = PYRAMID_LEVELS) -> Optional[pd.Series]:
+    """Último candle de 1m da janela (close de TIMEOUT / preço de referência), de trás para frente."""
+    if start_ms > end_ms:
+        return None
+    if not levels:
+        df = fetch(symbol, start_ms, end_ms, FINE)
+        return None if df.empty else df.iloc[-1]
+    iv = INTERVAL_MS[levels[0]]
+    df = fetch(symbol, start_ms - start_ms % iv, end_ms, levels[0])
+    if df.empty:
+        return None
+    for t in df["open_time"].to_numpy(np.int64)[::-1]:
+        row = last_candle(fetch, symbol, max(start_ms, int(t)), min(end_ms, int(t) + iv - 1), levels[1:])
+        if row is not None:
+            return row
+    return None
@@ -0,0 +1,342 @@
+# kline_store.py
+# Armazenamento local (append-only) de candles da Binance, por símbolo/intervalo.
+#
+# Layout em disco:
+#   data/klines/<interval>/<SYMBOL>/index.json         -> cobertura por chunk
+#   data/klines/<interval>/<SYMBOL>/<chunk_start>.f64  -> 4 colunas (open/high/low/close)
+#
+# Cada chunk cobre CHUNK_ROWS candles alinhados ao epoch (1m => 1 dia UTC). O slot de
+# cada candle é fixo: (open_time - chunk_start) // interval_ms, então open_time e
+# close_time não precisam ser gravados. Slots sem candle (gap da exchange) ficam NaN.
+# Só candles FECHADOS são persistidos; o candle em formação vem sempre da rede. "Fechado"
+# é medido com folga (CLOSED_MARGIN_MS) sobre o relógio do servidor quando quem chama o
+# informa (MarketClient.server_now_ms): relógio local adiantado não grava candle aberto
+# como coberto.
+import os
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(APP_DIR, "data", "klines")
+
+CHUNK_ROWS = 1440
+N_COLS = 4  # open, high, low, close
+CLOSED_MARGIN_MS = 5_000   # candle só conta como fechado se close_time < agora - margem
+KLINE_COLUMNS = ["open_time", "open", "high", "low", "close", "close_time"]
+
+INTERVAL_MS = {
+    "1s": 1_000,
+    "1m": 60_000,
+    "3m": 180_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1h": 3_600_000,
+    "2h": 7_200_000,
+    "4h": 14_400_000,
+    "1d": 86_400_000,
+}
+
+# fetch_remote(symbol, start_ms, end_ms, interval) -> linhas cruas do /api/v3/klines
+RemoteFetcher = Callable[[str, int, int, str], List[list]]
+
+_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(symbol: str, interval: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault((symbol, interval), threading.Lock())
+
+
+def _sym_dir(symbol: str, interval: str) -> str:
+    return os.path.join(STORE_DIR, interval, symbol.upper())
+
+
+def _chunk_ms(interval: str) -> int:
+    return INTERVAL_MS[interval] * CHUNK_ROWS
+
+
+def _align(ms: int, step: int) -> int:
+    return ms - (ms % step)
+
+
+def empty_klines() -> pd.DataFrame:
+    return pd.DataFrame({
+        "open_time": np.empty(0, dtype=np.int64),
+        "open": np.empty(0), "high": np.empty(0), "low": np.empty(0), "close": np.empty(0),
+        "close_time": np.empty(0, dtype=np.int64),
+    })
+
+
+# =========================
+# Índice de cobertura
+# =========================
+def _read_index(symbol: str, interval: str) -> Dict[int, List[int]]:
+    path = os.path.join(_sym_dir(symbol, interval), "index.json")
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        return {int(k): [int(v[0]), int(v[1])] for k, v in raw.items()}
+    except Exception:
+        # índice corrompido: recomeça (os dados serão baixados de novo)
+        return {}
+
+
+def _write_index(symbol: str, interval: str, index: Dict[int, List[int]]) -> None:
+    d = _sym_dir(symbol, interval)
+    os.makedirs(d, exist_ok=True)
+    path = os.path.join(d, "index.json")
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({str(k): v for k, v in sorted(index.items())}, f)
+    os.replace(tmp, path)
+
+
+# =========================
+# Chunks (memmap colunar)
+# =========================
+def _chunk_path(symbol: str, interval: str, chunk_start: int) -> str:
+    return os.path.join(_sym_dir(symbol, interval), f"{chunk_start}.f64")
+
+
+def _ensure_chunk(path: str) -> None:
+    if os.path.isfile(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    np.full((N_COLS, CHUNK_ROWS), np.nan, dtype=np.float64).tofile(tmp)
+    try:
+        # link falha se outro processo já criou o chunk: nunca sobrescreve dados
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp)
+
+
+def _open_chunk(path: str, mode: str) -> np.memmap:
+    return np.memmap(path, dtype=np.float64, mode=mode, shape=(N_COLS, CHUNK_ROWS))
+
+
+def _write_rows(symbol: str, interval: str, rows: List[list]) -> None:
+    """Grava candles (formato cru da Binance) nos slots dos seus chunks."""
+    if not rows:
+        return
+    iv, cms = INTERVAL_MS[interval], _chunk_ms(interval)
+    arr = np.array([[r[0], r[1], r[2], r[3], r[4]] for r in rows], dtype=np.float64)
+    open_t = arr[:, 0].astype(np.int64)
+    chunk_of = open_t - (open_t % cms)
+    for cs in np.unique(chunk_of):
+        sel = chunk_of == cs
+        path = _chunk_path(symbol, interval, int(cs))
+        _ensure_chunk(path)
+        mm = _open_chunk(path, "r+")
+        slots = (open_t[sel] - cs) // iv
+        mm[:, slots] = arr[sel, 1:].T
+        mm.flush()
+        del mm
+
+
+def _read_rows(symbol: str, interval: str, start_ms: int, end_ms: int,
+               index: Dict[int, List[int]]) -> pd.DataFrame:
+    """Lê os candles armazenados com open_time em [start_ms, end_ms]."""
+    iv, cms = INTERVAL_MS[interval], _chunk_ms(interval)
+    parts_t, parts_v = [], []
+    cs = _align(start_ms, cms)
+    while cs <= end_ms:
+        cov = index.get(cs)
+        path = _chunk_path(symbol, interval, cs)
+        if cov and os.path.isfile(path):
+            lo = max(start_ms, cov[0])
+            hi = min(end_ms, cov[1] - 1)
+            if lo <= hi:
+                s0 = (lo - cs) // iv
+                s1 = (hi - cs) // iv + 1
+                if s0 < s1:
+                    mm = _open_chunk(path, "r")
+                    vals = np.array(mm[:, s0:s1])
+                    del mm
+                    parts_t.append(cs + np.arange(s0, s1, dtype=np.int64) * iv)
+                    parts_v.append(vals)
+        cs += cms
+    if not parts_t:
+        return empty_klines()
+    t = np.concatenate(parts_t)
+    v = np.concatenate(parts_v, axis=1)
+    ok = ~np.isnan(v[0])
+    t, v = t[ok], v[:, ok]
+    return pd.DataFrame({
+        "open_time": t, "open": v[0], "high": v[1], "low": v[2], "close": v[3],
+        "close_time": t + iv - 1,
+    })
+
+
+def _missing_ranges(index: Dict[int, List[int]], start_ms: int, end_ms: int,
+                    interval: str) -> List[List[int]]:
+    """Faixas [a, b] (open_time, inclusivas) que faltam no disco para cobrir [start_ms, end_ms]."""
+    iv, cms = INTERVAL_MS[interval], _chunk_ms(interval)
+    out: List[List[int]] = []
+
+    def _add(a: int, b: int):
+        if a > b:
+            return
+        if out and out[-1][1] + iv >= a:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+
+    cs = _align(start_ms, cms)
+    while cs <= end_ms:
+        lo = max(start_ms, cs)
+        hi = min(end_ms, cs + cms - 1)
+        cov = index.get(cs)
+        if not cov:
+            _add(lo, hi)
+        else:
+            # cobertura do chunk é sempre contígua: completa cabeça e cauda
+            if lo < cov[0]:
+                _add(lo, cov[0] - 1)
+            if hi >= cov[1]:
+                _add(cov[1], hi)
+        cs += cms
+    return out
+
+
+def _mark_covered(index: Dict[int, List[int]], a: int, b_excl: int, interval: str) -> None:
+    cms = _chunk_ms(interval)
+    cs = _align(a, cms)
+    while cs < b_excl:
+        lo, hi = max(a, cs), min(b_excl, cs + cms)
+        cov = index.get(cs)
+        if cov:
+            index[cs] = [min(cov[0], lo), max(cov[1], hi)]
+        else:
+            index[cs] = [lo, hi]
+        cs += cms
+
+
+# =========================
+# API
+# =========================
+def load_klines(symbol: str, start_ms: int, end_ms: int, interval: str,
+                fetch_remote: RemoteFetcher, now_ms: Optional[int] = None) -> pd.DataFrame:
+    """
+    Candles com open_time em [start_ms, end_ms], lendo primeiro do disco.
+    Só vai à rede para o que falta (e para o candle ainda em formação).
+    now_ms: relógio de referência (de preferência o do servidor); None = relógio local.
+    """
+    symbol = symbol.upper()
+    if interval not in INTERVAL_MS:
+        # intervalo sem layout fixo: passa direto pela rede
+        return rows_to_df(fetch_remote(symbol, start_ms, end_ms, interval))
+    iv = INTERVAL_MS[interval]
+    if now_ms is None:
+        now_ms = int(pd.Timestamp.now(tz="UTC").timestamp() * 1000)
+    start_ms = _align(start_ms, iv) if start_ms % iv == 0 else _align(start_ms, iv) + iv
+    if start_ms > end_ms:
+        return empty_klines()
+
+    # último open_time de candle já fechado (close_time < now_ms - margem); o resto é "ao vivo"
+    # e fica fora da cobertura
+    closed_upto = _align(now_ms - CLOSED_MARGIN_MS, iv) - iv
+    closed_end = min(end_ms, closed_upto)
+    live_rows: List[list] = []
+
+    with _lock_for(symbol, interval):
+        index = _read_index(symbol, interval)
+        missing = _missing_ranges(index, start_ms, closed_end, interval) if start_ms <= closed_end else []
+        want_live = end_ms > closed_upto
+        # candle em formação junta-se à última faixa faltante (1 request só)
+        if want_live:
+            live_a = max(start_ms, closed_upto + iv)
+            if missing and missing[-1][1] + iv >= live_a:
+                missing[-1][1] = end_ms
+            else:
+                missing.append([live_a, end_ms])
+
+        dirty = False
+        try:
+            for a, b in missing:
+                rows = fetch_remote(symbol, a, b, interval)
+                closed = [r for r in rows if int(r[0]) <= closed_upto]
+                live_rows.extend(r for r in rows if int(r[0]) > closed_upto)
+                _write_rows(symbol, interval, closed)
+                cov_b = min(b, closed_upto)
+                if a <= cov_b:
+                    _mark_covered(index, a, _align(cov_b, iv) + iv, interval)
+                    dirty = True
+        finally:
+            # mesmo com falha de rede no meio, o que já chegou fica registrado
+            if dirty:
+                _write_index(symbol, interval, index)
+
+        df = _read_rows(symbol, interval, start_ms, closed_end, index) if start_ms <= closed_end else empty_klines()
+
+    if live_rows:
+        df = pd.concat([df, rows_to_df(live_rows)], ignore_index=True)
+    return df
+
+
+def read_stored(symbol: str, start_ms: int, end_ms: int, interval: str = "1m") -> pd.DataFrame:
+    """Só o que já está no disco (sem rede): candles cobertos com open_time em [start_ms, end_ms]."""
+    symbol = symbol.upper()
+    if interval not in INTERVAL_MS:
+        return empty_klines()
+    return _read_rows(symbol, interval, start_ms, end_ms, _read_index(symbol, interval))
+
+
+def rows_to_df(rows: List[list]) -> pd.DataFrame:
+    if not rows:
+        return empty_klines()
+    df = pd.DataFrame([r[:7] for r in rows], columns=[
+        "open_time", "open", "high", "low", "close", "volume", "close_time"
+    ])
+    df = df[KLINE_COLUMNS].copy()
+    for c in ["open", "high", "low", "close"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df["open_time"] = df["open_time"].astype(np.int64)
+    df["close_time"] = df["close_time"].astype(np.int64)
+    return df
+
+
+def append_closed(symbol: str, interval: str, rows: List[list]) -> int:
+    """
+    Grava candles FECHADOS vindos de outra fonte (ex.: stream WebSocket) e estende a
+    cobertura só onde ela continua contígua. Candle fora da sequência é gravado no slot
+    mas não marcado como coberto: a próxima leitura completa a lacuna via REST.
+    Retorna quantos candles passaram a contar como cobertos.
+    """
+    symbol = symbol.upper()
+    if interval not in INTERVAL_MS or not rows:
+        return 0
+    iv, cms = INTERVAL_MS[interval], _chunk_ms(interval)
+    rows = sorted(rows, key=lambda r: int(r[0]))
+    covered = 0
+    with _lock_for(symbol, interval):
+        index = _read_index(symbol, interval)
+        _write_rows(symbol, interval, rows)
+        for r in rows:
+            t = int(r[0])
+            cs = _align(t, cms)
+            cov = index.get(cs)
+            if cov is None:
+                index[cs] = [t, t + iv]          # cobertura do chunk começa aqui
+            elif cov[0] <= t < cov[1]:
+                continue                         # já coberto
+            elif cov[1] == t:
+                cov[1] = t + iv
+            elif cov[0] == t + iv:
+                cov[0] = t
+            else:
+                continue                         # fora da sequência: REST completa depois
+            covered += 1
+        if covered:
+            _write_index(symbol, interval, index)
+    return covered
@@ -0,0 +1,222 @@
+# market_client.py
+# Cliente único de dados de mercado (Binance Spot) para todos os scripts.
+#
+# - requests.Session com pool de conexões keep-alive (sem handshake TCP+TLS por chamada)
+# - uma política só de timeout/retry/backoff, passando pelo limitador de peso (rate_limit)
+# - preços em lote via ticker/price?symbols=[...] em vez de um request por símbolo
+# - klines paginadas; get_klines() passa pelo store local (kline_store)
+# - relógio do servidor (header Date / api/v3/time): decide que candle já fechou, mesmo
+#   com o relógio local adiantado
+import json
+import time
+from email.utils import parsedate_to_datetime
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+import pandas as pd
+from requests.adapters import HTTPAdapter
+
+from kline_store import load_klines, INTERVAL_MS
+from rate_limit import LIMITER, RateLimitBanned, request_weight, retry_after_seconds
+
+BINANCE_BASE = "https://api.binance.com"   # Spot
+DEFAULT_USER_AGENT = "Lucra/1.3 (+https://lucra.local)"
+DEFAULT_TIMEOUT = 15
+BACKOFF = [0, 0.5, 1.5]
+POOL_SIZE = 16
+KLINES_LIMIT = 1000
+PRICES_BATCH = 100   # símbolos por request em ticker/price?symbols=[...]
+CLOCK_RETRY_S = 60   # sem rede: não tenta medir o relógio do servidor a cada leitura
+
+
+class MarketClient:
+    def __init__(self, user_agent: str = DEFAULT_USER_AGENT, base_url: str = BINANCE_BASE,
+                 timeout: float = DEFAULT_TIMEOUT, pool_size: int = POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.on_event = None   # callback(tipo, payload) opcional p/ log
+        self.clock_offset_ms: Optional[int] = None   # servidor - local (None = ainda não medido)
+        self._clock_tried: Optional[float] = None
+
+    def _log(self, tipo: str, payload: dict) -> None:
+        if self.on_event:
+            try:
+                self.on_event(tipo, payload)
+            except Exception:
+                pass
+
+    # =========================
+    # Request com política única
+    # =========================
+    def request(self, method: str, path_or_url: str, **kwargs) -> requests.Response:
+        url = path_or_url if path_or_url.startswith("http") else f"{self.base_url}{path_or_url}"
+        timeout = kwargs.pop("timeout", self.timeout)
+        weight = request_weight(url, kwargs.get("params"))
+        last_exc = None
+        for i, wait in enumerate(BACKOFF, 1):
+            try:
+                # espera orçamento de peso (compartilhado por todas as sessões/threads)
+                if not LIMITER.acquire(weight, timeout=timeout):
+                    raise TimeoutError("Sem orçamento de peso na Binance (rate limit)")
+                r = self.session.request(method, url, timeout=timeout, **kwargs)
+                LIMITER.update_from_headers(r.headers)
+                self._sync_clock(r.headers)
+                if r.status_code in (418, 429):
+                    retry_s = retry_after_seconds(r.headers)
+                    LIMITER.block_for(retry_s)
+                    self._log("rate_limit", {"status": r.status_code, "retry_after": retry_s, "url": url})
+                    if r.status_code == 418:
+                        raise RateLimitBanned(f"IP banido pela Binance por {retry_s:.0f}s")
+                r.raise_for_status()
+                return r
+            except RateLimitBanned:
+                raise
+            except requests.HTTPError as e:
+                last_exc = e
+                # erro do cliente (símbolo inválido etc.): repetir não adianta
+                if e.response is not None and 400 <= e.response.status_code < 500 and e.response.status_code != 429:
+                    raise
+                if i < len(BACKOFF):
+                    time.sleep(wait)
+            except Exception as e:
+                last_exc = e
+                if i < len(BACKOFF):
+                    time.sleep(wait)
+        raise last_exc
+
+    # =========================
+    # Relógio do servidor
+    # =========================
+    def _sync_clock(self, headers) -> None:
+        # Date tem resolução de 1s e é truncado: o offset erra para trás (lado seguro)
+        try:
+            server_ms = int(parsedate_to_datetime(headers["Date"]).timestamp() * 1000)
+        except Exception:
+            return
+        self.clock_offset_ms = server_ms - int(time.time() * 1000)
+
+    def server_now_ms(self) -> int:
+        """Agora pelo relógio da Binance; mede uma vez via api/v3/time se nenhum request ainda mediu."""
+        if self.clock_offset_ms is None and (self._clock_tried is None
+                                             or time.monotonic() - self._clock_tried >= CLOCK_RETRY_S):
+            self._clock_tried = time.monotonic()
+            try:
+                t0 = int(time.time() * 1000)
+                server_ms = int(self.request("GET", "/api/v3/time").json()["serverTime"])
+                self.clock_offset_ms = server_ms - (t0 + int(time.time() * 1000)) // 2
+            except Exception:
+                pass
+        return int(time.time() * 1000) + (self.clock_offset_ms or 0)
+
+    # =========================
+    # Endpoints
+    # =========================
+    def get_exchange_universe(self) -> List[Tuple[str, str, str]]:
+        """(symbol, base, quote) de todos os pares TRADING (exchangeInfo, peso 20)."""
+        data = self.request("GET", "/api/v3/exchangeInfo").json()
+        return [(s["symbol"].upper(), s.get("baseAsset", "").upper(), s.get("quoteAsset", "").upper())
+                for s in data.get("symbols", []) if s.get("status") == "TRADING"]
+
+    def get_exchange_symbols(self) -> Set[str]:
+        return {sym for sym, _, _ in self.get_exchange_universe()}
+
+    def get_all_prices(self) -> Dict[str, float]:
+        return _parse_prices(self.request("GET", "/api/v3/ticker/price").json())
+
+    def get_price(self, symbol: str) -> Optional[float]:
+        r = self.request("GET", "/api/v3/ticker/price", params={"symbol": symbol.upper()})
+        try:
+            return float(r.json()["price"])
+        except Exception:
+            return None
+
+    def get_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Preços de vários símbolos em poucos requests (symbols=[...], em lotes)."""
+        syms = sorted({s.upper() for s in symbols if s})
+        out: Dict[str, float] = {}
+        for i in range(0, len(syms), PRICES_BATCH):
+            out.update(self._prices_batch(syms[i:i + PRICES_BATCH]))
+        return out
+
+    def _prices_batch(self, syms: List[str]) -> Dict[str, float]:
+        if not syms:
+            return {}
+        try:
+            r = self.request("GET", "/api/v3/ticker/price",
+                             params={"symbols": json.dumps(syms, separators=(",", ":"))})
+            return _parse_prices(r.json())
+        except requests.HTTPError as e:
+            # um símbolo inválido derruba o lote inteiro (400): divide e tenta de novo
+            if e.response is None or e.response.status_code != 400:
+                raise
+            if len(syms) == 1:
+                return {}
+            mid = len(syms) // 2
+            return {**self._prices_batch(syms[:mid]), **self._prices_batch(syms[mid:])}
+
+    def get_klines_raw(self, symbol: str, start_ms: int, end_ms: int, interval: str = "1m") -> List[list]:
+        """Linhas cruas de /api/v3/klines com open_time em [start_ms, end_ms], paginando."""
+        rows, cur = [], start_ms
+        iv_ms = INTERVAL_MS.get(interval, 60_000)
+        while cur <= end_ms:
+            params = {
+                "symbol": symbol.upper(),
+                "interval": interval,
+                "startTime": cur,
+                "endTime": min(end_ms, cur + (KLINES_LIMIT - 1) * iv_ms),
+                "limit": KLINES_LIMIT,
+            }
+            data = self.request("GET", "/api/v3/klines", params=params).json()
+            if not data:
+                # janela sem candles (gap/antes da listagem): pula para a próxima página
+                cur = params["endTime"] + 1
+                continue
+            rows.extend(data)
+            cur = data[-1][6] + 1   # próximo após close_time
+            if len(data) < KLINES_LIMIT:
+                cur = max(cur, params["endTime"] + 1)
+        return rows
+
+    def get_agg_trades(self, symbol: str, start_ms: int, end_ms: int) -> List[Tuple[int, float]]:
+        """(timestamp, preço) dos aggTrades em [start_ms, end_ms], em ordem; janela curta (< 1h)."""
+        out: List[Tuple[int, float]] = []
+        params = {"symbol": symbol.upper(), "startTime": start_ms, "endTime": end_ms, "limit": KLINES_LIMIT}
+        while True:
+            data = self.request("GET", "/api/v3/aggTrades", params=params).json()
+            out.extend((int(t["T"]), float(t["p"])) for t in data if int(t["T"]) <= end_ms)
+            if len(data) < KLINES_LIMIT or int(data[-1]["T"]) > end_ms:
+                return out
+            params = {"symbol": symbol.upper(), "fromId": int(data[-1]["a"]) + 1, "limit": KLINES_LIMIT}
+
+    def get_klines(self, symbol: str, start_ms: int, end_ms: int, interval: str = "1m") -> pd.DataFrame:
+        """Klines em DataFrame, lendo primeiro do store local (data/klines)."""
+        return load_klines(symbol, start_ms, end_ms, interval, self.get_klines_raw, now_ms=self.server_now_ms())
+
+
+def _parse_prices(arr) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for it in arr if isinstance(arr, list) else [arr]:
+        try:
+            out[it["symbol"].upper()] = float(it["price"])
+        except Exception:
+            continue
+    return out
+
+
+# um cliente (uma Session) por user-agent, vivo pelo processo todo — sobrevive aos reruns do Streamlit
+_clients: Dict[str, MarketClient] = {}
+_clients_guard = threading.Lock()
+
+
+def get_client(user_agent: str = DEFAULT_USER_AGENT) -> MarketClient:
+    with _clients_guard:
+        cli = _clients.get(user_agent)
+        if cli is None:
+            cli = _clients[user_agent] = MarketClient(user_agent=user_agent)
+        return cli
@@ -0,0 +1,309 @@
+# market_stream.py
+# Modo streaming (opcional): consumidor em background de um feed WebSocket no formato
+# dos combined streams da Binance (<symbol>@kline_1m e <symbol>@miniTicker).
+#
+# Mantém em memória, só para os símbolos observados, o último preço e o candle de 1m em
+# formação. Candles que fecham (k.x = true) vão direto para o store local (kline_store),
+# então a cauda das klines deixa de vir do REST. Quando o preço cruza algum nível
+# registrado (entry/alvo/stop), `touched` é sinalizado para quem está esperando.
+#
+# Cliente WebSocket mínimo em stdlib (RFC 6455): sem dependência nova. Para testar
+# offline use o servidor de replay em utils/stream_replay_server.py.
+import os
+import ssl
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from kline_store import append_closed
+
+DEFAULT_STREAM_URL = os.environ.get("LUCRA_STREAM_URL", "wss://stream.binance.com:9443")
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONT, OP_TEXT, OP_BIN, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+# =========================
+# Framing WebSocket (compartilhado com o servidor de replay)
+# =========================
+def ws_accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def ws_send_frame(sock, opcode: int, payload: bytes, mask: bool) -> None:
+    head = bytearray([0x80 | opcode])
+    n = len(payload)
+    mbit = 0x80 if mask else 0
+    if n < 126:
+        head.append(mbit | n)
+    elif n < 65536:
+        head.append(mbit | 126)
+        head += struct.pack(">H", n)
+    else:
+        head.append(mbit | 127)
+        head += struct.pack(">Q", n)
+    if mask:
+        mkey = os.urandom(4)
+        head += mkey
+        payload = bytes(b ^ mkey[i % 4] for i, b in enumerate(payload))
+    sock.sendall(bytes(head) + payload)
+
+
+class WsReader:
+    """Lê frames de um socket; junta fragmentos e desmascara quando preciso."""
+
+    def __init__(self, sock, buf: bytes = b""):
+        self.sock = sock
+        self.buf = bytearray(buf)
+
+    def _need(self, n: int) -> bytes:
+        while len(self.buf) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("WebSocket fechado pelo outro lado")
+            self.buf += chunk
+        out = bytes(self.buf[:n])
+        del self.buf[:n]
+        return out
+
+    def read_frame(self) -> Tuple[int, bytes]:
+        opcode, data, fin = self._read_raw()
+        while not fin and opcode in (OP_TEXT, OP_BIN):
+            op2, more, fin = self._read_raw()
+            if op2 == OP_CONT:
+                data += more
+        return opcode, data
+
+    def _read_raw(self) -> Tuple[int, bytes, bool]:
+        b0, b1 = self._need(2)
+        n = b1 & 0x7F
+        if n == 126:
+            n = struct.unpack(">H", self._need(2))[0]
+        elif n == 127:
+            n = struct.unpack(">Q", self._need(8))[0]
+        mkey = self._need(4) if b1 & 0x80 else None
+        data = self._need(n)
+        if mkey:
+            data = bytes(b ^ mkey[i % 4] for i, b in enumerate(data))
+        return b0 & 0x0F, data, bool(b0 & 0x80)
+
+
+def ws_connect(url: str, timeout: float = 10.0) -> Tuple[socket.socket, WsReader]:
+    u = urlparse(url)
+    secure = u.scheme == "wss"
+    host = u.hostname or "localhost"
+    port = u.port or (443 if secure else 80)
+    path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+    sock = socket.create_connection((host, port), timeout=timeout)
+    if secure:
+        sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((
+        f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+        f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    buf = b""
+    while b"\r\n\r\n" not in buf:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError("Handshake WebSocket interrompido")
+        buf += chunk
+    head, rest = buf.split(b"\r\n\r\n", 1)
+    lines = head.decode("latin-1").split("\r\n")
+    if " 101 " not in lines[0] + " ":
+        raise ConnectionError(f"Handshake WebSocket recusado: {lines[0]}")
+    hdrs = {k.strip().lower(): v.strip() for k, v in (ln.split(":", 1) for ln in lines[1:] if ":" in ln)}
+    if hdrs.get("sec-websocket-accept") != ws_accept_key(key):
+        raise ConnectionError("Handshake WebSocket inválido (accept key)")
+    return sock, WsReader(sock, rest)
+
+
+def stream_names(symbols: Iterable[str], interval: str = "1m") -> List[str]:
+    out = []
+    for s in sorted({x.lower() for x in symbols if x}):
+        out += [f"{s}@kline_{interval}", f"{s}@miniTicker"]
+    return out
+
+
+# =========================
+# Consumidor
+# =========================
+class MarketStream:
+    def __init__(self, base_url: str = DEFAULT_STREAM_URL, interval: str = "1m",
+                 record_path: Optional[str] = None, on_event: Optional[Callable[[str, dict], None]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.interval = interval
+        self.record_path = record_path
+        self.on_event = on_event
+        self.touched = threading.Event()         # algum nível foi cruzado desde o último clear()
+        self._symbols: frozenset = frozenset()
+        self._levels: Dict[str, List[float]] = {}
+        self._prices: Dict[str, Tuple[float, float]] = {}      # sym -> (preço, recebido_em)
+        self._candles: Dict[str, list] = {}                    # sym -> linha crua do candle em formação
+        self._listeners: List[Callable[[str, float], None]] = []
+        self._lock = threading.Lock()
+        self._reconnect = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._sock = None
+        self.connected = False
+        self.last_msg_at = 0.0
+
+    # ----- controle -----
+    def start(self) -> "MarketStream":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="market-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._close_sock()
+
+    def set_symbols(self, symbols: Iterable[str]) -> None:
+        new = frozenset(s.upper() for s in symbols if s)
+        with self._lock:
+            if new == self._symbols:
+                return
+            self._symbols = new
+            for s in list(self._prices):
+                if s not in new:
+                    self._prices.pop(s, None)
+                    self._candles.pop(s, None)
+        self._reconnect.set()
+        self._close_sock()
+
+    def set_levels(self, levels: Dict[str, Iterable[float]]) -> None:
+        """Níveis (entry/alvo/stop) por símbolo; cruzar um deles sinaliza `touched`."""
+        with self._lock:
+            self._levels = {s.upper(): sorted(float(x) for x in v) for s, v in levels.items()}
+
+    def add_listener(self, fn: Callable[[str, float], None]) -> None:
+        self._listeners.append(fn)
+
+    # ----- leitura -----
+    def last_price(self, symbol: str, max_age_s: float = 30.0) -> Optional[float]:
+        with self._lock:
+            it = self._prices.get(symbol.upper())
+        if not it or time.time() - it[1] > max_age_s:
+            return None
+        return it[0]
+
+    def prices(self, max_age_s: float = 30.0) -> Dict[str, float]:
+        now = time.time()
+        with self._lock:
+            return {s: p for s, (p, t) in self._prices.items() if now - t <= max_age_s}
+
+    def current_candle(self, symbol: str) -> Optional[list]:
+        """Candle em formação no formato cru do /api/v3/klines (open_time ... close_time)."""
+        with self._lock:
+            c = self._candles.get(symbol.upper())
+            return list(c) if c else None
+
+    def is_live(self, max_age_s: float = 30.0) -> bool:
+        return self.connected and (time.time() - self.last_msg_at) <= max_age_s
+
+    # ----- loop -----
+    def _close_sock(self) -> None:
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def _log(self, tipo: str, payload: dict) -> None:
+        if self.on_event:
+            try:
+                self.on_event(tipo, payload)
+            except Exception:
+                pass
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            with self._lock:
+                syms = self._symbols
+            if not syms:
+                self._reconnect.wait(1.0)
+                self._reconnect.clear()
+                continue
+            url = f"{self.base_url}/stream?streams={'/'.join(stream_names(syms, self.interval))}"
+            try:
+                self._reconnect.clear()
+                sock, reader = ws_connect(url)
+                sock.settimeout(30)
+                self._sock = sock
+                self.connected = True
+                backoff = 1.0
+                self._log("stream_conectado", {"simbolos": len(syms)})
+                while not self._stop.is_set() and not self._reconnect.is_set():
+                    op, data = reader.read_frame()
+                    if op == OP_TEXT:
+                        self._on_message(data)
+                    elif op == OP_PING:
+                        ws_send_frame(sock, OP_PONG, data, mask=True)
+                    elif op == OP_CLOSE:
+                        break
+            except Exception as e:
+                if not self._stop.is_set() and not self._reconnect.is_set():
+                    self._log("erro_stream", {"erro": str(e)})
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, 30.0)
+            finally:
+                self.connected = False
+                self._close_sock()
+
+    def _on_message(self, raw: bytes) -> None:
+        self.last_msg_at = time.time()
+        if self.record_path:
+            try:
+                with open(self.record_path, "ab") as f:
+                    f.write(raw.rstrip(b"\n") + b"\n")
+            except Exception:
+                pass
+        try:
+            msg = json.loads(raw)
+        except Exception:
+            return
+        data = msg.get("data", msg)
+        ev = data.get("e")
+        sym = (data.get("s") or "").upper()
+        if not sym:
+            return
+        if ev == "24hrMiniTicker":
+            self._on_price(sym, float(data["c"]))
+        elif ev == "kline":
+            k = data["k"]
+            row = [int(k["t"]), k["o"], k["h"], k["l"], k["c"], k.get("v", "0"), int(k["T"])]
+            with self._lock:
+                self._candles[sym] = row
+            self._on_price(sym, float(k["c"]))
+            if k.get("x"):
+                try:
+                    append_closed(sym, k.get("i", self.interval), [row])
+                except Exception as e:
+                    self._log("erro_stream_store", {"symbol": sym, "erro": str(e)})
+
+    def _on_price(self, sym: str, price: float) -> None:
+        with self._lock:
+            prev = self._prices.get(sym)
+            self._prices[sym] = (price, time.time())
+            levels = self._levels.get(sym)
+        if levels and prev:
+            # o caminho prev -> price passou por algum nível?
+            lo, hi = min(prev[0], price), max(prev[0], price)
+            if any(lo <= lv <= hi for lv in levels):
+                self.touched.set()
+        for fn in self._listeners:
+            try:
+                fn(sym, price)
+            except Exception:
+                pass
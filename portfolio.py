@@ -0,0 +1,179 @@
+# portfolio.py
+# Simulador de carteira (paper trading) sobre os vereditos do backtest.
+#
+# 1) plan_trades: percorre as entradas em ordem de tempo e decide o tamanho de cada
+#    posição com o capital realizado até ali (fração fixa), respeitando o limite de
+#    exposição simultânea e de posições abertas; taxas e slippage por lado.
+# 2) equity_curve: marca a mercado num grid de tempo (passo configurável, 1m por padrão)
+#    todas as posições de uma vez. Símbolo a símbolo, e dentro dele por grupo de janelas
+#    próximas, lê os candles só do que precisa, soma a contribuição de cada posição nos
+#    arrays do grid e descarta os candles — memória O(grid), não O(sinais x candles).
+#
+# A resolução de cada trade (quando entrou, quando/onde saiu) vem do backtest.py, com a
+# mesma semântica entry -> alvo/stop do avaliador ao vivo.
+import heapq
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from kline_store import read_stored
+from backtest import market, window_clusters, SIGNAL_FIELDS, INTERVAL
+from evaluator import ST_ACERTOU, ST_ERROU, ST_TIMEOUT
+
+DEFAULTS = {
+    "capital": 10_000.0,        # capital inicial (USDT)
+    "fracao": 0.10,             # fração do capital realizado por trade
+    "max_exposicao": 1.0,       # soma dos nocionais abertos <= isto x capital realizado
+    "max_posicoes": 0,          # 0 = sem limite
+    "taxa": 0.001,              # taxa por lado (0,1% = taker Binance)
+    "slippage": 0.0,            # fração do preço contra nós, na entrada e na saída
+    "min_nocional": 5.0,        # abaixo disso a ordem não sai (mínimo da Binance ~5 USDT)
+}
+
+
+# =========================
+# Dimensionamento (sequencial nas entradas)
+# =========================
+def plan_trades(results: pd.DataFrame, **opts) -> pd.DataFrame:
+    """
+    results: saída do backtest.run_backtest (uma linha por sinal; duplicados são ignorados).
+    Retorna um trade por sinal que entrou, com executado/motivo, qty, nocional, taxas e pnl.
+    """
+    o = {**DEFAULTS, **{k: v for k, v in opts.items() if v is not None}}
+    df = results.drop_duplicates(subset=SIGNAL_FIELDS)
+    df = df[df["status"].isin([ST_ACERTOU, ST_ERROU, ST_TIMEOUT])].copy()
+    df = df.sort_values(["entrada_em_ms", "saida_em_ms"], kind="stable").reset_index(drop=True)
+
+    realized = float(o["capital"])
+    exposure = 0.0
+    open_heap: List[tuple] = []     # (saida_em_ms, k, nocional, pnl)
+    out: List[Dict[str, Any]] = []
+    for k, r in enumerate(df.itertuples(index=False)):
+        # fecha o que saiu antes desta entrada
+        while open_heap and open_heap[0][0] <= r.entrada_em_ms:
+            _, _, notional_k, pnl_k = heapq.heappop(open_heap)
+            realized += pnl_k
+            exposure -= notional_k
+
+        sign = 1.0 if str(r.side).upper() == "BUY" else -1.0
+        rec = {**{f: getattr(r, f) for f in SIGNAL_FIELDS}, "status": r.status,
+               "entrada_em_ms": int(r.entrada_em_ms), "saida_em_ms": int(r.saida_em_ms),
+               "executado": False, "motivo": "", "lado": sign, "preco_entrada": None, "preco_saida": None,
+               "qty": 0.0, "nocional": 0.0, "taxas": 0.0, "pnl": 0.0, "capital_na_entrada": realized}
+        notional = realized * o["fracao"]
+        room = o["max_exposicao"] * realized - exposure
+        if o["max_posicoes"] and len(open_heap) >= o["max_posicoes"]:
+            rec["motivo"] = "max_posicoes"
+        elif realized <= 0:
+            rec["motivo"] = "sem_capital"
+        else:
+            notional = min(notional, room)
+            if notional < o["min_nocional"]:
+                rec["motivo"] = "exposicao"
+        if rec["motivo"]:
+            out.append(rec)
+            continue
+
+        p_in = float(r.entry) * (1 + sign * o["slippage"])
+        p_out = float(r.preco_saida) * (1 - sign * o["slippage"])
+        qty = notional / p_in
+        fees = (qty * p_in + qty * p_out) * o["taxa"]
+        pnl = sign * qty * (p_out - p_in) - fees
+        rec.update(executado=True, preco_entrada=p_in, preco_saida=p_out, qty=qty,
+                   nocional=notional, taxas=fees, pnl=pnl)
+        heapq.heappush(open_heap, (int(r.saida_em_ms), k, notional, pnl))
+        exposure += notional
+        out.append(rec)
+    return pd.DataFrame(out)
+
+
+# =========================
+# Curva de capital (marcação a mercado vetorizada)
+# =========================
+def equity_curve(trades: pd.DataFrame, capital: float = DEFAULTS["capital"], step_ms: int = 60_000,
+                 offline: bool = False) -> pd.DataFrame:
+    """Equity, exposição, posições abertas e drawdown em cada ponto do grid."""
+    taken = trades[trades["executado"]] if len(trades) else trades
+    if taken.empty:
+        return pd.DataFrame(columns=["time_ms", "equity", "exposicao", "posicoes", "drawdown"])
+
+    t0 = int(taken["entrada_em_ms"].min()) // step_ms * step_ms
+    t1 = int(taken["saida_em_ms"].max())
+    grid = np.arange(t0, t1 + step_ms, step_ms, dtype=np.int64)
+    realized_delta = np.zeros(len(grid))
+    unreal = np.zeros(len(grid))
+
+    ent = np.searchsorted(grid, taken["entrada_em_ms"].to_numpy(np.int64), side="left")
+    ext = np.searchsorted(grid, taken["saida_em_ms"].to_numpy(np.int64), side="left")
+    # pnl líquido (com as taxas dos dois lados) entra no realizado no ponto da saída
+    np.add.at(realized_delta, np.minimum(ext, len(grid) - 1), taken["pnl"].to_numpy(float))
+    taken = taken.assign(_i0=ent, _i1=ext)
+    # posições abertas e exposição pelo nocional de entrada valem com ou sem candles; os
+    # candles só marcam a mercado (unreal e exposição a preço corrente)
+    span = ext > ent
+    opened = np.zeros(len(grid) + 1)
+    np.add.at(opened, ent[span], 1)
+    np.add.at(opened, ext[span], -1)
+    n_open = np.cumsum(opened[:-1]).astype(np.int32)
+    entry_notional = (taken["qty"] * taken["preco_entrada"]).to_numpy(float)
+    opened[:] = 0
+    np.add.at(opened, ent[span], entry_notional[span])
+    np.add.at(opened, ext[span], -entry_notional[span])
+    exposure = np.cumsum(opened[:-1])
+
+    for symbol, group in taken.groupby(taken["symbol"].str.upper()):
+        items = [(r, int(r["entrada_em_ms"]), int(r["saida_em_ms"])) for _, r in group.iterrows()]
+        for cluster in window_clusters(items):
+            a = min(x[1] for x in cluster) // step_ms * step_ms
+            b = max(x[2] for x in cluster)
+            try:
+                df = read_stored(symbol, a, b, INTERVAL) if offline else market.get_klines(symbol, a, b, INTERVAL)
+            except Exception:
+                df = None
+            if df is None or df.empty:
+                continue   # sem candles: posição fica pelo nocional de entrada, sem marcação
+            ct = df["close_time"].to_numpy(np.int64)
+            close = df["close"].to_numpy(float)
+            for r, _, _ in cluster:
+                i0, i1 = int(r["_i0"]), int(r["_i1"])
+                if i1 <= i0:
+                    continue
+                # último close conhecido em cada ponto do grid (antes do 1º candle: preço de entrada)
+                j = np.searchsorted(ct, grid[i0:i1], side="right") - 1
+                px = np.where(j >= 0, close[np.maximum(j, 0)], r["preco_entrada"])
+                unreal[i0:i1] += r["lado"] * r["qty"] * (px - r["preco_entrada"])
+                exposure[i0:i1] += r["qty"] * (px - r["preco_entrada"])
+
+    equity = capital + np.cumsum(realized_delta) + unreal
+    peak = np.maximum.accumulate(equity)
+    return pd.DataFrame({
+        "time_ms": grid, "equity": equity, "exposicao": exposure, "posicoes": n_open,
+        "drawdown": equity / peak - 1.0,
+    })
+
+
+def summarize(trades: pd.DataFrame, curve: pd.DataFrame, capital: float = DEFAULTS["capital"]) -> Dict[str, Any]:
+    taken = trades[trades["executado"]] if len(trades) else trades
+    n = len(taken)
+    final = float(curve["equity"].iloc[-1]) if len(curve) else capital
+    return {
+        "capital_inicial": capital,
+        "capital_final": round(final, 2),
+        "retorno_pct": round((final / capital - 1) * 100, 3),
+        "max_drawdown_pct": round(float(curve["drawdown"].min()) * 100, 3) if len(curve) else 0.0,
+        "trades": n,
+        "pulados": int(len(trades) - n),
+        "win_rate": round(float((taken["pnl"] > 0).mean()), 4) if n else None,
+        "taxas": round(float(taken["taxas"].sum()), 2) if n else 0.0,
+        "max_posicoes_abertas": int(curve["posicoes"].max()) if len(curve) else 0,
+        "exposicao_media": round(float(curve["exposicao"].mean()), 2) if len(curve) else 0.0,
+    }
+
+
+def simulate(results: pd.DataFrame, step_ms: int = 60_000, offline: bool = False,
+             **opts) -> Dict[str, Any]:
+    capital = float(opts.get("capital") or DEFAULTS["capital"])
+    trades = plan_trades(results, **opts)
+    curve = equity_curve(trades, capital, step_ms, offline)
+    return {"trades": trades, "curve": curve, "resumo": summarize(trades, curve, capital)}
@@ -1,11 +1,11 @@
 # prompt_builder.py
-import os, json, datetime
+import os, json, random, datetime
 from typing import List, Dict, Any
 
+from audits_utils import audit_metrics, iter_audits
+
 APP_DIR = os.path.dirname(__file__)
-AUDIT_DIR = os.path.join(APP_DIR, "audits")
-AUDITS = os.path.join(AUDIT_DIR, "audits.jsonl")
-FAILS  = os.path.join(AUDIT_DIR, "failures.jsonl")
+EXAMPLES_PER_CODE = 3
 
 SCHEMA_SNIPPET = """Campos obrigatórios por sinal:
 {
@@ -25,21 +25,6 @@ Regras:
 Erros padronizados: E_NUM, E_SIDE, E_DATE, E_SYMBOL, E_PRICE_MISS, E_RULE_BUY, E_RULE_SELL, E_NET
 """
 
-def _read_jsonl(path: str) -> List[Dict[str, Any]]:
-    if not os.path.isfile(path):
-        return []
-    out: List[Dict[str, Any]] = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                out.append(json.loads(line))
-            except Exception:
-                pass
-    return out
-
 def _hint_for_code(code: str) -> str:
     return {
         "E_NUM": "Converta strings numéricas com ponto (.) e remova %, vírgulas e símbolos.",
@@ -53,51 +38,55 @@ def _hint_for_code(code: str) -> str:
     }.get(code, "Siga o schema e corrija campos inconsistentes.")
 
 def build_training_packet(max_fail_examples: int = 12, days_window: int = 7) -> Dict[str, Any]:
-    audits = _read_jsonl(AUDITS)
-    fails  = _read_jsonl(FAILS)
-
+    """Métricas e top erros saem dos baldes por hora mantidos pelo AuditWriter (sem reler o
+    log); os exemplos, de uma passada pelas failures da janela com até EXAMPLES_PER_CODE
+    exemplos por código."""
     cutoff_dt = datetime.datetime.utcnow() - datetime.timedelta(days=days_window)
     cutoff = cutoff_dt.strftime("%Y-%m-%dT%H:%M:%S")
+    since_day = cutoff[:10]   # só as partições diárias dentro da janela são abertas
 
-    def _recent(rec: Dict[str, Any]) -> bool:
-        ts = rec.get("ts") or ""
-        return ts >= cutoff
-
-    audits_recent = [a for a in audits if _recent(a)]
-    fails_recent  = [f for f in fails if _recent(f)]
-
-    total = len(audits_recent)
-    invalids = sum(1 for a in audits_recent if a.get("validation", {}).get("errors"))
-    price_cov = sum(1 for a in audits_recent if a.get("market", {}).get("live_price") is not None)
-    finals = [a for a in audits_recent if a.get("verdict", {}).get("state") == "FINAL"]
-    acc = sum(1 for a in finals if (a.get("verdict", {}).get("result") == "ACERTOU")) if finals else 0
-
+    m = audit_metrics(APP_DIR, since_ts=cutoff)
+    total = m["total"]
     metrics = {
         "window_days": days_window,
         "total_samples": total,
-        "invalid_rate": round(invalids / total, 4) if total else 0.0,
-        "price_coverage": round(price_cov / total, 4) if total else 0.0,
-        "final_count": len(finals),
-        "final_accuracy": round(acc / len(finals), 4) if finals else None,
+        "invalid_rate": round(m["invalid"] / total, 4) if total else 0.0,
+        "price_coverage": round(m["price"] / total, 4) if total else 0.0,
+        "final_count": m["final"],
+        "final_accuracy": round(m["acc"] / m["final"], 4) if m["final"] else None,
     }
+    top_errors = sorted(m["errors"].items(), key=lambda x: x[1], reverse=True)[:5]
 
-    err_counts: Dict[str, int] = {}
-    for a in audits_recent:
-        for e in a.get("validation", {}).get("errors", []):
-            err_counts[e] = err_counts.get(e, 0) + 1
-    top_errors = sorted(err_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-
+    # reservatório (algoritmo R) por código: amostra uniforme da janela com memória fixa
+    rng = random.Random(0)
+    seen: Dict[str, int] = {}
     by_code: Dict[str, List[Dict[str, Any]]] = {}
-    for f in fails_recent:
+    for f in iter_audits(APP_DIR, "fails", since_day=since_day):
+        if (f.get("ts") or "") < cutoff:
+            continue
+        # regravação (count_delta) de falha cuja primeira emissão já está na janela: repetida.
+        # Sem conjunto de fingerprints vistos: memória fica O(exemplos)
+        if f.get("count_delta") is not None and (f.get("first_seen") or "") >= cutoff:
+            continue
+        fp = f.get("fingerprint")
         codes = f.get("validation", {}).get("errors", [])
         if not codes:
             codes = ["E_UNKNOWN"]
         for c in codes:
-            by_code.setdefault(c, []).append(f)
+            res = by_code.setdefault(c, [])
+            if fp and any(x.get("fingerprint") == fp for x in res):
+                continue   # mesma falha reemitida (ex.: outro processo) já está no reservatório
+            seen[c] = seen.get(c, 0) + 1
+            if len(res) < EXAMPLES_PER_CODE:
+                res.append(f)
+            else:
+                k = rng.randrange(seen[c])
+                if k < EXAMPLES_PER_CODE:
+                    res[k] = f
 
     examples: List[Dict[str, Any]] = []
     for code, arr in by_code.items():
-        for ex in arr[:3]:
+        for ex in arr:
             sig = ex.get("signal", {}) or {}
             examples.append({
                 "error_code": code,
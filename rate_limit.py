@@ -0,0 +1,106 @@
+# rate_limit.py
+# Limitador por PESO de request da Binance (REQUEST_WEIGHT, janela de 1 minuto).
+#
+# Token bucket compartilhado pelo processo inteiro (todas as sessões do Streamlit e
+# todas as threads da pré-busca). Cada endpoint consome o seu peso; os headers
+# X-MBX-USED-WEIGHT-1M devolvidos pelo servidor corrigem a nossa estimativa, e um
+# 429/418 com Retry-After bloqueia todo mundo até o horário indicado.
+import time
+import threading
+from typing import Mapping, Optional
+from urllib.parse import urlparse
+
+WEIGHT_LIMIT_1M = 6000      # limite da Binance Spot por IP
+RESERVE = 0.2               # fração do limite que nunca usamos (folga para outros clientes/IP)
+
+# Pesos por endpoint (docs Binance Spot). ticker/price: 2 com symbol, 4 sem/symbols=[...]
+ENDPOINT_WEIGHTS = {
+    "/api/v3/klines": 2,
+    "/api/v3/exchangeInfo": 20,
+    "/api/v3/aggTrades": 4,
+    "/api/v3/ping": 1,
+    "/api/v3/time": 1,
+}
+
+
+def request_weight(url: str, params: Optional[Mapping] = None) -> int:
+    path = urlparse(url).path
+    if path == "/api/v3/ticker/price":
+        return 2 if (params and "symbol" in params) else 4
+    return ENDPOINT_WEIGHTS.get(path, 1)
+
+
+class RateLimitBanned(Exception):
+    """418: IP banido pela Binance até o Retry-After."""
+
+
+class WeightLimiter:
+    def __init__(self, limit: int = WEIGHT_LIMIT_1M, reserve: float = RESERVE, window_s: float = 60.0):
+        self.capacity = float(limit) * (1.0 - reserve)
+        self.refill_per_s = self.capacity / window_s
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self._last = time.monotonic()
+        self._cv = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.refill_per_s)
+        self._last = now
+
+    def acquire(self, weight: int, timeout: Optional[float] = None) -> bool:
+        """Espera até haver orçamento para `weight`. False se estourar o timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        weight = min(float(weight), self.capacity)
+        with self._cv:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= weight:
+                    self.tokens -= weight
+                    return True
+                wait = max(self.blocked_until - now, (weight - self.tokens) / self.refill_per_s, 0.01)
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = min(wait, deadline - now)
+                self._cv.wait(wait)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Sincroniza com o peso que o servidor diz já ter sido usado neste minuto."""
+        used = headers.get("X-MBX-USED-WEIGHT-1M") or headers.get("x-mbx-used-weight-1m")
+        if used is None:
+            return
+        try:
+            used = float(used)
+        except ValueError:
+            return
+        with self._cv:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, self.capacity - used)
+
+    def block_for(self, seconds: float) -> None:
+        """429/418: ninguém faz request até passar o Retry-After."""
+        with self._cv:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + max(0.0, seconds))
+            self.tokens = min(self.tokens, 0.0)
+            self._cv.notify_all()
+
+    def headroom(self) -> float:
+        """Fração do orçamento disponível agora (0..1). Use para adiar trabalho de baixa prioridade."""
+        with self._cv:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return 0.0
+            return max(0.0, self.tokens) / self.capacity
+
+
+def retry_after_seconds(headers: Mapping[str, str], default: float = 60.0) -> float:
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after") or default)
+    except ValueError:
+        return default
+
+
+# instância única do processo
+LIMITER = WeightLimiter()
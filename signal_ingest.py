@@ -0,0 +1,263 @@
+# signal_ingest.py
+# Ingest em massa de sinais no watchlist (upload da página ou CLI), sem carregar o arquivo
+# inteiro nem validar sinal a sinal em Python.
+#
+# - parse incremental: o array JSON é lido em blocos de bytes e cada objeto sai assim que
+#   fecha (json raw_decode); aceita também objetos soltos/concatenados, como o backtest
+# - validação vetorizada por lote (pandas): campos numéricos, side, regra BUY/SELL e
+#   formato das datas, com os mesmos códigos de erro da auditoria (E_NUM, E_RULE_BUY...)
+# - símbolos resolvidos pelo universo (symbol_universe) antes do dedupe; símbolo
+#   desconhecido força um refresh do exchangeInfo (listagem nova) antes de virar E_SYMBOL
+# - dedupe por índice hash (symbol, entrada, saída) dentro do arquivo; contra o watchlist,
+#   o índice único do SQLite (INSERT OR IGNORE)
+# - commit por lote (uma transação por INGEST_CHUNK sinais) e progresso por callback
+# - sinais inválidos não entram no watchlist: vão para a trilha de falhas (audit_failure),
+#   que é o que o pacote de treino lê
+#
+# CLI:
+#   python signal_ingest.py dump_50k.json
+#   python signal_ingest.py "sinais/*.json" --chunk 10000 --sem-auditoria
+import os
+import sys
+import json
+import codecs
+import argparse
+from time import perf_counter
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from watch_store import WatchStore, get_store, signal_tuple, REQUIRED_FIELDS
+from audits_utils import (
+    audit_failure, build_audit_record, flush_audits,
+    E_NUM, E_SIDE, E_DATE, E_SYMBOL, E_RULE_BUY, E_RULE_SELL,
+)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+INGEST_CHUNK = 5000
+READ_BYTES = 1 << 20
+DATE_FMT = "%Y-%m-%d %H:%M:%S"
+FIELDS = ["symbol", "side", "entry", "target", "stop_loss", "entrada_datahora", "saida_datahora"]
+
+
+# =========================
+# Parse incremental
+# =========================
+def iter_json_signals(fp: BinaryIO, read_bytes: int = READ_BYTES,
+                      on_bytes: Optional[Callable[[int], None]] = None) -> Iterator[dict]:
+    """Objetos de sinal de um arquivo JSON (lista, {"sinais": [...]}, objetos soltos), um a um.
+    Só o trecho ainda não consumido fica em memória."""
+    dec = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+    buf, i, eof, nbytes = "", 0, False, 0
+    while True:
+        # separadores entre documentos: espaço, vírgula, colchetes (desce no array de fora)
+        while i < len(buf) and (buf[i].isspace() or buf[i] in ",[]}"):
+            i += 1
+        if i >= len(buf):
+            if eof:
+                return
+            buf, i = "", 0
+        else:
+            try:
+                doc, j = dec.raw_decode(buf, i)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                doc = None
+            if doc is not None:
+                i = j
+                if isinstance(doc, dict) and isinstance(doc.get("sinais") or doc.get("signals"), list):
+                    yield from (s for s in (doc.get("sinais") or doc.get("signals")) if isinstance(s, dict))
+                elif isinstance(doc, dict):
+                    yield doc
+                continue
+        # objeto incompleto (ou buffer vazio): lê mais um bloco
+        chunk = fp.read(read_bytes)
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        eof = not chunk
+        nbytes += len(chunk)
+        buf = buf[i:] + utf8.decode(chunk, final=eof)
+        i = 0
+        if on_bytes:
+            on_bytes(nbytes)
+
+
+# =========================
+# Validação vetorizada
+# =========================
+def validate_batch(signals: List[dict]) -> List[Optional[str]]:
+    """
+    Primeiro erro de cada sinal (None = válido), na mesma ordem de checagem de
+    evaluator.validate_signal_numeric_side: números, side/regra, datas.
+    """
+    if not signals:
+        return []
+    df = pd.DataFrame.from_records(signals, columns=FIELDS)
+    num = df[["entry", "target", "stop_loss"]].apply(pd.to_numeric, errors="coerce")
+    e, t, s = (num[c].to_numpy(float) for c in ("entry", "target", "stop_loss"))
+    num_ok = num.notna().all(axis=1).to_numpy()
+    side = df["side"].fillna("").astype(str).str.upper().to_numpy()
+    is_buy, is_sell = side == "BUY", side == "SELL"
+    with np.errstate(invalid="ignore"):
+        buy_ok = (t > e) & (s < e)
+        sell_ok = (t < e) & (s > e)
+    dates_ok = np.ones(len(df), dtype=bool)
+    for c in ("entrada_datahora", "saida_datahora"):
+        dt = pd.to_datetime(df[c].where(df[c].map(lambda v: isinstance(v, str)), None),
+                            format=DATE_FMT, errors="coerce")
+        dates_ok &= dt.notna().to_numpy()
+
+    err = np.select(
+        [~num_ok, is_buy & ~buy_ok, is_sell & ~sell_ok, ~(is_buy | is_sell), ~dates_ok],
+        [E_NUM, E_RULE_BUY, E_RULE_SELL, E_SIDE, E_DATE], default="")
+    return [x or None for x in err.tolist()]
+
+
+# =========================
+# Ingest
+# =========================
+def _audit_invalid(s: dict, codes: List[str]) -> None:
+    audit_failure(APP_DIR, build_audit_record(
+        APP_DIR, s,
+        source={"type": "json", "origin_id": "ingest"},
+        validation_errors=codes,
+        symbol_exists=(E_SYMBOL not in codes),
+        numeric_ok=(E_NUM not in codes),
+        date_ok=(E_DATE not in codes),
+        rule_ok=(E_RULE_BUY not in codes and E_RULE_SELL not in codes),
+        verdict_state="LIVE",
+    ))
+
+
+def new_stats() -> Dict[str, Any]:
+    return {"lidos": 0, "adicionados": 0, "duplicados": 0, "sem_campos": 0, "invalidos": 0,
+            "corrigidos": 0, "erros": {}, "bytes": 0}
+
+
+def ingest_stream(fp: BinaryIO, store: Optional[WatchStore] = None, universe=None,
+                  chunk: int = INGEST_CHUNK, audit: bool = True,
+                  on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Lê, valida, deduplica e grava os sinais de fp em lotes de `chunk`.
+    universe: SymbolUniverse carregado (None = símbolos como vieram, sem checar existência).
+    on_progress(stats) é chamado a cada lote gravado; stats["bytes"] = bytes lidos até ali.
+    """
+    store = store or get_store()
+    stats = stats or new_stats()
+    seen = set()
+    check_symbols = universe is not None and bool(universe.symbols)
+    batch: List[dict] = []
+    base_bytes = stats["bytes"]
+
+    def _set_bytes(n: int) -> None:
+        stats["bytes"] = base_bytes + n
+
+    def _flush() -> None:
+        sigs = universe.normalize_signals(batch) if check_symbols else list(batch)
+        batch.clear()
+        if check_symbols:
+            unknown = {(s.get("symbol") or "").upper() for s in sigs} - universe.symbols
+            if unknown:
+                # par listado depois do último exchangeInfo: refresh (no máximo um por
+                # UNKNOWN_REFRESH_S) antes de descartar como E_SYMBOL
+                fetched_at = universe.fetched_at
+                for sym in unknown:
+                    universe.resolve(sym, allow_refresh=True)
+                if universe.fetched_at != fetched_at:
+                    sigs = universe.normalize_signals(sigs)
+        valid: List[dict] = []
+        for s, err in zip(sigs, validate_batch(sigs)):
+            key = signal_tuple(s)
+            if key in seen:
+                stats["duplicados"] += 1
+                continue
+            seen.add(key)
+            codes = [err] if err else []
+            if check_symbols and (s.get("symbol") or "").upper() not in universe.symbols:
+                codes.append(E_SYMBOL)
+            if codes:
+                stats["invalidos"] += 1
+                for c in codes:
+                    stats["erros"][c] = stats["erros"].get(c, 0) + 1
+                if audit:
+                    _audit_invalid(s, codes)
+                continue
+            stats["corrigidos"] += "symbol_original" in s
+            valid.append(s)
+        added = store.add_signals(valid) if valid else 0   # uma transação por lote
+        stats["adicionados"] += added
+        stats["duplicados"] += len(valid) - added
+        if on_progress:
+            on_progress(stats)
+
+    for s in iter_json_signals(fp, on_bytes=_set_bytes):
+        stats["lidos"] += 1
+        if not REQUIRED_FIELDS.issubset(s.keys()):
+            stats["sem_campos"] += 1
+            continue
+        batch.append(s)
+        if len(batch) >= chunk:
+            _flush()
+    if batch or on_progress:
+        _flush()
+    if audit and stats["invalidos"]:
+        flush_audits()
+    return stats
+
+
+def ingest_files(paths: List[str], store: Optional[WatchStore] = None, universe=None,
+                 chunk: int = INGEST_CHUNK, audit: bool = True,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    stats = new_stats()
+    for path in paths:
+        with open(path, "rb") as f:
+            ingest_stream(f, store, universe, chunk, audit, on_progress, stats)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from backtest import expand_inputs
+    from evaluator import symbol_universe
+
+    ap = argparse.ArgumentParser(description="Ingest em massa de arquivos de sinais no watchlist.")
+    ap.add_argument("inputs", nargs="+", help="arquivos ou globs (ex.: \"sinais/*.json\")")
+    ap.add_argument("--chunk", type=int, default=INGEST_CHUNK, help="sinais por transação")
+    ap.add_argument("--sem-auditoria", action="store_true", help="não grava os inválidos na trilha de falhas")
+    ap.add_argument("--offline", action="store_true", help="não baixa o exchangeInfo (usa o universo em disco)")
+    args = ap.parse_args(argv)
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("Nenhum arquivo de sinais encontrado.")
+        return 1
+    universe = symbol_universe()
+    if not args.offline:
+        try:
+            universe.ensure_fresh()
+        except Exception as e:
+            print(f"[ingest] exchangeInfo indisponível, símbolos sem normalização ({e})")
+    total = sum(os.path.getsize(p) for p in files) or 1
+    t0 = perf_counter()
+
+    def _progress(st: Dict[str, Any]) -> None:
+        sys.stderr.write(f"\r{st['bytes'] / total:6.1%}  lidos {st['lidos']}  adicionados {st['adicionados']}")
+        sys.stderr.flush()
+
+    stats = ingest_files(files, universe=universe if universe.symbols else None, chunk=args.chunk,
+                         audit=not args.sem_auditoria, on_progress=_progress)
+    sys.stderr.write("\n")
+    print(f"{stats['lidos']} sinal(is) lido(s) de {len(files)} arquivo(s) em {perf_counter() - t0:.1f}s: "
+          f"{stats['adicionados']} adicionado(s), {stats['duplicados']} duplicado(s), "
+          f"{stats['invalidos']} inválido(s), {stats['sem_campos']} sem campos, "
+          f"{stats['corrigidos']} símbolo(s) corrigido(s)")
+    for code, n in sorted(stats["erros"].items()):
+        print(f"  {code}: {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
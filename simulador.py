@@ -1,56 +1,115 @@
-import requests
-import pandas as pd
+import sys
 import json
+import argparse
+import pandas as pd
 from datetime import datetime
 
-def get_price(symbol):
-    url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol.upper()}"
-    resp = requests.get(url)
-    data = resp.json()
-    return float(data['price'])
-
-with open('sinais.json', 'r') as f:
-    signals = json.load(f)
-
-trades = []
-
-for signal in signals:
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    symbol = signal['symbol']
-    side = signal['side']
-    entry = signal['entry']
-    target = signal['target']
-    stop_loss = signal['stop_loss']
-    
+from market_client import get_client
+
+# Modos:
+#   python simulador.py                         retrato: preço atual x entry de cada sinal de sinais.json
+#   python simulador.py --carteira "sinais/*.json" [--capital 10000 --fracao 0.1 --taxa 0.001 ...]
+#       carteira simulada no tempo (portfolio.py): tamanho de posição, exposição simultânea,
+#       taxas, curva de capital e drawdown, sobre os vereditos do backtest em candles de 1m
+
+market = get_client("LucraSimulador/1.0 (+https://lucra.local)")
+
+
+def retrato(path: str = 'sinais.json') -> None:
+    with open(path, 'r') as f:
+        signals = json.load(f)
+
+    # todos os preços em lote (ticker/price?symbols=[...]) em vez de um request por sinal
     try:
-        current_price = get_price(symbol)
+        prices = market.get_prices(s['symbol'] for s in signals)
     except Exception as e:
-        print(f"Erro ao buscar preço de {symbol}: {e}")
-        current_price = None
-
-    # Calcula lucro/prejuízo (%)
-    if current_price is not None:
-        if side.upper() == "BUY":
-            profit_pct = ((current_price - entry) / entry) * 100
-        else:  # SELL
-            profit_pct = ((entry - current_price) / entry) * 100
-        profit_pct = round(profit_pct, 2)
+        print(f"Erro ao buscar preços: {e}")
+        prices = {}
+
+    trades = []
+
+    for signal in signals:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        symbol = signal['symbol']
+        side = signal['side']
+        entry = signal['entry']
+        target = signal['target']
+        stop_loss = signal['stop_loss']
+
+        current_price = prices.get(symbol.upper())
+        if current_price is None:
+            print(f"Erro ao buscar preço de {symbol}: símbolo sem preço na Binance")
+
+        # Calcula lucro/prejuízo (%)
+        if current_price is not None:
+            if side.upper() == "BUY":
+                profit_pct = ((current_price - entry) / entry) * 100
+            else:  # SELL
+                profit_pct = ((entry - current_price) / entry) * 100
+            profit_pct = round(profit_pct, 2)
+        else:
+            profit_pct = None
+
+        trade = {
+            "timestamp": now,
+            "symbol": symbol,
+            "side": side,
+            "preco_entrada": entry,
+            "preco_atual": current_price,
+            "alvo": target,
+            "stop": stop_loss,
+            "lucro_%": profit_pct
+        }
+        trades.append(trade)
+        print(f"{now} - {side} {symbol} | Entrada: {entry} | Preço Atual: {current_price} | Lucro/Prejuízo: {profit_pct}%")
+
+    df = pd.DataFrame(trades)
+    df.to_csv("simulador_trades.csv", index=False)
+    print("Trades salvos em simulador_trades.csv")
+
+
+def carteira(args) -> None:
+    from backtest import expand_inputs, run_backtest
+    from portfolio import simulate
+
+    files = expand_inputs(args.carteira)
+    if not files:
+        print("Nenhum arquivo de sinais encontrado.")
+        sys.exit(1)
+    results = run_backtest(files, args.workers, args.offline)
+    sim = simulate(results, step_ms=args.passo * 60_000, offline=args.offline,
+                   capital=args.capital, fracao=args.fracao, max_exposicao=args.max_exposicao,
+                   max_posicoes=args.max_posicoes, taxa=args.taxa, slippage=args.slippage)
+
+    curve = sim["curve"]
+    # no CSV, trechos sem posição aberta e sem mudança de capital viram um ponto só
+    curve = curve[(curve["posicoes"] > 0) | (curve["equity"].diff().fillna(1.0) != 0)].copy()
+    curve.insert(0, "time", pd.to_datetime(curve["time_ms"], unit="ms", utc=True).dt.strftime("%Y-%m-%d %H:%M"))
+    sim["trades"].to_csv("simulador_carteira_trades.csv", index=False)
+    curve.to_csv("simulador_carteira_equity.csv", index=False)
+    for k, v in sim["resumo"].items():
+        print(f"{k:>22}: {v}")
+    print("Trades em simulador_carteira_trades.csv; curva de capital em simulador_carteira_equity.csv")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Simulador de trades (retrato atual ou carteira no tempo).")
+    ap.add_argument("--carteira", nargs="+", metavar="ARQUIVO", help="arquivos/globs de sinais para simular a carteira")
+    ap.add_argument("--capital", type=float, default=None, help="capital inicial em USDT (padrão 10000)")
+    ap.add_argument("--fracao", type=float, default=None, help="fração do capital por trade (padrão 0.10)")
+    ap.add_argument("--max-exposicao", type=float, default=None, help="exposição máxima, em múltiplos do capital (padrão 1.0)")
+    ap.add_argument("--max-posicoes", type=int, default=None, help="posições abertas ao mesmo tempo (0 = sem limite)")
+    ap.add_argument("--taxa", type=float, default=None, help="taxa por lado (padrão 0.001)")
+    ap.add_argument("--slippage", type=float, default=None, help="slippage por lado, fração do preço (padrão 0)")
+    ap.add_argument("--passo", type=int, default=1, help="passo da curva de capital em minutos (padrão 1)")
+    ap.add_argument("--workers", type=int, default=0, help="processos do backtest (padrão: nº de CPUs)")
+    ap.add_argument("--offline", action="store_true", help="usa só o store local (data/klines)")
+    args = ap.parse_args()
+    if args.carteira:
+        carteira(args)
     else:
-        profit_pct = None
-
-    trade = {
-        "timestamp": now,
-        "symbol": symbol,
-        "side": side,
-        "preco_entrada": entry,
-        "preco_atual": current_price,
-        "alvo": target,
-        "stop": stop_loss,
-        "lucro_%": profit_pct
-    }
-    trades.append(trade)
-    print(f"{now} - {side} {symbol} | Entrada: {entry} | Preço Atual: {current_price} | Lucro/Prejuízo: {profit_pct}%")
-
-df = pd.DataFrame(trades)
-df.to_csv("simulador_trades.csv", index=False)
-print("Trades salvos em simulador_trades.csv")
+        retrato()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# sparkline.py
+# Mini-gráficos de preço como SVG inline (polyline), sem matplotlib.
+#
+# As closes vêm do store local (preenchido pela pré-busca do ciclo); a rede só completa
+# a janela quando o limitador tem folga. O HTML sai de um cache LRU pequeno, chaveado por
+# (símbolo, janela, close_time do último candle): enquanto não fecha candle novo, o
+# mesmo símbolo reaproveita a mesma string em todas as linhas e ciclos. Janela parcial
+# (faltou candle) é desenhada mas não entra no cache.
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Sequence, Tuple
+
+SPARK_CACHE_MAX = 512
+SPARK_STROKE = "#60a5fa"
+
+_cache: "OrderedDict[Hashable, str]" = OrderedDict()
+
+
+def sparkline_svg(closes: Sequence[float], width: int = 140, height: int = 28,
+                  stroke: str = SPARK_STROKE, pad: float = 1.5) -> str:
+    vals = [float(c) for c in closes if c == c]   # descarta NaN
+    if not vals:
+        return ""
+    lo, hi = min(vals), max(vals)
+    span = (hi - lo) or 1.0
+    n = len(vals)
+    step = (width - 2 * pad) / (n - 1) if n > 1 else 0.0
+    h = height - 2 * pad
+    pts = " ".join(
+        f"{pad + i * step:.1f},{pad + h - (v - lo) / span * h:.1f}" for i, v in enumerate(vals)
+    )
+    return (
+        f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+        f'xmlns="http://www.w3.org/2000/svg"><polyline points="{pts}" fill="none" '
+        f'stroke="{stroke}" stroke-width="1.5" stroke-linejoin="round"/></svg>'
+    )
+
+
+def cached_sparkline(key: Hashable, closes_fn: Callable[[], Tuple[List[float], bool]],
+                     width: int = 140, height: int = 28) -> str:
+    """SVG do cache; closes_fn() -> (closes, completa?) só é chamado (e o SVG montado)
+    quando a chave é nova. Só a janela completa fica no cache."""
+    svg = _cache.get(key)
+    if svg is not None:
+        _cache.move_to_end(key)
+        return svg
+    closes, complete = closes_fn()
+    svg = sparkline_svg(closes, width, height)
+    if not complete:
+        return svg
+    _cache[key] = svg
+    if len(_cache) > SPARK_CACHE_MAX:
+        _cache.popitem(last=False)
+    return svg
@@ -0,0 +1,239 @@
+# symbol_universe.py
+# Universo de símbolos negociáveis da Binance, persistido em disco, e normalização dos
+# tickers que chegam estropiados nos arquivos de sinais.
+#
+# - data/symbol_universe.json guarda (symbol, base, quote) dos pares TRADING e a hora do
+#   download: o processo que sobe lê o arquivo e não refaz o exchangeInfo (peso 20)
+#   enquanto ele tiver menos de UNIVERSE_TTL_S; símbolo desconhecido força no máximo um
+#   refresh por UNKNOWN_REFRESH_S (listagem nova)
+# - índice pré-calculado quote -> bases, para separar base/quote e casar por sufixo:
+#     CARDANOADAUSDT -> ADAUSDT, POLKADOTDOTUSDT -> DOTUSDT, "Litecoin (LTC)USDT" -> LTCUSDT
+# - tickers renomeados na exchange (ALIASES): MATIC -> POL, RNDR -> RENDER, FTM -> S
+# - casamento por sufixo e alias é palpite: só vale se o entry do sinal estiver a menos de
+#   PRICE_RATIO_MAX do preço atual do candidato (senão o sinal seria avaliado nos preços de
+#   outra moeda). Prefixo com dígito (1000SHIB) ou de wrapper/índice (WBTC, STETH, BTCDOM)
+#   nem chega a ser palpite. Sem preço para conferir: fica E_SYMBOL
+# - cada texto é resolvido uma vez (memo em memória); resolver no ingest tira o símbolo
+#   ruim do watchlist antes de ele virar E_SYMBOL em todo ciclo
+import os
+import re
+import json
+import time
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+UNIVERSE_PATH = os.path.join(APP_DIR, "data", "symbol_universe.json")
+
+UNIVERSE_TTL_S = 24 * 3600
+UNKNOWN_REFRESH_S = 3600
+MIN_SUFFIX = 2   # base casada por sufixo precisa de pelo menos 2 letras
+PRICE_RATIO_MAX = 4.0   # entry/preço do candidato (e o inverso) aceito num palpite
+PRICE_TTL_S = 600
+
+# prefixos que fazem de XYZ outro ativo (wrapped/staked) e sufixos de índices/tokens
+# alavancados: não casam por sufixo com a base que sobra
+WRAPPER_PREFIXES = {"W", "ST", "WST", "CB", "R", "RE"}
+INDEX_SUFFIXES = ("DOM", "BULL", "BEAR")
+
+# ticker antigo -> ticker atual na Binance
+ALIASES = {
+    "MATIC": "POL",
+    "RNDR": "RENDER",
+    "FTM": "S",
+}
+
+_PAREN_RE = re.compile(r"\(([^)]*)\)")
+_NON_ALNUM = re.compile(r"[^A-Z0-9]")
+
+# fetch() -> [(symbol, base, quote)] dos pares TRADING (market.get_exchange_universe)
+UniverseFetcher = Callable[[], List[Tuple[str, str, str]]]
+# price(symbol) -> preço atual (market.get_price)
+PriceFetcher = Callable[[str], Optional[float]]
+
+
+class SymbolUniverse:
+    def __init__(self, path: str = UNIVERSE_PATH, fetch: Optional[UniverseFetcher] = None,
+                 price: Optional[PriceFetcher] = None):
+        self.path = path
+        self.fetch = fetch
+        self.price = price
+        self.fetched_at = 0.0
+        self.symbols: Set[str] = set()
+        self._bases: Dict[str, Set[str]] = {}
+        self._quotes: List[str] = []
+        self._memo: Dict[str, Tuple[Optional[str], bool]] = {}   # texto -> (símbolo, palpite?)
+        self._prices: Dict[str, Tuple[float, Optional[float]]] = {}   # símbolo -> (hora, preço)
+        self._lock = threading.Lock()
+        self._load()
+
+    # ----- persistência -----
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._build([tuple(r) for r in data["symbols"]], float(data["fetched_at"]))
+        except Exception:
+            pass
+
+    def _save(self, rows: List[Tuple[str, str, str]], fetched_at: float) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": fetched_at, "symbols": rows}, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _build(self, rows: List[Tuple[str, str, str]], fetched_at: float) -> None:
+        bases: Dict[str, Set[str]] = {}
+        for _, base, quote in rows:
+            bases.setdefault(quote, set()).add(base)
+        self.symbols = {r[0] for r in rows}
+        self._bases = bases
+        self._quotes = sorted(bases, key=len, reverse=True)   # FDUSD antes de USD
+        self.fetched_at = fetched_at
+        self._memo = {}
+
+    def age_s(self) -> float:
+        return time.time() - self.fetched_at if self.fetched_at else float("inf")
+
+    def refresh(self) -> Set[str]:
+        rows = [(s.upper(), b.upper(), q.upper()) for s, b, q in self.fetch()]
+        now = time.time()
+        with self._lock:
+            self._save(rows, now)
+            self._build(rows, now)
+        return self.symbols
+
+    def ensure_fresh(self, ttl_s: float = UNIVERSE_TTL_S) -> Set[str]:
+        """Símbolos TRADING; só vai à rede se o arquivo passou do TTL (ou não existe).
+        Falha de rede com universo antigo em mãos: segue com o antigo."""
+        if self.symbols and self.age_s() < ttl_s:
+            return self.symbols
+        try:
+            return self.refresh()
+        except Exception:
+            if self.symbols:
+                return self.symbols
+            raise
+
+    # ----- normalização -----
+    def _with_base(self, base: str, quote: str) -> Tuple[Optional[str], bool]:
+        """(símbolo, veio de alias?)"""
+        bases = self._bases.get(quote, ())
+        if base in bases:
+            return base + quote, False
+        alias = ALIASES.get(base)
+        return (alias + quote, True) if alias in bases else (None, False)
+
+    def _match(self, text: str, suffix: bool) -> Tuple[Optional[str], bool]:
+        """(símbolo, palpite?) — palpite = casou por alias ou por sufixo."""
+        s = _NON_ALNUM.sub("", text)
+        if s in self.symbols:
+            return s, False
+        for quote in self._quotes:
+            if not s.endswith(quote) or len(s) == len(quote):
+                continue
+            base = s[:-len(quote)]
+            hit, alias = self._with_base(base, quote)
+            if hit:
+                return hit, alias
+            if not suffix or base.endswith(INDEX_SUFFIXES):
+                continue
+            # nome + ticker colados (CARDANOADA, POLKADOTDOT): o sufixo mais longo que é base
+            for n in range(len(base) - 1, MIN_SUFFIX - 1, -1):
+                head = base[:-n]
+                if head in WRAPPER_PREFIXES or any(c.isdigit() for c in head):
+                    break   # 1000SHIB, WBTC, STETH: outro ativo, não "nome + ticker"
+                hit, _ = self._with_base(base[-n:], quote)
+                if hit:
+                    return hit, True
+        return None, False
+
+    def _resolve(self, raw: str) -> Tuple[Optional[str], bool]:
+        s = raw.upper().strip()
+        m = _PAREN_RE.search(s)
+        if m is None:
+            return self._match(s, suffix=" " not in s)
+        # "Litecoin (LTC)USDT", "ICP (Internet Computer)USDT": ticker entre parênteses ou
+        # uma das palavras de fora, com a quote que vem depois; sem casar por sufixo
+        quote = s[m.end():]
+        for cand in [m.group(1)] + s[:m.start()].split():
+            hit, guess = self._match(cand + quote, suffix=False)
+            if hit:
+                return hit, guess
+        return None, False
+
+    def _price_of(self, symbol: str) -> Optional[float]:
+        now = time.time()
+        with self._lock:
+            cached = self._prices.get(symbol)
+        if cached is not None and now - cached[0] < PRICE_TTL_S:
+            return cached[1]
+        try:
+            px = self.price(symbol)
+        except Exception:
+            return None   # rede fora: não memoriza, confere de novo na próxima
+        with self._lock:
+            self._prices[symbol] = (now, px)
+        return px
+
+    def _price_ok(self, symbol: str, entry) -> bool:
+        try:
+            entry = float(entry)
+        except (TypeError, ValueError):
+            return False
+        if self.price is None or not entry > 0:
+            return False
+        px = self._price_of(symbol)
+        return bool(px) and px > 0 and 1 / PRICE_RATIO_MAX <= entry / px <= PRICE_RATIO_MAX
+
+    def resolve(self, raw: str, allow_refresh: bool = False, entry=None) -> Optional[str]:
+        """
+        Símbolo negociável para o texto do sinal (None = não reconhecido). Match por alias
+        ou sufixo só sai se `entry` bater com o preço atual do candidato.
+        """
+        key = (raw or "").strip()
+        if not key:
+            return None
+        with self._lock:
+            if key in self._memo:
+                hit, guess = self._memo[key]
+            else:
+                hit, guess = self._memo[key] = self._resolve(key)
+        if hit is None and allow_refresh and self.fetch is not None and self.age_s() >= UNKNOWN_REFRESH_S:
+            try:
+                self.refresh()
+            except Exception:
+                return None
+            return self.resolve(raw, entry=entry)
+        if guess and not self._price_ok(hit, entry):
+            return None
+        return hit
+
+    def normalize_signals(self, signals: Iterable[dict]) -> List[dict]:
+        """Troca o symbol pelo resolvido (o texto original fica em symbol_original)."""
+        out = []
+        for s in signals:
+            raw = s.get("symbol") or ""
+            hit = self.resolve(raw, entry=s.get("entry")) if self.symbols else None
+            if hit and hit != raw.upper():
+                s = {**s, "symbol": hit, "symbol_original": s.get("symbol_original", raw)}
+            out.append(s)
+        return out
+
+
+# um universo por caminho, compartilhado pelo processo
+_universes: Dict[str, SymbolUniverse] = {}
+_universes_guard = threading.Lock()
+
+
+def get_universe(fetch: Optional[UniverseFetcher] = None, path: str = UNIVERSE_PATH,
+                 price: Optional[PriceFetcher] = None) -> SymbolUniverse:
+    with _universes_guard:
+        u = _universes.get(path)
+        if u is None:
+            u = _universes[path] = SymbolUniverse(path, fetch, price)
+        else:
+            u.fetch = u.fetch or fetch
+            u.price = u.price or price
+        return u
@@ -0,0 +1,254 @@
+# utils/audit_parquet.py
+# Exporta a trilha de auditoria (audits/AAAA-MM-DD/*.jsonl[.gz]) para Parquet colunar,
+# uma partição por dia, para análise offline sem json.loads linha a linha.
+#
+# - registros achatados em colunas tipadas (signal_*, val_*, market_*, verdict_*, lat_*)
+# - símbolo, side, fontes, versões e códigos de erro com dictionary encoding
+# - saída no layout hive: exports/audits_parquet/kind=audits/day=2025-08-09/part-0.parquet
+# - incremental: dia já exportado e sem mudança na partição de origem é pulado; o dia
+#   corrente só entra com --include-today (ainda está sendo escrito)
+#
+# Requer pyarrow (opcional, só para esta ferramenta): pip install pyarrow
+#
+# Exemplos:
+#   python utils/audit_parquet.py
+#   python utils/audit_parquet.py --kind fails --since 2025-08-01 --force
+#   # na análise:
+#   from utils.audit_parquet import load_audits
+#   df = load_audits(columns=["ts", "signal_symbol", "val_errors"], since="2025-08-01")
+import os, re, sys, argparse
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR  = os.path.dirname(UTILS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from audits_utils import (  # noqa: E402
+    AUDIT_DIRNAME, AUDITS_FILENAME, FAILURES_FILENAME, iter_audits, flush_audits, migrate_flat_audits,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:   # dependência opcional
+    pa = None
+    pq = None
+
+OUT_DIR = os.path.join(ROOT_DIR, "exports", "audits_parquet")
+PART_NAME = "part-0.parquet"
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("pyarrow não instalado: pip install pyarrow")
+
+
+# =========================
+# Achatamento
+# =========================
+def _num(x) -> Optional[float]:
+    try:
+        v = float(x)
+        return v if v == v else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(x) -> Optional[int]:
+    try:
+        return int(x)
+    except (TypeError, ValueError):
+        return None
+
+
+def _dt(x, fmt: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(x, fmt).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bool(x) -> Optional[bool]:
+    return x if isinstance(x, bool) else None
+
+
+def _str(x) -> Optional[str]:
+    return None if x is None else str(x)
+
+
+ISO = "%Y-%m-%dT%H:%M:%SZ"
+SIG = "%Y-%m-%d %H:%M:%S"
+
+# coluna -> (tipo arrow, extrator)
+def _columns():
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    ts = pa.timestamp("s", tz="UTC")
+    return {
+        "ts":                    (ts,         lambda r: _dt(r.get("ts"), ISO)),
+        "app_version":           (dict_str,   lambda r: _str(r.get("app_version"))),
+        "model_version":         (dict_str,   lambda r: _str(r.get("model_version"))),
+        "prompt_id":             (dict_str,   lambda r: _str(r.get("prompt_id"))),
+        "source_type":           (dict_str,   lambda r: _str((r.get("source") or {}).get("type"))),
+        "source_origin_id":      (dict_str,   lambda r: _str((r.get("source") or {}).get("origin_id"))),
+        "signal_symbol":         (dict_str,   lambda r: _str((r.get("signal") or {}).get("symbol"))),
+        "signal_side":           (dict_str,   lambda r: _str((r.get("signal") or {}).get("side"))),
+        "signal_entry":          (pa.float64(), lambda r: _num((r.get("signal") or {}).get("entry"))),
+        "signal_target":         (pa.float64(), lambda r: _num((r.get("signal") or {}).get("target"))),
+        "signal_stop_loss":      (pa.float64(), lambda r: _num((r.get("signal") or {}).get("stop_loss"))),
+        "signal_entrada":        (ts,         lambda r: _dt((r.get("signal") or {}).get("entrada_datahora"), SIG)),
+        "signal_saida":          (ts,         lambda r: _dt((r.get("signal") or {}).get("saida_datahora"), SIG)),
+        "val_symbol_exists":     (pa.bool_(), lambda r: _bool((r.get("validation") or {}).get("symbol_exists"))),
+        "val_numeric_ok":        (pa.bool_(), lambda r: _bool((r.get("validation") or {}).get("numeric_ok"))),
+        "val_date_ok":           (pa.bool_(), lambda r: _bool((r.get("validation") or {}).get("date_ok"))),
+        "val_rule_ok":           (pa.bool_(), lambda r: _bool((r.get("validation") or {}).get("rule_ok"))),
+        "market_price_source":   (dict_str,   lambda r: _str((r.get("market") or {}).get("price_source"))),
+        "market_live_price":     (pa.float64(), lambda r: _num((r.get("market") or {}).get("live_price"))),
+        "market_pnl_pct_live":   (pa.float64(), lambda r: _num((r.get("market") or {}).get("pnl_pct_live"))),
+        "verdict_state":         (dict_str,   lambda r: _str((r.get("verdict") or {}).get("state"))),
+        "verdict_result":        (dict_str,   lambda r: _str((r.get("verdict") or {}).get("result"))),
+        "verdict_price_exit":    (pa.float64(), lambda r: _num((r.get("verdict") or {}).get("price_exit"))),
+        "verdict_pnl_pct_final": (pa.float64(), lambda r: _num((r.get("verdict") or {}).get("pnl_pct_final"))),
+        "lat_batch_prices_ms":   (pa.int32(), lambda r: _int((r.get("latency_ms") or {}).get("batch_prices"))),
+        "lat_klines_ms":         (pa.int32(), lambda r: _int((r.get("latency_ms") or {}).get("klines"))),
+        "fingerprint":           (pa.string(), lambda r: _str(r.get("fingerprint"))),
+        "first_seen":            (ts,         lambda r: _dt(r.get("first_seen"), ISO)),
+        "last_seen":             (ts,         lambda r: _dt(r.get("last_seen"), ISO)),
+        "count":                 (pa.int32(), lambda r: _int(r.get("count"))),
+        "count_delta":           (pa.int32(), lambda r: _int(r.get("count_delta"))),
+    }
+
+
+def records_to_table(records: Iterable[Dict[str, Any]]) -> "pa.Table":
+    """Achata registros de auditoria numa tabela Arrow tipada (val_errors: lista de códigos)."""
+    _require_pyarrow()
+    cols = _columns()
+    data: Dict[str, List[Any]] = {name: [] for name in cols}
+    offsets, codes = [0], []
+    for r in records:
+        if not isinstance(r, dict):
+            continue
+        for name, (_, fn) in cols.items():
+            data[name].append(fn(r))
+        errs = (r.get("validation") or {}).get("errors") or []
+        codes.extend(str(e) for e in errs)
+        offsets.append(len(codes))
+
+    arrays, fields = [], []
+    for name, (typ, _) in cols.items():
+        if pa.types.is_dictionary(typ):
+            arr = pa.array(data[name], type=pa.string()).dictionary_encode()
+        else:
+            arr = pa.array(data[name], type=typ)
+        arrays.append(arr)
+        fields.append(pa.field(name, arr.type))
+    errors = pa.ListArray.from_arrays(
+        pa.array(offsets, type=pa.int32()), pa.array(codes, type=pa.string()).dictionary_encode())
+    arrays.append(errors)
+    fields.append(pa.field("val_errors", errors.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+# =========================
+# Export por dia
+# =========================
+DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def _days(audit_dir: str) -> List[str]:
+    try:
+        return sorted(n for n in os.listdir(audit_dir) if DAY_RE.match(n))
+    except FileNotFoundError:
+        return []
+
+
+def _source_mtime(audit_dir: str, day: str, kind: str) -> float:
+    base = (AUDITS_FILENAME if kind == "audits" else FAILURES_FILENAME)[:-len(".jsonl")]
+    pdir = os.path.join(audit_dir, day)
+    return max((os.path.getmtime(os.path.join(pdir, n)) for n in os.listdir(pdir)
+                if n.startswith(base + ".")), default=0.0)
+
+
+def export_day(app_dir: str, day: str, kind: str = "audits", out_dir: str = OUT_DIR,
+               force: bool = False) -> Optional[int]:
+    """Grava a partição do dia; retorna nº de linhas, ou None se já estava em dia."""
+    _require_pyarrow()
+    dst_dir = os.path.join(out_dir, f"kind={kind}", f"day={day}")
+    dst = os.path.join(dst_dir, PART_NAME)
+    src_mtime = _source_mtime(os.path.join(app_dir, AUDIT_DIRNAME), day, kind)
+    if not src_mtime:
+        return None
+    if not force and os.path.isfile(dst) and os.path.getmtime(dst) >= src_mtime:
+        return None
+    table = records_to_table(iter_audits(app_dir, kind, since_day=day, until_day=day))
+    os.makedirs(dst_dir, exist_ok=True)
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp, compression="zstd", use_dictionary=True)
+    os.replace(tmp, dst)
+    return table.num_rows
+
+
+def export_all(app_dir: str = ROOT_DIR, kind: str = "audits", out_dir: str = OUT_DIR,
+               since: Optional[str] = None, until: Optional[str] = None,
+               include_today: bool = False, force: bool = False) -> Dict[str, int]:
+    audit_dir = os.path.join(app_dir, AUDIT_DIRNAME)
+    migrate_flat_audits(audit_dir)
+    flush_audits()
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    done: Dict[str, int] = {}
+    for day in _days(audit_dir):
+        if (since and day < since) or (until and day > until):
+            continue
+        if day >= today and not include_today:
+            continue
+        n = export_day(app_dir, day, kind, out_dir, force)
+        if n is not None:
+            done[day] = n
+    return done
+
+
+# =========================
+# Leitura (análise offline)
+# =========================
+def load_audits(columns: Optional[List[str]] = None, kind: str = "audits", out_dir: str = OUT_DIR,
+                since: Optional[str] = None, until: Optional[str] = None):
+    """DataFrame com as colunas pedidas; só os arquivos dos dias em [since, until] são lidos."""
+    _require_pyarrow()
+    import pandas as pd
+    base = os.path.join(out_dir, f"kind={kind}")
+    try:
+        days = sorted(n[4:] for n in os.listdir(base) if n.startswith("day="))
+    except FileNotFoundError:
+        days = []
+    tables = []
+    for day in days:
+        if (since and day < since) or (until and day > until):
+            continue
+        t = pq.read_table(os.path.join(base, f"day={day}", PART_NAME), columns=columns)
+        tables.append(t.append_column("day", pa.array([day] * t.num_rows, type=pa.string())))
+    if not tables:
+        return pd.DataFrame(columns=(columns or []) + ["day"])
+    return pa.concat_tables(tables).to_pandas()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta audits/ para Parquet particionado por dia.")
+    ap.add_argument("--kind", choices=["audits", "fails"], default="audits")
+    ap.add_argument("--out", default=OUT_DIR)
+    ap.add_argument("--since", help="primeiro dia (YYYY-MM-DD)")
+    ap.add_argument("--until", help="último dia (YYYY-MM-DD)")
+    ap.add_argument("--include-today", action="store_true", help="exporta também o dia corrente (parcial)")
+    ap.add_argument("--force", action="store_true", help="reescreve dias já exportados")
+    args = ap.parse_args()
+
+    if pa is None:
+        print("pyarrow não instalado. Instale com: pip install pyarrow")
+        sys.exit(1)
+    done = export_all(ROOT_DIR, args.kind, args.out, args.since, args.until, args.include_today, args.force)
+    for day, n in done.items():
+        print(f"{day}: {n} registros")
+    print(f"{len(done)} dia(s) exportado(s) em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
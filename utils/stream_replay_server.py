@@ -0,0 +1,157 @@
+# utils/stream_replay_server.py
+# Servidor WebSocket local que imita os combined streams da Binance
+# (/stream?streams=btcusdt@kline_1m/btcusdt@miniTicker), para testar o modo streaming offline.
+#
+# Fontes de dados:
+#   --file gravacao.jsonl      mensagens gravadas ({"stream":..,"data":..} por linha;
+#                              LUCRA_STREAM_RECORD=arquivo.jsonl no app grava nesse formato)
+#   --from-store BTCUSDT,...   sintetiza kline_1m + miniTicker a partir do store local (data/klines)
+#
+# Exemplos:
+#   python utils/stream_replay_server.py --file gravacao.jsonl --speed 20 --loop
+#   python utils/stream_replay_server.py --from-store BTCUSDT,ETHUSDT --start "2025-08-09 00:00:00" --minutes 180 --speed 60
+#   LUCRA_STREAM_URL=ws://127.0.0.1:9443 streamlit run app_live.py
+import os, sys, json, time, argparse, socketserver
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR  = os.path.dirname(UTILS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from market_stream import ws_accept_key, ws_send_frame, OP_TEXT, OP_CLOSE  # noqa: E402
+from kline_store import read_stored  # noqa: E402
+
+
+def load_recording(path):
+    msgs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                m = json.loads(line)
+            except Exception:
+                continue
+            if "stream" in m and "data" in m:
+                msgs.append(m)
+    msgs.sort(key=lambda m: m["data"].get("E", 0))
+    return msgs
+
+
+def synth_from_store(symbols, start_ms, end_ms):
+    """4 ticks por candle fechado: abertura, extremo 1, extremo 2 e fechamento (x=true)."""
+    msgs = []
+    for sym in symbols:
+        df = read_stored(sym, start_ms, end_ms, "1m")
+        low_s = sym.lower()
+        for r in df.itertuples(index=False):
+            o, h, l, c = r.open, r.high, r.low, r.close
+            path = [o, l, h, c] if c >= o else [o, h, l, c]
+            hi = lo = o
+            for j, px in enumerate(path):
+                hi, lo = max(hi, px), min(lo, px)
+                ev_t = int(r.open_time) + (59_999 if j == 3 else j * 15_000)
+                k = {"t": int(r.open_time), "T": int(r.close_time), "s": sym, "i": "1m",
+                     "o": str(o), "h": str(hi), "l": str(lo), "c": str(px), "v": "0", "x": j == 3}
+                msgs.append({"stream": f"{low_s}@kline_1m", "data": {"e": "kline", "E": ev_t, "s": sym, "k": k}})
+                msgs.append({"stream": f"{low_s}@miniTicker",
+                             "data": {"e": "24hrMiniTicker", "E": ev_t, "s": sym, "c": str(px)}})
+    msgs.sort(key=lambda m: m["data"]["E"])
+    return msgs
+
+
+class ReplayHandler(socketserver.BaseRequestHandler):
+    messages = []
+    speed = 1.0
+    loop = False
+
+    def handle(self):
+        sock = self.request
+        buf = b""
+        while b"\r\n\r\n" not in buf:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            buf += chunk
+        lines = buf.split(b"\r\n\r\n", 1)[0].decode("latin-1").split("\r\n")
+        path = lines[0].split(" ")[1] if len(lines[0].split(" ")) > 1 else "/"
+        hdrs = {k.strip().lower(): v.strip() for k, v in (ln.split(":", 1) for ln in lines[1:] if ":" in ln)}
+        key = hdrs.get("sec-websocket-key")
+        if not key:
+            sock.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+        sock.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {ws_accept_key(key)}\r\n\r\n"
+        ).encode())
+
+        u = urlparse(path)
+        wanted = set()
+        for v in parse_qs(u.query).get("streams", []):
+            wanted |= {x.lower() for x in v.split("/") if x}
+        if u.path.startswith("/ws/"):
+            wanted.add(u.path[4:].lower())
+        msgs = [m for m in self.messages if not wanted or m["stream"].lower() in wanted]
+        print(f"[replay] cliente {self.client_address[0]} — {len(wanted)} streams, {len(msgs)} mensagens")
+        try:
+            while True:
+                prev_e = None
+                for m in msgs:
+                    e = m["data"].get("E")
+                    if prev_e is not None and e is not None and e > prev_e:
+                        time.sleep(min((e - prev_e) / 1000 / self.speed, 5.0))
+                    prev_e = e
+                    ws_send_frame(sock, OP_TEXT, json.dumps(m, separators=(",", ":")).encode(), mask=False)
+                if not self.loop:
+                    break
+            ws_send_frame(sock, OP_CLOSE, b"", mask=False)
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+
+
+class ReplayServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay local de streams kline/miniTicker (formato Binance).")
+    ap.add_argument("--file", help="gravação JSONL de mensagens combined stream")
+    ap.add_argument("--from-store", help="símbolos separados por vírgula, lidos de data/klines")
+    ap.add_argument("--start", help="início (UTC, YYYY-MM-DD HH:MM:SS) para --from-store")
+    ap.add_argument("--minutes", type=int, default=60, help="duração para --from-store")
+    ap.add_argument("--speed", type=float, default=1.0, help="fator de aceleração do replay")
+    ap.add_argument("--loop", action="store_true", help="repetir a gravação indefinidamente")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9443)
+    args = ap.parse_args()
+
+    if args.file:
+        msgs = load_recording(args.file)
+    elif args.from_store:
+        if not args.start:
+            ap.error("--from-store exige --start")
+        start = datetime.strptime(args.start, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        start_ms = int(start.timestamp() * 1000)
+        syms = [s.strip().upper() for s in args.from_store.split(",") if s.strip()]
+        msgs = synth_from_store(syms, start_ms, start_ms + args.minutes * 60_000)
+    else:
+        ap.error("informe --file ou --from-store")
+        return
+
+    if not msgs:
+        print("[replay] Nenhuma mensagem para reproduzir.")
+        return
+    ReplayHandler.messages, ReplayHandler.speed, ReplayHandler.loop = msgs, args.speed, args.loop
+    with ReplayServer((args.host, args.port), ReplayHandler) as srv:
+        print(f"[replay] {len(msgs)} mensagens em ws://{args.host}:{args.port}/stream (Ctrl+C para sair)")
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# watch_store.py
+# Watchlist em SQLite (data/watchlist.db) no lugar de reescrever o watchlist.json inteiro.
+#
+# - índice único em (symbol, entrada_datahora, saida_datahora): dedupe no próprio INSERT
+# - status por sinal (ATIVO / FINALIZADO / INVALIDO_REMOVIDO) em vez de apagar a linha
+# - WAL + transações: a página, o avaliador e o app de auditoria escrevem sem se atropelar
+# - na primeira abertura, importa o watchlist.json antigo uma única vez (marcado em meta)
+# - active_records(): sinais ativos compilados uma vez por linha e guardados por id; o ciclo
+#   do avaliador não relê payload nem refaz json.loads/validação dos que já conhece
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(APP_DIR, "data", "watchlist.db")
+LEGACY_JSON_PATH = os.path.join(APP_DIR, "watchlist.json")
+
+STATUS_ATIVO = "ATIVO"
+STATUS_FINALIZADO = "FINALIZADO"
+STATUS_REMOVIDO = "INVALIDO_REMOVIDO"
+
+REQUIRED_FIELDS = {"symbol", "side", "entry", "target", "stop_loss", "entrada_datahora", "saida_datahora"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol           TEXT NOT NULL,
+    entrada_datahora TEXT NOT NULL,
+    saida_datahora   TEXT NOT NULL,
+    side             TEXT,
+    status           TEXT NOT NULL DEFAULT 'ATIVO',
+    payload          TEXT NOT NULL,
+    added_at         TEXT NOT NULL,
+    closed_at        TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_watchlist_key ON watchlist(symbol, entrada_datahora, saida_datahora);
+CREATE INDEX IF NOT EXISTS ix_watchlist_status ON watchlist(status, id);
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+"""
+
+Key = Tuple[str, str, str]
+
+
+def signal_tuple(s: dict) -> Key:
+    return ((s.get("symbol") or "").upper(), str(s.get("entrada_datahora")), str(s.get("saida_datahora")))
+
+
+class WatchStore:
+    def __init__(self, path: str = DB_PATH, legacy_json: Optional[str] = LEGACY_JSON_PATH):
+        self.path = path
+        self.legacy_json = legacy_json
+        self._local = threading.local()   # sqlite3: uma conexão por thread
+        self._compiled: Dict[int, Tuple[str, Any]] = {}   # id -> (symbol, sinal compilado)
+        self._compiled_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._init()
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _write(self, fn):
+        """Roda fn(con) numa transação de escrita (BEGIN IMMEDIATE: um escritor por vez)."""
+        con = self._conn()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            out = fn(con)
+            con.execute("COMMIT")
+            return out
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    def _init(self) -> None:
+        self._conn().executescript(SCHEMA)
+        if not self.legacy_json or not os.path.isfile(self.legacy_json):
+            return
+        if self._conn().execute("SELECT 1 FROM meta WHERE k = 'legacy_json_imported'").fetchone():
+            return
+        try:
+            with open(self.legacy_json, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception:
+            return
+        if not isinstance(legacy, list):
+            return
+
+        def _migrate(con):
+            if con.execute("SELECT 1 FROM meta WHERE k = 'legacy_json_imported'").fetchone():
+                return   # já migrado (por este ou outro processo)
+            self._insert(con, legacy)
+            con.execute("INSERT INTO meta (k, v) VALUES ('legacy_json_imported', ?)",
+                        (datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),))
+
+        self._write(_migrate)
+
+    @staticmethod
+    def _insert(con: sqlite3.Connection, signals: Iterable[dict]) -> int:
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for s in signals:
+            if not isinstance(s, dict) or not REQUIRED_FIELDS.issubset(s.keys()):
+                continue
+            s = {**s, "symbol": (s["symbol"] or "").upper()}
+            sym, ent, sai = signal_tuple(s)
+            rows.append((sym, ent, sai, (s.get("side") or "").upper(), json.dumps(s, ensure_ascii=False), now))
+        before = con.total_changes
+        con.executemany(
+            "INSERT OR IGNORE INTO watchlist (symbol, entrada_datahora, saida_datahora, side, payload, added_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return con.total_changes - before
+
+    # ----- leitura -----
+    def active(self) -> List[dict]:
+        cur = self._conn().execute(
+            "SELECT payload FROM watchlist WHERE status = ? ORDER BY id", (STATUS_ATIVO,))
+        return [json.loads(p) for (p,) in cur]
+
+    def active_records(self, compile_fn: Callable[[dict], Any]) -> List[Any]:
+        """
+        Sinais ATIVOS já compilados por compile_fn (ex.: evaluator.compile_signal). Cada linha
+        é compilada uma vez por processo — quando aparece ou quando o símbolo é corrigido —;
+        nos ciclos seguintes só os ids/símbolos saem do SQLite, sem payload nem json.loads.
+        """
+        rows = self._conn().execute(
+            "SELECT id, symbol FROM watchlist WHERE status = ? ORDER BY id", (STATUS_ATIVO,)).fetchall()
+        with self._compiled_lock:
+            cache = self._compiled
+            new = [rid for rid, sym in rows if cache.get(rid, (None,))[0] != sym]
+            for i in range(0, len(new), 500):
+                ids = new[i:i + 500]
+                cur = self._conn().execute(
+                    f"SELECT id, symbol, payload FROM watchlist WHERE id IN ({','.join('?' * len(ids))})", ids)
+                for rid, sym, payload in cur:
+                    cache[rid] = (sym, compile_fn(json.loads(payload)))
+            if len(cache) > len(rows):
+                live = {rid for rid, _ in rows}
+                for rid in [k for k in cache if k not in live]:
+                    del cache[rid]
+            return [cache[rid][1] for rid, _ in rows if rid in cache]
+
+    def count(self, status: str = STATUS_ATIVO) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM watchlist WHERE status = ?", (status,)).fetchone()[0]
+
+    def status_of(self, key: Key) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT status FROM watchlist WHERE symbol = ? AND entrada_datahora = ? AND saida_datahora = ?",
+            key).fetchone()
+        return row[0] if row else None
+
+    # ----- escrita -----
+    def add_signals(self, signals: Iterable[dict]) -> int:
+        """Insere os sinais novos (símbolo em maiúsculas); duplicados são ignorados. Retorna quantos entraram."""
+        signals = list(signals)
+        return self._write(lambda con: self._insert(con, signals))
+
+    def close(self, keys: Iterable[Key], status: str = STATUS_FINALIZADO) -> int:
+        """Tira sinais ATIVOS do watchlist marcando o status final."""
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        params = [(status, now, k[0].upper(), k[1], k[2], STATUS_ATIVO) for k in keys]
+
+        def _close(con):
+            before = con.total_changes
+            con.executemany(
+                "UPDATE watchlist SET status = ?, closed_at = ? "
+                "WHERE symbol = ? AND entrada_datahora = ? AND saida_datahora = ? AND status = ?", params)
+            return con.total_changes - before
+        return self._write(_close)
+
+    def rename_symbols(self, mapping: Dict[str, str]) -> int:
+        """
+        Corrige o símbolo dos sinais ATIVOS (ex.: CARDANOADAUSDT -> ADAUSDT); o texto antigo
+        fica em symbol_original no payload. Se o sinal corrigido já está no watchlist, o
+        duplicado sai como removido. Retorna quantos sinais mudaram.
+        """
+        mapping = {k.upper(): v.upper() for k, v in mapping.items() if k.upper() != v.upper()}
+        if not mapping:
+            return 0
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+        def _rename(con):
+            marks = ",".join("?" * len(mapping))
+            rows = con.execute(
+                f"SELECT id, symbol, payload FROM watchlist WHERE status = ? AND symbol IN ({marks})",
+                (STATUS_ATIVO, *mapping)).fetchall()
+            changed = 0
+            for rid, sym, payload in rows:
+                s = json.loads(payload)
+                s = {**s, "symbol": mapping[sym], "symbol_original": s.get("symbol_original", s.get("symbol"))}
+                cur = con.execute("UPDATE OR IGNORE watchlist SET symbol = ?, payload = ? WHERE id = ?",
+                                  (mapping[sym], json.dumps(s, ensure_ascii=False), rid))
+                if cur.rowcount:
+                    changed += 1
+                else:
+                    con.execute("UPDATE watchlist SET status = ?, closed_at = ? WHERE id = ?",
+                                (STATUS_REMOVIDO, now, rid))
+            return changed
+        return self._write(_rename)
+
+    def clear_active(self) -> int:
+        """Limpar Watchlist: apaga os ativos (podem ser adicionados de novo)."""
+        return self._write(lambda con: con.execute("DELETE FROM watchlist WHERE status = ?", (STATUS_ATIVO,)).rowcount)
+
+
+# um store por caminho, compartilhado pelo processo
+_stores: Dict[str, WatchStore] = {}
+_stores_guard = threading.Lock()
+
+
+def get_store(path: str = DB_PATH) -> WatchStore:
+    with _stores_guard:
+        st = _stores.get(path)
+        if st is None:
+            st = _stores[path] = WatchStore(path)
+        return st